@@ -0,0 +1,196 @@
+# __author__ = 'dimitrios'
+"""A compact corpus of the valid comments, so the stages after the valid users (json2matrix, json2vocab, json2text)
+do not scan the full .json dumps again for the small fraction of the comments they keep.
+
+Once the valid users and subreddits are known, compact_corpus decodes every dump once and keeps only the accepted
+comments (see preprocessing.entry_filter), projected to the fields that the later stages use. Every dump becomes a
+directory with the name of the dump (so get_file_month and the drop lists of preprocessing.dedup still work) and one
+.npy column per field:
+
+    line.npy         int32, line number (from 1) of the comment in the dump
+    author.npy       int32, user id: index in users.npy of the corpus (the ids of set_to_dict, the UxS rows)
+    subreddit.npy    int32, subreddit id: index in subreddits.npy of the corpus
+    created_utc.npy  int64
+    first_level.npy  bool, see is_first_level
+    offsets.npy      int64, the body of comment i is bodies.bin[offsets[i]:offsets[i + 1]] (utf-8)
+
+The directory is written under a temporary name and renamed at the end, so a compact file is always complete. The
+later stages read a compact file with iter_entries, exactly like a dump: pass the compact files instead of the .json
+files.
+"""
+import os
+import shutil
+import sys
+import time
+import multiprocessing as mp
+from array import array
+
+from preprocessing.config_filenames import n_proc
+from util.preprocessing_util import set_to_dict, is_first_level
+from util.io import save_array, BulkWriter, make_dir
+from util.shared import publish, unpublish, get_shared
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+columns = ('line', 'author', 'subreddit', 'created_utc', 'first_level', 'offsets')
+_types = {'line': ('int32', 'i'), 'author': ('int32', 'i'), 'subreddit': ('int32', 'i'),
+          'created_utc': ('int64', 'l'), 'first_level': ('bool', 'b'), 'offsets': ('int64', 'l')}  # numpy, array
+_names = {}  # compact_dir -> (signature of users.npy, users, subreddits), shared by the files of a corpus
+
+
+def compact_corpus(filenames, compact_dir, valid_users, valid_subreddits, entry_filter, overwrite=False):
+    """Writes the accepted comments of the .json files to a compact corpus.
+
+    Args:
+        filenames: list of paths of the .json files.
+        compact_dir: directory of the compact corpus.
+        valid_users: set of the users to keep.
+        valid_subreddits: set of the subreddits to keep.
+        entry_filter: EntryFilter of the comments to keep, usually get_entry_filter(params, valid_users,
+            valid_subreddits). It should only accept valid users and subreddits, they need an id.
+        overwrite: Whether to overwrite existing files.
+    Returns:
+        The list of the compact files, one for every .json file (in the same order).
+    """
+    compact_filenames = [get_compact_filename(compact_dir, f) for f in filenames]
+    users_filename, subreddits_filename = get_names_filenames(compact_dir)
+    to_do = [i for i, f in enumerate(compact_filenames) if overwrite or not os.path.isdir(f)]
+    if len(to_do) == 0 and os.path.exists(users_filename) and not overwrite:
+        return compact_filenames
+
+    print '--> Compacting %d of %d .json files to %s with %d processes' % (len(to_do), len(filenames), compact_dir,
+                                                                            n_proc)
+    sys.stdout.flush()
+    start_time = time.time()
+    users, subreddits = set_to_dict(valid_users), set_to_dict(valid_subreddits)
+    save_array(users_filename, sorted(users), False)
+    save_array(subreddits_filename, sorted(subreddits), False)
+
+    publish(users=users, subreddits=subreddits, entry_filter=entry_filter)
+    pool = mp.Pool(n_proc)
+    results = [pool.apply_async(_compact_files_mp, args=(i, [filenames[j] for j in to_do[i::n_proc]],
+                                                         [compact_filenames[j] for j in to_do[i::n_proc]]))
+               for i in range(min(n_proc, len(to_do)))]
+    pool.close()
+    pool.join()
+    unpublish('users', 'subreddits', 'entry_filter')
+    n_posts = sum(r.get() for r in results)  # raises if a worker failed
+    print '\tKept %d comments in %.2f s' % (n_posts, time.time() - start_time)
+    return compact_filenames
+
+
+def _compact_files_mp(proc_id, filenames, compact_filenames):
+    """Writes the compact files of some .json files. Returns the number of comments kept."""
+    n_posts = 0
+    for filename, compact_filename in zip(filenames, compact_filenames):
+        n_posts += _compact_file(proc_id, filename, compact_filename)
+    get_shared('entry_filter').print_rejections('\t%d ' % proc_id)
+    return n_posts
+
+
+def _compact_file(proc_id, filename, compact_filename):
+    users, subreddits = get_shared('users'), get_shared('subreddits')
+    entry_filter = get_shared('entry_filter')
+    values = dict((c, array(_types[c][1])) for c in columns)
+    values['offsets'].append(0)
+
+    tmp_filename = compact_filename + '.tmp'
+    if os.path.exists(tmp_filename):
+        shutil.rmtree(tmp_filename)  # of an interrupted run
+    make_dir(os.path.join(tmp_filename, 'bodies.bin'))
+    print '\t%d compacting %s' % (proc_id, os.path.basename(filename))
+    start_time = time.time()
+    offset = 0
+    with open(filename, 'r') as f, BulkWriter(os.path.join(tmp_filename, 'bodies.bin'), 'wb') as bodies:
+        for line_number, line in enumerate(f, 1):
+            entry = entry_filter.parse(line)
+            if entry is None:
+                continue
+            body = entry['body'].encode('utf-8')
+            bodies.write(body)
+            offset += len(body)
+            values['line'].append(line_number)
+            values['author'].append(users[entry['author']])
+            values['subreddit'].append(subreddits[entry['subreddit']])
+            values['created_utc'].append(int(entry['created_utc']))
+            values['first_level'].append(is_first_level(entry))
+            values['offsets'].append(offset)
+    for c in columns:
+        save_array(os.path.join(tmp_filename, c + '.npy'), np.array(values[c], dtype=_types[c][0]), False)
+
+    if os.path.exists(compact_filename):
+        shutil.rmtree(compact_filename)
+    os.rename(tmp_filename, compact_filename)
+    print '\t%d compacted %s in %.2f s' % (proc_id, os.path.basename(filename), time.time() - start_time)
+    return len(values['line'])
+
+
+def get_compact_filename(compact_dir, filename):
+    """data/RC_2015-01.json -> <compact_dir>/RC_2015-01.json (a directory)."""
+    return os.path.join(compact_dir, os.path.basename(filename))
+
+
+def get_names_filenames(compact_dir):
+    """The user and subreddit names of the ids of a compact corpus."""
+    return os.path.join(compact_dir, 'users.npy'), os.path.join(compact_dir, 'subreddits.npy')
+
+
+def load_names(compact_dir):
+    """The user and subreddit names of the ids of a compact corpus, loaded once per process (until they change)."""
+    users_filename, subreddits_filename = get_names_filenames(compact_dir)
+    st = os.stat(users_filename)
+    signature = (st.st_size, st.st_mtime)
+    cached = _names.get(compact_dir)
+    if cached is None or cached[0] != signature:
+        cached = (signature, np.load(users_filename).tolist(), np.load(subreddits_filename).tolist())
+        _names[compact_dir] = cached
+    return cached[1], cached[2]
+
+
+def is_compact_file(filename):
+    return os.path.isdir(filename)
+
+
+class CompactFile(object):
+    """Reads a compact file. The columns are memory mapped."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.users, self.subreddits = load_names(os.path.dirname(os.path.abspath(filename)))
+        self.columns = dict((c, np.load(os.path.join(filename, c + '.npy'), mmap_mode='r')) for c in columns)
+
+    def __len__(self):
+        return len(self.columns['line'])
+
+    def iter_entries(self, chunk_size=100000):
+        """(line number, entry) of every comment. An entry has the fields author, subreddit, body (unicode),
+        created_utc and parent_id, of which only the kind prefix (t3_ or t1_) is kept."""
+        users, subreddits = self.users, self.subreddits
+        offsets = self.columns['offsets']
+        with open(os.path.join(self.filename, 'bodies.bin'), 'rb') as f:
+            for start in xrange(0, len(self), chunk_size):
+                end = min(start + chunk_size, len(self))
+                chunk = [self.columns[c][start:end].tolist() for c in columns[:-1]]
+                lengths = np.diff(offsets[start:end + 1]).tolist()
+                for line, author, subreddit, created_utc, first_level, length in zip(*(chunk + [lengths])):
+                    yield line, {'author': users[author], 'subreddit': subreddits[subreddit],
+                                 'body': f.read(length).decode('utf-8'), 'created_utc': created_utc,
+                                 'parent_id': 't3_' if first_level else 't1_'}
+
+
+def iter_entries(filename, entry_filter, dropped=()):
+    """(line number, entry) of the comments of a .json dump or a compact file that entry_filter accepts, skipping
+    the line numbers in dropped (see preprocessing.dedup.get_dropped_lines)."""
+    if is_compact_file(filename):
+        for line_number, entry in CompactFile(filename).iter_entries():
+            if line_number not in dropped and entry_filter.check_entry(entry) is not None:
+                yield line_number, entry
+        return
+    with open(filename, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if line_number in dropped:
+                continue
+            entry = entry_filter.parse(line)
+            if entry is not None:
+                yield line_number, entry
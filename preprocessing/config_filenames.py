@@ -1,4 +1,7 @@
 import os
+import re
+
+from util.manifest import register, mark_scanned, is_scanned, query
 
 project_dir = ''  # set this
 n_proc = 16  # set number of processes to run concurrently
@@ -40,6 +43,40 @@ def get_fl_str(params):
     return fl_str
 
 
+def get_file_month(filename):
+    """RC_2015-01.json -> '2015-01'. Returns None if there is no year-month in the filename."""
+    match = re.search(r'(\d{4})-(\d{2})', os.path.basename(filename))
+    if match is None:
+        return None
+    return '%s-%s' % match.groups()
+
+
+def get_dict_str(params):
+    """Marks artifacts made from the dictionaries of json2dicts, which only count the posts of valid subreddits: with
+    the subscriber counts of each month (params.dated_subreddits, '_dated') or the latest ones ('_latest'). Older
+    dictionaries counted all posts and have neither marker, so they are never mistaken for these. The checks of the
+    entries follow (see get_filter_str)."""
+    if params.dated_subreddits:
+        return '_dated%s%s' % (get_fl_str(params), get_filter_str(params))
+    return '_latest%s%s' % (get_fl_str(params), get_filter_str(params))
+
+
+def get_filter_str(params):
+    """Marks artifacts made with other checks than the default ones of preprocessing.entry_filter."""
+    filter_str = '' if params.skip_deleted else '_deleted'
+    if params.start_utc is not None:
+        filter_str += '_from%d' % params.start_utc
+    if params.end_utc is not None:
+        filter_str += '_to%d' % params.end_utc
+    return filter_str
+
+
+def get_split_filename(filename, split):
+    """data/text/ids.txt -> data/text/ids_train.txt"""
+    base, extension = os.path.splitext(filename)
+    return '%s_%s%s' % (base, split, extension)
+
+
 def get_year_str(years):
     if years is None:
         return 'all'
@@ -58,13 +95,35 @@ def get_sub_dict_name(subreddit_limit):
     return os.path.join(valid_dir, 'subscribers_dict_%d.pkl' % subreddit_limit)
 
 
+def get_subscriber_history_filename():
+    return os.path.join(valid_dir, 'subscriber_history.pkl')
+
+
+def get_ranking_page_filename(page_offset, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(valid_dir, 'redditmetrics')
+    return os.path.join(cache_dir, 'offset_%d.html' % page_offset)
+
+
 # -------------------------------------------
 # create valid users
 # -------------------------------------------
 
 
 def get_valid_user_filename(params, years):
-    name = 'valid_users_%s_%s%s' % (get_year_str(years), get_fl_str(params), get_run_name_two(params))
+    name = 'valid_users_%s_%s%s' % (get_year_str(years), get_dict_str(params), get_run_name_two(params))
+    return os.path.join(valid_dir, name)
+
+
+def get_user_counts_filename(params, years):
+    """Merged user -> post count arrays. They do not depend on min_posts, so all min_posts values share them."""
+    name = 'user_counts_%s_%d%s.cnt' % (get_year_str(years), params.min_subscribers, get_dict_str(params))
+    return os.path.join(valid_dir, name)
+
+
+def get_lm_valid_user_filename(params, years):
+    name = 'lm_valid_users_%s_%d%s%s' % (get_year_str(years), params.h_index_min, get_dict_str(params),
+                                         get_run_name_two(params))
     return os.path.join(valid_dir, name)
 
 
@@ -73,70 +132,186 @@ def get_known_bots_filename(min_subscribers):
     return os.path.join(valid_dir, name)
 
 
-def get_to_remove_users_filename(params):
-    name = 'to_remove%s' % get_run_name(params, False)
+def get_split_str(params):
+    """Marks the splits of params.seed and the validation and test fractions, see preprocessing.splits."""
+    return '_seed%d_%g_%g' % (params.seed, params.validation_fraction, params.test_fraction)
+
+
+def get_to_remove_users_filename(params, years):
+    """The held out (validation and test) users of the splits."""
+    name = 'to_remove_%s%s%s%s' % (get_year_str(years), get_dict_str(params), get_split_str(params),
+                                   get_run_name_two(params))
     return os.path.join(valid_dir, name)
 
 
-def get_user_activity_filename(user_num):
-    name = 'user_active_months_%d.pkl' % user_num
+def get_split_users_filename(params, years, split):
+    name = 'split_users_%s_%s%s%s%s' % (get_year_str(years), split, get_dict_str(params), get_split_str(params),
+                                        get_run_name_two(params))
+    return os.path.join(valid_dir, name)
+
+
+def get_user_activity_filename(params, years, user_num):
+    name = 'user_active_months_%s_%d%s%s' % (get_year_str(years), user_num, get_dict_str(params),
+                                             get_run_name_two(params))
     return os.path.join(data_dir, 'user_info', name)
 
 
 # -------------------------------------------
-# user category
+# threads
 # -------------------------------------------
 
+def get_thread_index_filename(json_filename):
+    name = '%s_threads.pkl' % get_file_tag(json_filename)
+    return os.path.join(data_dir, 'threads', name)
 
-def get_all_uc_dict_filenames(params, years=None):
-    def is_valid_uc_dict_name(name, min_subscribers, fl_str, years=None):
-        if years is None:
-            return name.endswith('_%d%s_uc_dict.pkl' % (min_subscribers, fl_str))
-        else:
-            for y in years:
-                if name.endswith('_%d%s_uc_dict.pkl' % (min_subscribers, fl_str)) and str(y) in name:
-                    return True
 
-        return False
+def get_comment_authors_filename(json_filename, user_num):
+    name = '%s_comment_authors_%d.pkl' % (get_file_tag(json_filename), user_num)
+    return os.path.join(data_dir, 'threads', name)
+
 
+# -------------------------------------------
+# user category
+# -------------------------------------------
+
+
+def get_user_cat_dir(params):
     dir_name = user_cat_dir
     if params.validation:
         dir_name = os.path.join(dir_name, 'validation/')
     elif params.test:
         dir_name = os.path.join(dir_name, 'test/')
+    return dir_name
+
+
+def get_file_tag(json_filename):
+    """RC_2015-01.json -> RC_2015-01"""
+    return os.path.splitext(os.path.basename(json_filename))[0]
+
+
+def get_uc_dict_filename(params, json_filename):
+    name = '%s_%d%s_uc_dict.pkl' % (get_file_tag(json_filename), params.min_subscribers, get_dict_str(params))
+    return os.path.join(get_user_cat_dir(params), name)
+
+
+def get_user_dict_filename(params, json_filename):
+    name = '%s_%d%s_users_dict.pkl' % (get_file_tag(json_filename), params.min_subscribers, get_dict_str(params))
+    return os.path.join(get_user_cat_dir(params), name)
+
 
-    files = os.listdir(dir_name)
-    dict_filenames = []
-    fl_str = get_fl_str(params)
-    for filename in files:
-        if is_valid_uc_dict_name(filename, params.min_subscribers, fl_str, years):
-            dict_filenames.append(os.path.join(dir_name, filename))
-    return sorted(dict_filenames)
+def get_uxs_filename(params, years):
+    name = 'UxS_%s%s%s' % (get_year_str(years), get_dict_str(params), get_run_name_two(params).replace('.pkl', '.npy'))
+    return os.path.join(get_user_cat_dir(params), name)
+
+
+def get_split_uxs_filename(params, years, split):
+    name = 'UxS_%s_%s%s%s%s' % (get_year_str(years), split, get_dict_str(params), get_split_str(params),
+                                get_run_name_two(params).replace('.pkl', '.npy'))
+    return os.path.join(get_user_cat_dir(params), name)
+
+
+def get_dict_group(params):
+    """Manifest group of the per-file dictionaries, e.g. 50000_latest_fl"""
+    return '%d%s' % (params.min_subscribers, get_dict_str(params))
+
+
+def register_dict_filenames(params, json_filename):
+    """Records the user-category and user dictionaries of json_filename in the manifest of their directory."""
+    month = get_file_month(json_filename)
+    group = get_dict_group(params)
+    register(get_user_cat_dir(params), [('uc_dict', group, month, get_uc_dict_filename(params, json_filename)),
+                                        ('users_dict', group, month, get_user_dict_filename(params, json_filename))])
+
+
+def rebuild_dict_manifest(params):
+    """Registers the dictionaries of the group of params found in its directory (e.g. made before the manifest) and
+    marks the group as scanned."""
+    dir_name = get_user_cat_dir(params)
+    group = get_dict_group(params)
+    dict_name = re.compile(r'^(?P<tag>.+)_(?P<group>\d+(_dated|_latest)?(_fl)?(_deleted)?(_from\d+)?(_to\d+)?)'
+                           r'_(?P<stage>uc_dict|users_dict)\.pkl$')
+    records = []
+    for filename in (os.listdir(dir_name) if os.path.isdir(dir_name) else []):
+        match = dict_name.match(filename)
+        if match is not None and match.group('group') == group:
+            records.append((match.group('stage'), group, get_file_month(match.group('tag')),
+                            os.path.join(dir_name, filename)))
+    print '--> Registering %d dictionaries of %s in %s' % (len(records), group, dir_name)
+    mark_scanned(dir_name, group, records)
+
+
+def get_all_uc_dict_filenames(params, years=None):
+    return _get_all_dict_filenames('uc_dict', params, years)
 
 
 def get_all_user_dict_filenames(params, years=None):
     """Returns filenames of training user_dicts"""
+    return _get_all_dict_filenames('users_dict', params, years)
 
-    def is_valid_user_dict_name(name, min_subscribers, fl_str, years=None):
-        if years is None:
-            return name.endswith('_%d%s_users_dict.pkl' % (min_subscribers, fl_str))
-        else:
-            for y in years:
-                if name.endswith('_%d%s_users_dict.pkl' % (min_subscribers, fl_str)) and str(y) in name:
-                    return True
 
-        return False
+def _get_all_dict_filenames(stage, params, years=None):
+    dir_name = get_user_cat_dir(params)
+    if not is_scanned(dir_name, get_dict_group(params)):  # once per group, later dictionaries register themselves
+        rebuild_dict_manifest(params)
+    return query(dir_name, stage, get_dict_group(params), years)
+
+
+# -------------------------------------------
+# compact corpus
+# -------------------------------------------
+
+def get_compact_dir(params, years):
+    """The comments of the valid users and subreddits, see preprocessing.compact."""
+    name = 'compact_%s%s%s' % (get_year_str(years), get_dict_str(params), get_run_name_two(params).replace('.pkl', ''))
+    return os.path.join(data_dir, 'compact', name)
+
+
+# -------------------------------------------
+# text
+# -------------------------------------------
+
+def get_text_str(params):
+    """Marks text artifacts made without the duplicate comments (params.deduplicate)."""
+    return get_dict_str(params) + ('_dedup' if params.deduplicate else '')
+
+
+def get_drop_list_filename(years):
+    """The near duplicate comments of the dumps, see preprocessing.dedup."""
+    return os.path.join(data_dir, 'dedup', 'duplicates_%s.pkl' % get_year_str(years))
+
+
+def get_vocab_filename(params, years):
+    name = 'vocab_%s%s_%d%s' % (get_year_str(years), get_text_str(params), params.vocab_size,
+                                get_run_name_two(params).replace('.pkl', '.cnt'))
+    return os.path.join(data_dir, 'vocab', name)
+
+
+def get_word_counts_filename(params, years):
+    name = 'words_%s%s%s' % (get_year_str(years), get_text_str(params),
+                             get_run_name_two(params).replace('.pkl', '.cnt'))
+    return os.path.join(data_dir, 'vocab', name)
+
+
+def get_bpe_filename(params, years):
+    name = 'bpe_%s%s_%d%s' % (get_year_str(years), get_text_str(params), params.bpe_merges,
+                              get_run_name_two(params).replace('.pkl', '.cnt'))
+    return os.path.join(data_dir, 'vocab', name)
+
+
+def get_text_filename(params, years):
+    name = 'text_%s%s%s' % (get_year_str(years), get_text_str(params),
+                            get_run_name_two(params).replace('.pkl', '.txt'))
+    return os.path.join(data_dir, 'text', name)
+
+
+def get_term_matrix_filenames(params, years):
+    """The user x word and subreddit x word count matrices of text2ids."""
+    return [os.path.join(data_dir, 'text', '%s_%s%s_%d%s' % (
+        rows, get_year_str(years), get_text_str(params), params.vocab_size,
+        get_run_name_two(params).replace('.pkl', '.npz'))) for rows in ('uxw', 'sxw')]
 
-    dir_name = user_cat_dir
-    if params.validation:
-        dir_name = os.path.join(dir_name, 'validation/')
-    elif params.test:
-        dir_name = os.path.join(dir_name, 'test/')
 
-    files = os.listdir(dir_name)
-    dict_filenames = []
-    fl_str = get_fl_str(params)
-    for filename in files:
-        if is_valid_user_dict_name(filename, params.min_subscribers, fl_str, years):
-            dict_filenames.append(os.path.join(user_cat_dir, filename))
-    return dict_filenames
+def get_text_id_filename(params, years):
+    name = 'ids_%s%s_%d%s' % (get_year_str(years), get_text_str(params), params.vocab_size,
+                              get_run_name_two(params).replace('.pkl', '.txt'))
+    return os.path.join(data_dir, 'text', name)
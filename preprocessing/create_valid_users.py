@@ -2,34 +2,146 @@
 """A file that combines all user post count dictionaries to create a master one, and then save the users
 that have more than min_posts posts"""
 import os
-import random
+import shutil
+import sys
+import time
+import zlib
+from itertools import imap
 
-import numpy as np
+import multiprocessing as mp
 
 from util.preprocessing_util import *
-from preprocessing.user_category import dict2matrix
-from util.io import save_pickle, load_pickle
-from preprocessing.config_filenames import get_valid_user_filename, get_all_user_dict_filenames
+from util.io import save_pickle, load_pickle, BulkWriter
+from util.artifacts import load_artifact, artifact_exists, save_count_arrays, load_count_arrays
+from util.sampling import get_rng, to_count_arrays, bernoulli_sample, uniform_sample, stratified_sample, \
+    get_activity_strata
+from preprocessing.config_filenames import n_proc, get_valid_user_filename, get_all_user_dict_filenames, \
+    get_user_counts_filename, get_uxs_filename
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
 
-random.seed(12345)
 ABSOLUTE_MIN_POSTS = 20
 
 
 def get_user_count_dictionaries(params, years=None):
-    """Returns all dictionaries, that are in a dictionary from user -> count"""
+    """Returns all dictionaries, that are in a dictionary from user -> count.
+
+    They are loaded lazily, one at a time, so combining them never needs more than one of them in memory."""
     dict_filenames = get_all_user_dict_filenames(params, years)
-    return map(load_pickle, dict_filenames)
+    return imap(load_artifact, dict_filenames)
+
+
+def create_user_counts(params, years=None, overwrite=False, n_partitions=64):
+    """Creates (or loads) the merged user -> post count arrays of all user dictionaries (see merge_user_counts).
+
+    They do not depend on min_posts, so runs with different min_posts reuse them instead of merging again.
+    Returns:
+        CountArrays: count lookups with get(user), users with at least x posts with at_least(x).
+    """
+    filename = get_user_counts_filename(params, years)
+    if artifact_exists(filename) and not overwrite:
+        return load_artifact(filename)
+
+    merge_user_counts(get_all_user_dict_filenames(params, years), filename, filename + '.spill', n_partitions)
+    return load_artifact(filename)
+
+
+def merge_user_counts(dict_filenames, result_filename, spill_dir, n_partitions=64):
+    """Merges user -> count dictionaries out of core, into sorted username and count arrays (save_count_arrays).
+
+    1. Every process reads some of the dictionaries, one at a time, and appends their (user, count) pairs to
+       n_partitions spill files, picking the file by a hash of the username.
+    2. Every process sums the counts of some partitions, one partition at a time. All counts of a user are in the
+       same partition, so a partition only needs a dictionary of about 1 / n_partitions of the users.
+    3. The summed partitions are concatenated and sorted by username.
+    Args:
+        dict_filenames: paths of the user -> count dictionaries.
+        result_filename: path of the count arrays.
+        spill_dir: directory for the spill files. It is removed at the end.
+        n_partitions: number of partitions. Increase it if a partition does not fit in memory.
+    """
+    print '--> Merging %d user dictionaries to %s, with %d partitions and %d processes' % (
+        len(dict_filenames), result_filename, n_partitions, n_proc)
+    sys.stdout.flush()
+    start_time = time.time()
+    if os.path.exists(spill_dir):
+        shutil.rmtree(spill_dir)  # spill files of an interrupted merge
+    os.makedirs(spill_dir)  # the partitions are listed even if there is nothing to spill
+
+    pool = mp.Pool(n_proc)
+    results = [pool.apply_async(_spill_user_counts_mp, args=(i, dict_filenames[i::n_proc], spill_dir, n_partitions))
+               for i in range(n_proc) if len(dict_filenames[i::n_proc]) > 0]
+    pool.close()
+    pool.join()
+    [r.get() for r in results]  # raises if a process failed, a lost spill file would silently drop counts
+    print '\tSpilled in %.2f s' % (time.time() - start_time)
+
+    pool = mp.Pool(n_proc)
+    results = [pool.apply_async(_merge_partition_mp, args=(p, spill_dir)) for p in range(n_partitions)]
+    pool.close()
+    pool.join()
+    partition_filenames = [f for f in (r.get() for r in results) if f is not None]
+    print '\tMerged %d partitions in %.2f s' % (len(partition_filenames), time.time() - start_time)
+
+    keys, counts = [np.zeros(0, dtype='S1')], [np.zeros(0, dtype=np.int64)]
+    for filename in partition_filenames:
+        partition = load_count_arrays(filename, mmap=False)
+        keys.append(partition.keys)
+        counts.append(partition.counts)
+    save_count_arrays(result_filename, (np.concatenate(keys), np.concatenate(counts)), verbose=True)
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    print '\tDone in %.2f s' % (time.time() - start_time)
+
+
+def get_partition(username, n_partitions):
+    """crc32 instead of hash, so every process (and every run) puts a user in the same partition."""
+    return (zlib.crc32(username) & 0xffffffff) % n_partitions
+
+
+def _spill_user_counts_mp(proc_id, dict_filenames, spill_dir, n_partitions):
+    writers = [BulkWriter(os.path.join(spill_dir, 'partition_%d_%d.txt' % (p, proc_id)), buffer_size=1 << 20)
+               for p in range(n_partitions)]
+    for filename in dict_filenames:
+        print '\t%d spilling %s' % (proc_id, os.path.basename(filename))
+        for (user, count) in load_artifact(filename).iteritems():
+            if isinstance(user, unicode):
+                user = user.encode('utf-8')
+            writers[get_partition(user, n_partitions)].write('%s\t%d\n' % (user, count))
+    for w in writers:
+        w.close()
+
+
+def _merge_partition_mp(partition, spill_dir):
+    """Sums the spill files of a partition and saves them as count arrays. Returns their path."""
+    prefix = 'partition_%d_' % partition
+    user_counts = {}
+    for filename in os.listdir(spill_dir):
+        if not (filename.startswith(prefix) and filename.endswith('.txt')):
+            continue
+        with open(os.path.join(spill_dir, filename), 'r') as f:
+            for line in f:
+                user, count = line.rstrip('\n').rsplit('\t', 1)
+                user_counts[user] = user_counts.get(user, 0) + int(count)
+    if len(user_counts) == 0:
+        return None
+    filename = os.path.join(spill_dir, 'partition_%d.cnt' % partition)
+    save_count_arrays(filename, user_counts)
+    return filename
 
 
-def create_valid_user_set(params, years=None, overwrite=False):
-    """Creates a set of valid users, meaning users with more than min_posts posts"""
+def create_valid_user_set(params, years=None, overwrite=False, user_counts=None):
+    """Creates a set of valid users, meaning users with more than min_posts posts.
+
+    user_counts are the merged counts of create_user_counts, made (or loaded) here if None."""
     filename = get_valid_user_filename(params, years)
     if os.path.exists(filename) and not overwrite:
         return load_pickle(filename, False)
 
-    user_counts = combine_dicts(get_user_count_dictionaries(params, years))
+    if user_counts is None:
+        user_counts = create_user_counts(params, years, overwrite)
     usernames = get_top_users(params.min_posts, user_counts)
-    usernames = remove_bots(usernames, params)
+    usernames = remove_bots(usernames)
 
     print '--> Total valid users: %d' % len(usernames)
     save_pickle(filename, usernames)
@@ -67,9 +179,15 @@ def lm_valid_users(filename, params, uxs=None, user_names=None, years=None, over
     if user_names is None:
         user_set = create_valid_user_set(params, years, overwrite)
         user_names = invert_dict(set_to_dict(user_set))
+    else:
+        user_set = set(user_names.values())
 
     if uxs is None:
-        uxs = data_to_sparse(dict2matrix(params, valid_users=user_set, years=years))
+        from preprocessing.user_category import dict2matrix  # imported here, it needs all the json machinery
+        from preprocessing.subreddit_popularity import get_most_popular
+        uxs = data_to_sparse(dict2matrix(params, get_uxs_filename(params, years),
+                                         valid_subreddits=get_most_popular(params.min_subscribers),
+                                         valid_users=user_set, years=years))
 
     assert len(user_names) == uxs.shape[0]
 
@@ -127,27 +245,73 @@ def is_bot_name(name):
 def get_top_users(min_posts, user_counts):
     usernames = set()
     print '--> %d Total users' % len(user_counts),
-    for (k, v) in user_counts.iteritems():
-        if v >= min_posts and v >= ABSOLUTE_MIN_POSTS:
-            usernames.add(k)
+    if hasattr(user_counts, 'at_least'):  # count arrays
+        usernames = set(user_counts.at_least(max(min_posts, ABSOLUTE_MIN_POSTS)).tolist())
+    else:
+        for (k, v) in user_counts.iteritems():
+            if v >= min_posts and v >= ABSOLUTE_MIN_POSTS:
+                usernames.add(k)
     print 'pruned to %d (more than %d posts)' % (len(usernames), min_posts)
     return usernames
 
 
-def get_random_users(total_users, user_counts):
-    inactive_users = len(filter(lambda x: x[1] < ABSOLUTE_MIN_POSTS, user_counts.iteritems()))
-    percentage = float(total_users) / (len(user_counts) - inactive_users)
-    usernames = set()
+def get_random_users(total_users, user_counts, rng=None):
+    """Keeps every active user (at least ABSOLUTE_MIN_POSTS posts) with the same probability, so that about
+    total_users are kept. See sample_users for a sample of exact size.
+
+    Args:
+        total_users: expected number of users in the sample.
+        user_counts: CountArrays (or dictionary) of user -> post count.
+        rng: numpy RandomState, e.g. util.sampling.get_rng(params, 'random_users'). If None, a fixed seed is used.
+    """
+    if rng is None:
+        rng = np.random.RandomState(12345)
+    keys, counts = to_count_arrays(user_counts)
+    active = counts >= ABSOLUTE_MIN_POSTS
+    inactive_users = len(keys) - int(active.sum())
+    percentage = float(total_users) / max(len(keys) - inactive_users, 1)
     print '--> Total Users: %d   Inactive (Less than %d): %d. Sampling with %.03f' % (
-        len(user_counts), ABSOLUTE_MIN_POSTS, inactive_users, percentage),
-    for (k, v) in user_counts.iteritems():
-        if v >= ABSOLUTE_MIN_POSTS:
-            r = random.random()
-            if r < percentage:
-                usernames.add(k)
+        len(keys), ABSOLUTE_MIN_POSTS, inactive_users, percentage),
+    usernames = set(keys[bernoulli_sample(len(keys), percentage, rng, active)].tolist())
+    print '-> %d users' % len(usernames)
     return usernames
 
 
+def sample_users(params, size, user_counts, sample_id=0, strata=None, equal=False, min_posts=ABSOLUTE_MIN_POSTS):
+    """Samples exactly size users (a control group) with at least min_posts posts.
+
+    The sample only depends on params.seed and sample_id, so the same call always returns the same users.
+    Args:
+        params: Parameters of the run (for the seed).
+        size: number of users to sample.
+        user_counts: CountArrays (or dictionary) of user -> post count, e.g. create_user_counts(params).
+        sample_id: id of the sample, to draw several independent samples with the same params.
+        strata: None for a uniform sample, 'activity' to stratify by activity bucket (get_activity_strata), or an
+            array with a stratum label per user, in the (sorted) order of the users of user_counts. For subreddits,
+            util.sampling.get_top_subreddit_strata(uxs) gives the labels of the users of the UxS matrix.
+        equal: if True, the same number of users from every stratum, else proportional to the stratum sizes.
+        min_posts: users with fewer posts are never sampled.
+    Returns:
+        A set of user names.
+    """
+    keys, counts = to_count_arrays(user_counts)
+    if not hasattr(user_counts, 'counts'):  # dictionary: put the users in the sorted order of count arrays
+        order = np.argsort(keys, kind='mergesort')
+        keys, counts = keys[order], counts[order]
+    rng = get_rng(params, 'sample_users', sample_id)
+    active = counts >= min_posts
+    if strata is None:
+        ids = uniform_sample(np.where(active)[0], size, rng)
+    else:
+        if isinstance(strata, basestring):
+            if strata != 'activity':
+                raise ValueError('Unknown strata: %s' % strata)
+            strata = get_activity_strata(counts)
+        ids = stratified_sample(strata, size, rng, equal, active)
+    print '--> Sampled %d of %d users (with at least %d posts)' % (len(ids), int(active.sum()), min_posts)
+    return set(keys[ids].tolist())
+
+
 bot_names = ['A858DE45F56D9BC9',
              'AAbot',
              'ADHDbot',
@@ -751,4 +915,6 @@ bot_names = ['A858DE45F56D9BC9',
 known_bots = set(bot_names)
 
 if __name__ == '__main__':
-    create_valid_user_set()
+    from preprocessing.parameters import Parameters
+
+    create_valid_user_set(Parameters())
@@ -0,0 +1,188 @@
+# __author__ = 'dimitrios'
+"""Near duplicate comments (copy-paste spam, bot repeats) with MinHash and locality sensitive hashing (LSH).
+
+1. Every process reads some of the .json files. The body of every comment is normalized (simplify_post, lower case)
+   and its word shingles are hashed; the MinHash signature of a comment is the minimum of num_perm hash functions
+   over its shingles, computed with numpy for a batch of comments at once. The signature is cut in n_bands bands,
+   and the (hashed) band keys are appended to n_partitions binary spill files, picking the file by the key.
+2. Every process sorts some partitions, one at a time. Comments with the same key in a band are candidate
+   duplicates: all of them but the first (in file and line order) are dropped.
+So memory is bounded by the size of a partition, not the number of comments. Two comments with Jaccard similarity s
+share a band with probability 1 - (1 - s ** rows) ** n_bands, about 0.8 for s = 0.8 with the default 8 bands of 8.
+
+The result is a drop list: file basename -> line numbers (from 1) of the duplicates, which json2vocab and json2text
+skip. Comments with fewer than min_words words are never dropped (a short "thanks!" is not spam).
+"""
+import os
+import shutil
+import sys
+import time
+import json
+import zlib
+
+import multiprocessing as mp
+
+from preprocessing.config_filenames import n_proc
+from util.text_util import simplify_post
+from util.io import save_pickle, load_pickle, BulkWriter
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+_record_dtype = [('key', '<u8'), ('post', '<i8')]
+_line_bits = 40  # post id = file index << _line_bits | line number
+
+
+class MinHasher(object):
+    """MinHash signatures and LSH band keys of word shingle sets."""
+
+    def __init__(self, num_perm=64, n_bands=8, shingle_size=3, seed=12345):
+        assert num_perm % n_bands == 0
+        self.num_perm = num_perm
+        self.n_bands = n_bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # multiply-shift hashing: (a * x + b) >> 32 in uint64 arithmetic, a odd
+        self.a = rng.randint(0, 1 << 62, num_perm).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.randint(0, 1 << 62, num_perm).astype(np.uint64)
+        self.band_weights = rng.randint(0, 1 << 62, num_perm).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+
+    def get_shingles(self, words):
+        """crc32 of the word shingles (all the words, if there are fewer than shingle_size)."""
+        n = max(len(words) - self.shingle_size + 1, 1)
+        return [zlib.crc32(' '.join(words[i:i + self.shingle_size])) & 0xffffffff for i in xrange(n)]
+
+    def get_signatures(self, shingle_lists):
+        """MinHash signatures (len(shingle_lists) x num_perm, uint64) of non empty lists of shingle hashes."""
+        lengths = np.array([len(s) for s in shingle_lists], dtype=np.int64)
+        shingles = np.fromiter((h for s in shingle_lists for h in s), dtype=np.uint64, count=int(lengths.sum()))
+        with np.errstate(over='ignore'):
+            hashes = (shingles[:, None] * self.a + self.b) >> np.uint64(32)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        return np.minimum.reduceat(hashes, starts, axis=0)
+
+    def get_band_keys(self, signatures):
+        """Hash of every band of the signatures (len(signatures) x n_bands, uint64), different for every band."""
+        rows = self.num_perm // self.n_bands
+        with np.errstate(over='ignore'):
+            weighted = signatures * self.band_weights
+            keys = weighted.reshape(len(signatures), self.n_bands, rows).sum(axis=2, dtype=np.uint64)
+            return keys + np.arange(self.n_bands, dtype=np.uint64) * np.uint64(0x9e3779b97f4a7c15)
+
+
+def normalize_body(body):
+    return simplify_post(body).lower().split()
+
+
+def find_duplicates(filenames, drop_filename, overwrite=False, min_words=10, n_partitions=64, batch_size=100000,
+                    hasher=None):
+    """Finds the near duplicate comments of the .json files and saves the drop list.
+
+    Args:
+        filenames: list of paths of the .json files.
+        drop_filename: path of the drop list.
+        overwrite: Whether to overwrite existing file.
+        min_words: comments with fewer words are not considered.
+        n_partitions: number of spill partitions. Increase it if a partition does not fit in memory.
+        batch_size: number of shingles hashed at once (the hashes take batch_size * num_perm * 8 bytes).
+        hasher: MinHasher, the default one if None.
+    Returns:
+        The drop list: dictionary file basename -> sorted array of the line numbers (from 1) of the duplicates.
+    """
+    if os.path.exists(drop_filename) and not overwrite:
+        return load_pickle(drop_filename, False)
+
+    filenames = sorted(filenames)
+    spill_dir = drop_filename + '.spill'
+    print '--> Finding duplicate comments of %d files, with %d partitions and %d processes' % (
+        len(filenames), n_partitions, n_proc)
+    sys.stdout.flush()
+    start_time = time.time()
+    if os.path.exists(spill_dir):
+        shutil.rmtree(spill_dir)  # spill files of an interrupted run
+    hasher = hasher or MinHasher()
+
+    pool = mp.Pool(n_proc)
+    results = [pool.apply_async(_spill_band_keys_mp, args=(i, filenames, range(i, len(filenames), n_proc), spill_dir,
+                                                           n_partitions, min_words, batch_size, hasher))
+               for i in range(min(n_proc, len(filenames)))]
+    pool.close()
+    pool.join()
+    n_posts = sum(r.get() for r in results)
+    print '\tHashed %d comments in %.2f s' % (n_posts, time.time() - start_time)
+
+    pool = mp.Pool(n_proc)
+    results = [pool.apply_async(_find_partition_duplicates_mp, args=(p, spill_dir)) for p in range(n_partitions)]
+    pool.close()
+    pool.join()
+    posts = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] + [r.get() for r in results]))
+    shutil.rmtree(spill_dir, ignore_errors=True)
+
+    file_ids, lines = posts >> _line_bits, posts & ((1 << _line_bits) - 1)
+    drop_lines = dict((os.path.basename(filenames[i]), lines[file_ids == i]) for i in np.unique(file_ids))
+    save_pickle(drop_filename, drop_lines)
+    print '\tFound %d duplicates of %d comments in %.2f s' % (len(posts), n_posts, time.time() - start_time)
+    return drop_lines
+
+
+def _spill_band_keys_mp(proc_id, filenames, file_ids, spill_dir, n_partitions, min_words, batch_size, hasher):
+    """Writes the (band key, post id) records of the comments of some files to the partition spill files. Returns the
+    number of comments hashed."""
+    writers = [BulkWriter(os.path.join(spill_dir, 'partition_%d_%d.bin' % (p, proc_id)), 'wb',
+                           buffer_size=1 << 20)
+               for p in range(n_partitions)]
+    total = [0]
+
+    def flush(posts, shingle_lists):
+        if len(posts) == 0:
+            return
+        keys = hasher.get_band_keys(hasher.get_signatures(shingle_lists))
+        records = np.zeros(keys.size, dtype=_record_dtype)
+        records['key'] = keys.ravel()
+        records['post'] = np.repeat(np.array(posts, dtype=np.int64), hasher.n_bands)
+        partitions = records['key'] % np.uint64(n_partitions)
+        for p in np.unique(partitions):
+            writers[int(p)].write(records[partitions == p].tostring())
+        total[0] += len(posts)
+        del posts[:], shingle_lists[:]
+
+    posts, shingle_lists = [], []
+    n_shingles = 0
+    for file_id in file_ids:
+        print '\t%d hashing %s' % (proc_id, os.path.basename(filenames[file_id]))
+        with open(filenames[file_id], 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                words = normalize_body(json.loads(line)['body'])
+                if len(words) < min_words:
+                    continue
+                posts.append(file_id << _line_bits | line_number)
+                shingle_lists.append(hasher.get_shingles([w.encode('utf-8') for w in words]))
+                n_shingles += len(shingle_lists[-1])
+                if n_shingles >= batch_size:
+                    flush(posts, shingle_lists)
+                    n_shingles = 0
+    flush(posts, shingle_lists)
+    for w in writers:
+        w.close()
+    return total[0]
+
+
+def _find_partition_duplicates_mp(partition, spill_dir):
+    """Post ids of the duplicates in the records of a partition: all the posts of a band key but the first one."""
+    prefix = 'partition_%d_' % partition
+    records = [np.fromfile(os.path.join(spill_dir, f), dtype=_record_dtype) for f in os.listdir(spill_dir)
+               if f.startswith(prefix) and f.endswith('.bin')]
+    if len(records) == 0:
+        return np.zeros(0, dtype=np.int64)
+    records = np.concatenate(records)
+    records = records[np.lexsort((records['post'], records['key']))]
+    duplicate = np.zeros(len(records), dtype=bool)
+    duplicate[1:] = (records['key'][1:] == records['key'][:-1]) & (records['post'][1:] != records['post'][:-1])
+    return np.unique(records['post'][duplicate])
+
+
+def get_dropped_lines(drop_lines, filename):
+    """Set of the line numbers (from 1) of filename to skip, from a drop list (None for no drop list)."""
+    if drop_lines is None:
+        return set()
+    return set(drop_lines.get(os.path.basename(filename), np.zeros(0, dtype=np.int64)).tolist())
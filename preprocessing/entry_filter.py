@@ -0,0 +1,200 @@
+# __author__ = 'dimitrios'
+"""Which comments of the .json dumps are used: a list of predicates, checked in order of cost.
+
+Every predicate can check the raw line before it is decoded (e.g. '"body":"[deleted]"' in line) and the decoded
+entry. The line checks are conservative: they only reject lines that the entry check would reject too, and pass
+anything they are not sure about (e.g. escaped characters, other spacing). As most comments are rejected, most lines
+are never decoded.
+
+    entry_filter = get_entry_filter(params, valid_users, valid_subreddits)
+    for line in f:
+        entry = entry_filter.parse(line)  # None if rejected
+        ...
+    entry_filter.print_rejections()
+"""
+import json
+
+from util.preprocessing_util import is_first_level
+
+_deleted = ('[deleted]', '[removed]')
+
+
+def get_line_field(line, field):
+    """Value of a string field of a json line without decoding it, or None if it is not there as '"field":"value"'
+    or is not plain ascii (escaped or utf-8 characters)."""
+    key = '"%s":"' % field
+    start = line.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    end = line.find('"', start)
+    if end < 0:
+        return None
+    value = line[start:end]
+    if '\\' in value:
+        return None
+    try:
+        value.decode('ascii')
+    except UnicodeError:
+        return None
+    return value
+
+
+class Predicate(object):
+    """Base predicate: accepts everything. Subclasses override check_line and / or check, and set cost (cheaper
+    ones are checked first)."""
+    name = 'predicate'
+    cost = 0
+
+    def check_line(self, line):
+        return True
+
+    def check(self, entry):
+        return True
+
+
+class NotDeleted(Predicate):
+    """Rejects deleted or removed bodies (or authors)."""
+    cost = 0
+
+    def __init__(self, field='body'):
+        self.field = field
+        self.name = 'deleted_%s' % field
+        self.markers = ['"%s":"%s"' % (field, d) for d in _deleted]
+
+    def check_line(self, line):
+        return not any(m in line for m in self.markers)
+
+    def check(self, entry):
+        return entry[self.field] not in _deleted
+
+
+class FirstLevel(Predicate):
+    """Accepts only first level comments (replies to the submission, see is_first_level)."""
+    name = 'first_level'
+    cost = 0
+
+    def check_line(self, line):
+        return '"parent_id":"t1_' not in line
+
+    def check(self, entry):
+        return is_first_level(entry)
+
+
+class InSet(Predicate):
+    """Accepts entries with a field value in a set (or dictionary) of values, e.g. valid subreddits."""
+    cost = 1
+
+    def __init__(self, field, values):
+        self.field = field
+        self.values = values
+        self.name = 'valid_%s' % field
+
+    def check_line(self, line):
+        value = get_line_field(line, self.field)
+        return value is None or value in self.values
+
+    def check(self, entry):
+        return entry[self.field] in self.values
+
+
+class DateRange(Predicate):
+    """Accepts entries with start <= created_utc < end (seconds, None for no bound)."""
+    name = 'date_range'
+    cost = 2
+
+    def __init__(self, start=None, end=None):
+        self.start = start
+        self.end = end
+
+    def check(self, entry):
+        t = int(entry['created_utc'])
+        return (self.start is None or t >= self.start) and (self.end is None or t < self.end)
+
+
+def _overrides(predicate, method):
+    return getattr(type(predicate), method).im_func is not getattr(Predicate, method).im_func
+
+
+class EntryFilter(object):
+    """Checks lines and entries against predicates, and counts how many each predicate rejected."""
+
+    def __init__(self, predicates, loads=json.loads):
+        self.predicates = sorted(predicates, key=lambda p: p.cost)
+        self.line_predicates = [p for p in self.predicates if _overrides(p, 'check_line')]
+        self.entry_predicates = [p for p in self.predicates if _overrides(p, 'check')]
+        self.loads = loads
+        self.rejections = dict((p.name, 0) for p in self.predicates)
+        self.seen = 0
+        self.accepted = 0
+
+    def accept_line(self, line):
+        for p in self.line_predicates:
+            if not p.check_line(line):
+                self.rejections[p.name] += 1
+                return False
+        return True
+
+    def accept(self, entry):
+        for p in self.entry_predicates:
+            if not p.check(entry):
+                self.rejections[p.name] += 1
+                return False
+        return True
+
+    def parse(self, line):
+        """The decoded entry of a line, or None if it is rejected."""
+        self.seen += 1
+        if not self.accept_line(line):
+            return None
+        return self._check(self.loads(line))
+
+    def check_entry(self, entry):
+        """The entry, or None if it is rejected. For entries that are decoded already (see preprocessing.compact)."""
+        self.seen += 1
+        return self._check(entry)
+
+    def _check(self, entry):
+        if not self.accept(entry):
+            return None
+        self.accepted += 1
+        return entry
+
+    def iter_entries(self, lines):
+        """The accepted entries of lines."""
+        for line in lines:
+            entry = self.parse(line)
+            if entry is not None:
+                yield entry
+
+    def print_rejections(self, prefix='\t'):
+        print '%saccepted %d of %d entries, rejected: %s' % (
+            prefix, self.accepted, self.seen, ', '.join('%s %d' % (p.name, self.rejections[p.name])
+                                                        for p in self.predicates) or 'none')
+
+
+def get_entry_filter(params=None, valid_users=None, valid_subreddits=None, first_level=None, loads=json.loads):
+    """The EntryFilter of a run.
+
+    Args:
+        params: Parameters, for skip_deleted, first_level and the date range (start_utc, end_utc). If None, only
+            deleted entries are rejected.
+        valid_users: set (or dictionary) of the users to keep, None for all.
+        valid_subreddits: set (or dictionary) of the subreddits to keep, None for all.
+        first_level: only keep first level comments. If None, params.first_level (False without params).
+        loads: json decoding function.
+    """
+    predicates = []
+    if params is None or params.skip_deleted:
+        predicates += [NotDeleted('body'), NotDeleted('author')]
+    if first_level is None:
+        first_level = params is not None and params.first_level
+    if first_level:
+        predicates.append(FirstLevel())
+    if valid_subreddits is not None:
+        predicates.append(InSet('subreddit', valid_subreddits))
+    if valid_users is not None:
+        predicates.append(InSet('author', valid_users))
+    if params is not None and (params.start_utc is not None or params.end_utc is not None):
+        predicates.append(DateRange(params.start_utc, params.end_utc))
+    return EntryFilter(predicates, loads)
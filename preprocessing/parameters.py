@@ -5,10 +5,21 @@ class Parameters(object):
     min_subscribers = 50000
     min_posts = 100
     vocab_size = 25000
+    bpe_merges = 20000  # of the subword vocabulary, see util.bpe
+    skip_deleted = True  # these and the following are the checks of preprocessing.entry_filter
+    start_utc = None  # only comments with start_utc <= created_utc < end_utc, None for no bound
+    end_utc = None
+    deduplicate = False  # skip the near duplicate comments in the text stages, see preprocessing.dedup
+    compact = False  # the text stages read the compact corpus of the valid comments, see preprocessing.compact
     h_index_min = 10
     first_level = False
+    dated_subreddits = False  # valid subreddits of each month from its subscriber counts, not the latest ones
     validation = False
     test = False
+    split_by = 'user'  # 'user' or 'post': what is hashed into train / validation / test, see preprocessing.splits
+    validation_fraction = 0.1
+    test_fraction = 0.1
+    seed = 12345  # of the random samples of the run, see util.sampling.get_rng
 
     def print_params(self):
         print '-' * 100
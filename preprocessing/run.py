@@ -0,0 +1,258 @@
+# __author__ = 'dimitrios'
+"""Command line entry point: runs the preprocessing stages for a grid of parameters.
+
+    python -m preprocessing.run data/RC_2015-*.json --min-subscribers 10000 50000 --min-posts 100 500 \\
+        --stages lm_users vocab
+
+Every artifact depends on only some of the parameters (see stage_fields): the json2dicts output only on
+min_subscribers (and the first_level / dated / split flags), the merged user counts also on the years, the valid
+users also on min_posts etc. The grid is planned as a list of unique steps, ordered by stage, so that an artifact is
+made once and reused by all the runs of the grid that need it. Results are also kept in memory during the sweep.
+"""
+import argparse
+import glob
+import itertools
+import sys
+
+from preprocessing.parameters import Parameters
+from preprocessing.config_filenames import get_uxs_filename, get_lm_valid_user_filename, get_vocab_filename, \
+    get_word_counts_filename, get_bpe_filename, get_drop_list_filename, get_compact_dir
+from util.preprocessing_util import set_to_dict, invert_dict, data_to_sparse, sparse_to_data_array
+
+stages = ['dicts', 'user_counts', 'users', 'compact', 'matrix', 'lm_users', 'splits', 'dedup', 'vocab', 'bpe']
+stage_dependencies = {'dicts': [],
+                      'user_counts': ['dicts'],
+                      'users': ['user_counts'],
+                      'matrix': ['users'],
+                      'lm_users': ['matrix'],
+                      'splits': ['matrix'],
+                      'dedup': [],
+                      'compact': ['users'],
+                      'vocab': ['users'],
+                      'bpe': ['vocab']}
+
+
+def uses_compact_matrix(params):
+    """The UxS matrix is made from the compact corpus with params.compact, but not with dated subreddits: the valid
+    subreddits of every month are only applied in the dictionaries."""
+    return params.compact and not params.dated_subreddits
+
+
+# dependencies of only some Parameters: stage -> list of (predicate of the Parameters, stage it needs)
+conditional_dependencies = {'matrix': [(uses_compact_matrix, 'compact')],
+                            'vocab': [(lambda params: params.deduplicate, 'dedup'),
+                                      (lambda params: params.compact, 'compact')]}
+
+_dict_fields = ('min_subscribers', 'first_level', 'dated_subreddits', 'skip_deleted', 'start_utc', 'end_utc',
+                'validation', 'test')  # the entry checks apply from the dictionaries on, see get_entry_filter
+stage_fields = {'dicts': _dict_fields,
+                'user_counts': _dict_fields,
+                'users': _dict_fields + ('min_posts',),
+                'matrix': _dict_fields + ('min_posts',),
+                'lm_users': _dict_fields + ('min_posts', 'h_index_min'),
+                'splits': _dict_fields + ('min_posts', 'seed', 'validation_fraction', 'test_fraction'),
+                'dedup': (),
+                'compact': _dict_fields + ('min_posts',),
+                'vocab': _dict_fields + ('min_posts', 'vocab_size', 'deduplicate', 'compact'),
+                'bpe': _dict_fields + ('min_posts', 'bpe_merges', 'deduplicate', 'compact')}
+
+
+def make_grid(min_subscribers, min_posts, vocab_size, h_index_min, first_level=False, dated_subreddits=False,
+              deduplicate=False, compact=False, skip_deleted=True, start_utc=None, end_utc=None):
+    """Returns a list of Parameters, one for every combination of the given lists of values."""
+    grid = []
+    for values in itertools.product(min_subscribers, min_posts, vocab_size, h_index_min):
+        params = Parameters()
+        params.min_subscribers, params.min_posts, params.vocab_size, params.h_index_min = values
+        params.first_level = first_level
+        params.dated_subreddits = dated_subreddits
+        params.deduplicate = deduplicate
+        params.compact = compact
+        params.skip_deleted, params.start_utc, params.end_utc = skip_deleted, start_utc, end_utc
+        grid.append(params)
+    return grid
+
+
+def get_step_key(stage, params):
+    return (stage,) + tuple(getattr(params, f) for f in stage_fields[stage])
+
+
+def get_dependencies(stage, params=None):
+    """The stages that stage needs, with the conditional ones of params (if given)."""
+    conditional = [s for needs, s in conditional_dependencies.get(stage, []) if params is not None and needs(params)]
+    return stage_dependencies[stage] + conditional
+
+
+def get_required_stages(requested, params=None):
+    """The requested stages and everything they depend on (for params, if given), in execution order."""
+    required = set()
+    to_visit = list(requested)
+    while to_visit:
+        stage = to_visit.pop()
+        if stage not in required:
+            required.add(stage)
+            to_visit.extend(get_dependencies(stage, params))
+    return [s for s in stages if s in required]
+
+
+def plan_runs(grid, requested_stages):
+    """Returns the list of unique (stage, params) steps needed for all the Parameters of grid."""
+    required = [set(get_required_stages(requested_stages, params)) for params in grid]
+    plan = []
+    seen = set()
+    for stage in stages:
+        for params, params_stages in zip(grid, required):
+            key = get_step_key(stage, params)
+            if stage in params_stages and key not in seen:
+                seen.add(key)
+                plan.append((stage, params))
+    return plan
+
+
+def print_plan(plan, grid):
+    print '--> %d parameter combinations, %d steps (%d without sharing)' % (
+        len(grid), len(plan), len(grid) * len(set(stage for stage, _ in plan)))
+    for stage, params in plan:
+        print '\t%-12s %s' % (stage, ', '.join('%s=%s' % (f, getattr(params, f)) for f in stage_fields[stage]))
+
+
+class Runner(object):
+    """Runs steps, keeping the result of every step so the later steps of the sweep do not load it again."""
+
+    def __init__(self, filenames, years=None, overwrite=False):
+        self.filenames = filenames
+        self.years = years
+        self.overwrite = overwrite
+        self.results = {}
+
+    def get(self, stage, params):
+        key = get_step_key(stage, params)
+        if key not in self.results:
+            self.results[key] = getattr(self, '_run_' + stage)(params)
+        return self.results[key]
+
+    def run(self, plan):
+        for stage, params in plan:
+            params.print_params()
+            print '--> Stage %s' % stage
+            sys.stdout.flush()
+            self.get(stage, params)
+
+    def get_valid_subreddits(self, params):
+        if params.dated_subreddits:
+            from preprocessing.subscriber_history import load_subscriber_history
+            return load_subscriber_history().get_ever_valid_subreddits(params.min_subscribers)
+        from preprocessing.subreddit_popularity import get_most_popular
+        return get_most_popular(params.min_subscribers)
+
+    def _run_dicts(self, params):
+        from preprocessing.user_category import json2dicts
+        json2dicts(self.filenames, params, self.overwrite)
+
+    def _run_user_counts(self, params):
+        from preprocessing.create_valid_users import create_user_counts
+        self.get('dicts', params)
+        return create_user_counts(params, self.years, self.overwrite)  # memory mapped, cheap to keep
+
+    def _run_users(self, params):
+        from preprocessing.create_valid_users import create_valid_user_set
+        return create_valid_user_set(params, self.years, self.overwrite, self.get('user_counts', params))
+
+    def _run_matrix(self, params):
+        from preprocessing.user_category import dict2matrix, json2matrix, load_to_remove_users
+        if uses_compact_matrix(params):
+            users, subreddits = self.get('users', params), self.get_valid_subreddits(params)
+            matrix = json2matrix(self.get_text_filenames(params), get_uxs_filename(params, self.years), subreddits,
+                                 users, params.first_level, load_to_remove_users(params, self.years),
+                                 self.overwrite)
+            return sparse_to_data_array(matrix)
+        return dict2matrix(params, get_uxs_filename(params, self.years), self.get_valid_subreddits(params),
+                           self.get('users', params), self.years, self.overwrite)
+
+    def _run_lm_users(self, params):
+        from preprocessing.create_valid_users import lm_valid_users
+        user_names = invert_dict(set_to_dict(self.get('users', params)))
+        return lm_valid_users(get_lm_valid_user_filename(params, self.years), params,
+                              data_to_sparse(self.get('matrix', params)), user_names, self.years, self.overwrite)
+
+    def _run_splits(self, params):
+        """Train / validation / test users, and their UxS matrices from one pass over the dictionaries."""
+        from preprocessing.splits import create_user_splits
+        from preprocessing.user_category import dict2split_matrices
+        users = self.get('users', params)
+        splits = create_user_splits(params, users, self.years, self.overwrite)
+        dict2split_matrices(params, self.get_valid_subreddits(params), users, splits, self.years, self.overwrite,
+                            self.get('matrix', params))
+        return splits
+
+    def _run_dedup(self, params):
+        from preprocessing.dedup import find_duplicates
+        return find_duplicates(self.filenames, get_drop_list_filename(self.years), self.overwrite)
+
+    def _run_compact(self, params):
+        from preprocessing.compact import compact_corpus
+        from preprocessing.entry_filter import get_entry_filter
+        users, subreddits = self.get('users', params), self.get_valid_subreddits(params)
+        return compact_corpus(self.filenames, get_compact_dir(params, self.years), users, subreddits,
+                              get_entry_filter(params, users, subreddits), self.overwrite)
+
+    def get_text_filenames(self, params):
+        """The compact files with params.compact (made if needed), else the .json files."""
+        if params.compact:
+            return self.get('compact', params)
+        return self.filenames
+
+    def _run_vocab(self, params):
+        from preprocessing.text import json2vocab
+        from preprocessing.entry_filter import get_entry_filter
+        users, subreddits = self.get('users', params), self.get_valid_subreddits(params)
+        return json2vocab(self.get_text_filenames(params), get_vocab_filename(params, self.years), params.vocab_size,
+                          users, subreddits, self.overwrite,
+                          word_counts_filename=get_word_counts_filename(params, self.years),
+                          drop_lines=self.get('dedup', params) if params.deduplicate else None,
+                          entry_filter=get_entry_filter(params, users, subreddits))
+
+    def _run_bpe(self, params):
+        from preprocessing.text import vocab2bpe
+        self.get('vocab', params)
+        return vocab2bpe(get_word_counts_filename(params, self.years), get_bpe_filename(params, self.years),
+                         params.bpe_merges, self.overwrite)
+
+
+def main(argv=None):
+    defaults = Parameters()
+    parser = argparse.ArgumentParser(description='Preprocessing of reddit comment dumps for a grid of parameters.')
+    parser.add_argument('filenames', nargs='+', help='.json files (or glob patterns) of the comment dumps')
+    parser.add_argument('--min-subscribers', type=int, nargs='+', default=[defaults.min_subscribers])
+    parser.add_argument('--min-posts', type=int, nargs='+', default=[defaults.min_posts])
+    parser.add_argument('--vocab-size', type=int, nargs='+', default=[defaults.vocab_size])
+    parser.add_argument('--h-index-min', type=int, nargs='+', default=[defaults.h_index_min])
+    parser.add_argument('--first-level', action='store_true', help='only use first level comments')
+    parser.add_argument('--dated-subreddits', action='store_true',
+                        help='valid subreddits of each month from the subscriber history')
+    parser.add_argument('--deduplicate', action='store_true',
+                        help='skip the near duplicate comments in the text stages (runs the dedup stage)')
+    parser.add_argument('--compact', action='store_true',
+                        help='the matrix and text stages read a compact corpus of the valid comments (runs the compact '
+                             'stage)')
+    parser.add_argument('--keep-deleted', action='store_true', help='keep the comments with a deleted body or author')
+    parser.add_argument('--start-utc', type=int, default=None, help='only the comments created at or after it')
+    parser.add_argument('--end-utc', type=int, default=None, help='only the comments created before it')
+    parser.add_argument('--years', type=int, nargs='+', default=None)
+    parser.add_argument('--stages', nargs='+', choices=stages, default=['users'])
+    parser.add_argument('--overwrite', action='store_true')
+    parser.add_argument('--dry-run', action='store_true', help='only print the plan')
+    args = parser.parse_args(argv)
+
+    filenames = sorted(set(itertools.chain.from_iterable(glob.glob(f) or [f] for f in args.filenames)))
+    grid = make_grid(args.min_subscribers, args.min_posts, args.vocab_size, args.h_index_min, args.first_level,
+                     args.dated_subreddits, args.deduplicate, args.compact, not args.keep_deleted, args.start_utc,
+                     args.end_utc)
+    plan = plan_runs(grid, args.stages)
+    print_plan(plan, grid)
+    if not args.dry_run:
+        Runner(filenames, args.years, args.overwrite).run(plan)
+
+
+if __name__ == '__main__':
+    main()
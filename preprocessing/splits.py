@@ -0,0 +1,81 @@
+# __author__ = 'dimitrios'
+"""Deterministic train / validation / test splits of users (or posts).
+
+A key (a username, or the line of a post) is hashed with crc32 and params.seed to a number in [0, 1). Keys below
+params.test_fraction go to test, the next params.validation_fraction to validation and the rest to train. So the
+split of a key never changes between runs or machines, and no split has to be stored to be reused: the split ids
+lists are written for convenience and for the to_remove users of dict2matrix.
+
+The splits are made in the same pass as the data they split:
+    dict2split_matrices: one dict2matrix pass, then the rows of every split.
+    text2ids(..., split_by=...): writes one id file per split.
+"""
+import os
+import zlib
+
+from preprocessing.config_filenames import get_split_users_filename, get_to_remove_users_filename
+from util.io import save_pickle, load_pickle
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+split_names = ['train', 'validation', 'test']
+_hash_range = float(1 << 32)
+
+
+def get_split_thresholds(params):
+    """Hash values (as uint32) below the first threshold are test, below the second validation, the rest train."""
+    return (int(params.test_fraction * _hash_range),
+            int((params.test_fraction + params.validation_fraction) * _hash_range))
+
+
+def get_split_id(key, params, thresholds=None):
+    """0 for train, 1 for validation, 2 for test (index in split_names)."""
+    if thresholds is None:
+        thresholds = get_split_thresholds(params)
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    h = zlib.crc32(key, params.seed) & 0xffffffff
+    if h < thresholds[0]:
+        return 2
+    if h < thresholds[1]:
+        return 1
+    return 0
+
+
+def get_split_ids(keys, params):
+    """Split id of every key, as an int8 array."""
+    thresholds = get_split_thresholds(params)
+    return np.fromiter((get_split_id(k, params, thresholds) for k in keys), dtype=np.int8, count=len(keys))
+
+
+def get_user_splitter(params):
+    """Returns a function (username, line) -> split id, for the text2ids conversion, depending on params.split_by."""
+    thresholds = get_split_thresholds(params)
+    if params.split_by == 'user':
+        return lambda user_name, line: get_split_id(user_name, params, thresholds)
+    if params.split_by == 'post':
+        return lambda user_name, line: get_split_id(line, params, thresholds)
+    raise ValueError('Unknown split_by: %s' % params.split_by)
+
+
+def create_user_splits(params, valid_users, years=None, overwrite=False):
+    """Splits the valid users and saves the users of every split, and the held out (validation and test) users as
+    the to_remove users of params.
+
+    Returns:
+        dictionary split name -> set of usernames.
+    """
+    filenames = dict((split, get_split_users_filename(params, years, split)) for split in split_names)
+    if all(os.path.exists(f) for f in filenames.values()) and not overwrite:
+        return dict((split, load_pickle(f, False)) for split, f in filenames.iteritems())
+
+    users = np.array(sorted(valid_users))
+    split_ids = get_split_ids(users, params)
+    splits = {}
+    for i, split in enumerate(split_names):
+        splits[split] = set(users[split_ids == i].tolist())
+        save_pickle(filenames[split], splits[split])
+    save_pickle(get_to_remove_users_filename(params, years), splits['validation'] | splits['test'])
+    print '--> Split %d users: %s' % (len(users), ', '.join('%s %d' % (s, len(splits[s])) for s in split_names))
+    return splits
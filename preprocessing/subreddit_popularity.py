@@ -5,12 +5,21 @@ Used http://redditmetrics.com/top/ to get this data
 Also saves a file with the set of subreddits with more than X subscribers"""
 
 import os
-import random
+import re
+import threading
 import time
-import requests
+import BaseHTTPServer
+import SocketServer
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
 
-from util.io import save_pickle, load_pickle
-from preprocessing.config_filenames import get_sub_dict_name, get_valid_sub_name
+from util.io import save_pickle, load_pickle, file_exists, atomic_open
+from preprocessing.config_filenames import n_proc, get_sub_dict_name, get_valid_sub_name, get_ranking_page_filename
+from util.lazy import lazy_import
+
+requests = lazy_import('requests')
+
+redditmetrics_url = 'http://redditmetrics.com/top'
 
 
 def get_most_popular(min_subscribers, subreddit_limit=50000, overwrite=False):
@@ -29,25 +38,195 @@ def get_most_popular(min_subscribers, subreddit_limit=50000, overwrite=False):
     return create_valid_subreddit_set(subscribers_dict, min_subscribers, overwrite)  # fast - run anyway
 
 
-def crawl_subreddit_subscribers(subreddit_limit, subscribers_dict, subscribers_dict_filename):
-    """Crawls dictionary from subreddit -> number of subscribers from http://redditmetrics.com/top/"""
-    from lxml import html
-    for page_offset in range(0, subreddit_limit, 100):
-        url_str = 'http://redditmetrics.com/top/offset/%d' % page_offset
-        print url_str, len(subscribers_dict)
-        time.sleep(1 + 3 * random.random())
-        page = requests.get(url_str)
-        tree = html.fromstring(page.content)
-
-        table = tree.xpath('//td[@class="tod"]')
-        for i in range(100):
-            # every second entry is name, every third is number of subscribers
-            subscribers_dict[table[3 * i + 1].iterlinks().next()[2][3:]] = int(
-                table[3 * i + 2].text.replace(',', ''))
+def crawl_subreddit_subscribers(subreddit_limit, subscribers_dict, subscribers_dict_filename, fetcher=None,
+                                base_url=redditmetrics_url, n_threads=4, pages_per_sec=0.5, cache_dir=None):
+    """Crawls dictionary from subreddit -> number of subscribers from http://redditmetrics.com/top/
+
+    Pages are downloaded by n_threads threads sharing one rate limit and every page is cached on disk as soon as it
+    is downloaded, so a crawl that dies half way continues from where it stopped when run again.
+    Args:
+        subreddit_limit: how many subreddits (from the top) to crawl. There are 100 per page.
+        subscribers_dict: dictionary to be filled.
+        subscribers_dict_filename: path where the dictionary will be saved.
+        fetcher: function url -> page content. If None, a shared requests session is used.
+        base_url: url of the ranking; pages are base_url/offset/<offset>. Point it to start_ranking_server to crawl
+            saved pages without the internet.
+        n_threads: maximum number of concurrent downloads.
+        pages_per_sec: maximum download rate, over all threads.
+        cache_dir: directory for the downloaded pages. If None, the default of get_ranking_page_filename.
+    """
+    if fetcher is None:
+        fetcher = make_requests_fetcher(n_threads)
+    rate_limit = TokenBucket(pages_per_sec, capacity=n_threads)
+
+    def get_page(page_offset):
+        return fetch_ranking_page(page_offset, fetcher, rate_limit, base_url, cache_dir)
+
+    pool = ThreadPool(n_threads)
+    pages = pool.map(get_page, range(0, subreddit_limit, 100))
+    pool.close()
+    pool.join()
+
+    for content in pages:
+        subscribers_dict.update(parse_subscriber_page(content))
     save_pickle(subscribers_dict_filename, subscribers_dict)
     return subscribers_dict
 
 
+def fetch_ranking_page(page_offset, fetcher, rate_limit=None, base_url=redditmetrics_url, cache_dir=None,
+                       retries=3):
+    """Returns the content of a ranking page, from the disk cache if it was downloaded before."""
+    page_filename = get_ranking_page_filename(page_offset, cache_dir)
+    if file_exists(page_filename):
+        with open(page_filename, 'rb') as f:
+            return f.read()
+
+    url_str = '%s/offset/%d' % (base_url, page_offset)
+    for attempt in range(retries):
+        if rate_limit is not None:
+            rate_limit.acquire()
+        try:
+            content = fetcher(url_str)
+            break
+        except Exception as e:
+            print 'Failed to get %s (attempt %d): %s' % (url_str, attempt + 1, e)
+            if attempt == retries - 1:
+                raise
+            time.sleep(2 ** attempt)
+    print url_str
+
+    with atomic_open(page_filename) as f:  # never leave a half written page in the cache
+        f.write(content)
+    return content
+
+
+def make_requests_fetcher(n_connections=4, timeout=30):
+    """Returns a fetcher (url -> page content) that reuses the connections of one requests session."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=n_connections, pool_maxsize=n_connections)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def fetch(url_str):
+        page = session.get(url_str, timeout=timeout)
+        page.raise_for_status()
+        return page.content
+
+    return fetch
+
+
+class TokenBucket(object):
+    """Thread safe rate limiter: acquire() blocks until a token is available. Tokens are added at rate per second,
+    up to capacity."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class _RankingPageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        match = re.match(r'^/offset/(\d+)/?$', self.path)
+        page_filename = match and get_ranking_page_filename(int(match.group(1)), self.server.page_dir)
+        if not page_filename or not file_exists(page_filename):
+            self.send_error(404)
+            return
+        with open(page_filename, 'rb') as f:
+            content = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def start_ranking_server(page_dir, port=0):
+    """Serves saved ranking pages over http, a local stand-in for redditmetrics to crawl without the internet.
+
+    base_url/offset/<offset> is the page get_ranking_page_filename(offset, page_dir), so the cache_dir of a crawl can
+    be served as it is. Other urls get a 404. The server runs in a daemon thread.
+    Args:
+        page_dir: directory with the saved pages.
+        port: port to listen on (on localhost), 0 for any free port.
+    Returns:
+        (server, base_url): server.paths lists the requested paths. Stop the server with server.shutdown().
+    """
+    server = _ThreadingHTTPServer(('127.0.0.1', port), _RankingPageHandler)
+    server.page_dir = page_dir
+    server.paths = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%d' % server.server_address[1]
+
+
+_name_links_xpath = None
+
+
+def parse_subscriber_page(content):
+    """Returns the subreddit -> subscribers dictionary of one ranking page.
+
+    Rows are three td.tod cells: rank, link to /r/<name>, subscribers. One precompiled XPath selects the links of the
+    name cells (wherever they are in the cell, e.g. in a span) and the count is the td after the name cell, so no
+    other cell or link is visited."""
+    global _name_links_xpath
+    from lxml import etree
+    if _name_links_xpath is None:
+        _name_links_xpath = etree.XPath('//td[@class="tod"]//a[starts-with(@href, "/r/")]')
+
+    subscribers = {}
+    for link in _name_links_xpath(etree.HTML(content)):
+        name_cell = link.getparent()
+        while name_cell.tag != 'td':
+            name_cell = name_cell.getparent()
+        count_cell = next(name_cell.itersiblings('td'))  # skips comments between the cells
+        subscribers[link.get('href')[3:]] = int(''.join(count_cell.itertext()).strip().replace(',', ''))
+    return subscribers
+
+
+def parse_subscriber_pages(page_filenames, processes=n_proc):
+    """Parses many saved ranking pages (e.g. an archive of historical rankings) with multiple processes.
+
+    Returns:
+        list with the subreddit -> subscribers dictionary of every page, in the order of page_filenames.
+    """
+    print '--> Parsing %d ranking pages with %d processes' % (len(page_filenames), processes)
+    pool = mp.Pool(processes)
+    results = pool.map(_parse_subscriber_file, page_filenames, chunksize=max(1, len(page_filenames) / processes / 4))
+    pool.close()
+    pool.join()
+    return results
+
+
+def _parse_subscriber_file(page_filename):
+    with open(page_filename, 'rb') as f:
+        return parse_subscriber_page(f.read())
+
+
 def create_valid_subreddit_set(subscribers_dict, subscriber_limit=1000, overwrite=False):
     """Make a set of subreddits with more than subscriber_limit subscribers, based on an input dictionary."""
     subreddit_set_filename = get_valid_sub_name(subscriber_limit)
@@ -63,4 +242,6 @@ def create_valid_subreddit_set(subscribers_dict, subscriber_limit=1000, overwrit
 
 
 if __name__ == '__main__':
-    crawl_subreddit_subscribers()
+    from preprocessing.parameters import Parameters
+
+    get_most_popular(Parameters.min_subscribers)
@@ -0,0 +1,115 @@
+# __author__ = 'dimitrios'
+"""Subreddit x subreddit co-membership and similarity matrices, computed from the UxS matrix of dict2matrix."""
+import os
+import sys
+
+import multiprocessing as mp
+
+from preprocessing.config_filenames import n_proc
+from util.io import save_pickle, load_pickle
+from util.shared import publish, unpublish, get_shared
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+sparse = lazy_import('scipy.sparse')
+
+
+def uxs2cooccurrence(uxs, result_filename, binary=True, block_size=1000, overwrite=False):
+    """Computes the SxS co-occurrence matrix uxs^T * uxs with multiple processes.
+
+    The subreddits are split in blocks of block_size. A process computes the rows of the co-occurrence matrix of a
+    block of subreddits at a time, and the disjoint row blocks are stacked, so the processes together never hold more
+    than the result (and the UxS matrix that they share).
+    Args:
+        uxs: User by Subreddit count matrix (sparse).
+        result_filename: path where the co-occurrence matrix will be saved.
+        binary: if True, entry (i, j) is the number of users that posted in both i and j. Else, counts are
+            multiplied.
+        block_size: number of subreddits (rows of the result) computed at once.
+        overwrite: Boolean that dictates whether to overwrite existing file (if it exists).
+    Returns:
+        CSR matrix, subreddit x subreddit. The diagonal holds the number of users of each subreddit (if binary).
+    """
+    if os.path.exists(result_filename) and not overwrite:
+        return load_pickle(result_filename, False)
+
+    uxs = sparse.csr_matrix(uxs, copy=True)
+    if binary:
+        uxs.data = np.ones_like(uxs.data)
+    n_subreddits = uxs.shape[1]
+    blocks = range(0, n_subreddits, block_size)
+    print '--> Making %s from %d users in %d blocks of subreddits with %d processes' % (
+        result_filename, uxs.shape[0], len(blocks), n_proc)
+    sys.stdout.flush()
+
+    publish(uxs=uxs, uxs_columns=uxs.tocsc())
+    pool = mp.Pool(n_proc)
+    results = [pool.apply_async(_cooccurrence_mp, args=(start, block_size)) for start in blocks]
+    pool.close()
+    pool.join()
+    unpublish('uxs', 'uxs_columns')
+
+    if len(blocks) == 0:
+        cooccurrence = sparse.csr_matrix((n_subreddits, n_subreddits))
+    else:
+        cooccurrence = sparse.vstack([r.get() for r in results], format='csr')  # raises if a block failed
+    print 'Co-occurrence matrix has %d non zero entries' % cooccurrence.nnz
+    save_pickle(result_filename, cooccurrence)
+    return cooccurrence
+
+
+def _cooccurrence_mp(start, block_size):
+    """The rows start to start + block_size of the co-occurrence matrix."""
+    block = get_shared('uxs_columns')[:, start:start + block_size].T.tocsr()
+    return block * get_shared('uxs')
+
+
+def cosine_similarity(cooccurrence):
+    """Cosine similarity of subreddits: C_ij / sqrt(C_ii * C_jj)."""
+    d = cooccurrence.diagonal().astype(np.float64)
+    d[d == 0] = 1
+    scale = sparse.diags(1. / np.sqrt(d))
+    return sparse.csr_matrix(scale * cooccurrence * scale)
+
+
+def pmi(cooccurrence, total_users, positive=True):
+    """Pointwise mutual information of subreddits, log(C_ij * N / (C_ii * C_jj)), for a binary co-occurrence.
+
+    Args:
+        cooccurrence: binary co-occurrence matrix as returned by uxs2cooccurrence.
+        total_users: number of users (rows of the UxS matrix), N.
+        positive: if True, negative values are dropped (PPMI).
+    """
+    coo = cooccurrence.tocoo()
+    d = cooccurrence.diagonal().astype(np.float64)
+    values = np.log(coo.data * float(total_users) / (d[coo.row] * d[coo.col]))
+    if positive:
+        keep = values > 0
+    else:
+        keep = np.ones(len(values), dtype=bool)
+    return sparse.csr_matrix((values[keep], (coo.row[keep], coo.col[keep])), shape=cooccurrence.shape)
+
+
+def top_k_neighbors(similarity, k=10, exclude_self=True):
+    """Returns the k most similar subreddits of every subreddit.
+
+    Returns:
+        (neighbors, scores): (S x k) int32 and float32 arrays sorted by decreasing score. Missing entries are -1 / 0.
+    """
+    similarity = sparse.csr_matrix(similarity)
+    n = similarity.shape[0]
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    for i in range(n):
+        start, end = similarity.indptr[i], similarity.indptr[i + 1]
+        cols, values = similarity.indices[start:end], similarity.data[start:end]
+        if exclude_self:
+            keep = cols != i
+            cols, values = cols[keep], values[keep]
+        if len(values) > k:
+            top = np.argpartition(-values, k)[:k]
+            cols, values = cols[top], values[top]
+        order = np.argsort(-values, kind='mergesort')
+        neighbors[i, :len(order)] = cols[order]
+        scores[i, :len(order)] = values[order]
+    return neighbors, scores
@@ -0,0 +1,89 @@
+# __author__ = 'dimitrios'
+"""Subscriber counts of subreddits over time, built from an archive of saved redditmetrics ranking pages.
+
+The archive has one directory per date (e.g. 2013-06-01) with the ranking pages of that date (offset_0.html, ...),
+as saved by crawl_subreddit_subscribers(cache_dir=<archive>/<date>).
+The history is stored as a sorted array of subreddit names, a sorted list of dates and a (subreddits x dates)
+int32 array of subscriber counts (0 if a subreddit was not ranked on that date).
+"""
+import os
+
+from preprocessing.config_filenames import get_subscriber_history_filename
+from preprocessing.subreddit_popularity import parse_subscriber_pages
+from util.io import save_pickle, load_pickle
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+
+def create_subscriber_history(archive_dir, overwrite=False):
+    """Parses all pages of the archive and saves the subscriber counts of every subreddit on every date."""
+    filename = get_subscriber_history_filename()
+    if os.path.exists(filename) and not overwrite:
+        return SubscriberHistory(load_pickle(filename, False))
+
+    dates = sorted(d for d in os.listdir(archive_dir) if os.path.isdir(os.path.join(archive_dir, d)))
+    page_dates, page_filenames = [], []
+    for d, date in enumerate(dates):
+        date_dir = os.path.join(archive_dir, date)
+        for page in sorted(os.listdir(date_dir)):
+            if page.endswith('.html'):
+                page_dates.append(d)
+                page_filenames.append(os.path.join(date_dir, page))
+    pages = parse_subscriber_pages(page_filenames)
+
+    subreddits = np.array(sorted(set().union(*pages))) if len(pages) else np.array([], dtype=str)
+    counts = np.zeros((len(subreddits), len(dates)), dtype=np.int32)
+    for d, page in zip(page_dates, pages):
+        if len(page) == 0:
+            continue
+        rows = np.searchsorted(subreddits, page.keys())
+        counts[rows, d] = page.values()
+    print '--> Subscriber history of %d subreddits over %d dates' % (len(subreddits), len(dates))
+
+    history = {'subreddits': subreddits, 'dates': dates, 'counts': counts}
+    save_pickle(filename, history)
+    return SubscriberHistory(history)
+
+
+def load_subscriber_history():
+    return SubscriberHistory(load_pickle(get_subscriber_history_filename(), False))
+
+
+class SubscriberHistory(object):
+    """Answers "which subreddits had at least x subscribers in month M" from the subreddit x date count array.
+
+    The counts of a month are those of the latest date up to the end of that month (or the first date, for months
+    before the archive starts). Answers are cached, so asking again for the same date and limit is free.
+    """
+
+    def __init__(self, history):
+        self.subreddits = history['subreddits']
+        self.dates = np.array(history['dates'])
+        self.counts = history['counts']
+        self._valid_sets = {}
+
+    def get_date_index(self, month):
+        """Index of the latest date that is not after month ('2015-01' or '2015-01-31')."""
+        if month is None:
+            raise ValueError('No month to find the valid subreddits of (files need a YYYY-MM in their name)')
+        d = np.searchsorted(self.dates, month + '\xff', side='right') - 1
+        return max(d, 0)
+
+    def get_valid_subreddits(self, month, min_subscribers):
+        """Returns the set of subreddits with at least min_subscribers subscribers in month."""
+        key = (self.get_date_index(month), min_subscribers)
+        if key not in self._valid_sets:
+            self._valid_sets[key] = set(self.subreddits[self.counts[:, key[0]] >= min_subscribers])
+        return self._valid_sets[key]
+
+    def get_ever_valid_subreddits(self, min_subscribers):
+        """Returns the set of subreddits that had at least min_subscribers subscribers on any date."""
+        return set(self.subreddits[(self.counts >= min_subscribers).any(axis=1)])
+
+    def get_subscribers(self, subreddit):
+        """Returns the subscriber counts of subreddit on all dates (zeros if it was never ranked)."""
+        s = np.searchsorted(self.subreddits, subreddit)
+        if s == len(self.subreddits) or self.subreddits[s] != subreddit:
+            return np.zeros(len(self.dates), dtype=np.int32)
+        return self.counts[s]
@@ -3,112 +3,263 @@
 import os
 import time
 import io
-import numpy as np
+import contextlib
 import multiprocessing as mp
-import json
 
-from preprocessing.config_filenames import n_proc
-from util.preprocessing_util import set_to_dict, combine_dicts, is_valid_entry
-from util.text_util import entry_to_tokens, tokenize_sent_words, replace_with_ids, simplify_post
-from util.io import save_pickle, load_pickle, save_txt, save_text_sentences, make_go_rw
-
-
-def json2vocab(filenames, vocab_filename, vocab_size, valid_users=None, valid_subreddits=None, overwrite=False):
+from preprocessing.config_filenames import n_proc, get_text_filename, get_text_id_filename, get_split_filename, \
+    get_term_matrix_filenames
+from preprocessing.splits import split_names, get_user_splitter
+from preprocessing.dedup import get_dropped_lines
+from preprocessing.entry_filter import get_entry_filter
+from preprocessing.compact import iter_entries
+from util.preprocessing_util import set_to_dict, combine_dicts
+from util.text_util import entry_to_tokens, tokenize_sent_words, simplify_post
+from util.io import save_txt, save_text_sentences, save_sparse, make_go_rw, BulkWriter
+from util.shared import publish, unpublish, get_shared
+from util.vocabulary import Vocabulary, special_tokens, load_vocabulary, vocabulary_exists
+from util.bpe import SubwordVocabulary, train_bpe, get_merges_filename
+from util.artifacts import save_count_arrays, load_count_arrays, count_arrays_exist
+from util.term_matrix import TermMatrixBuilder
+from util.ngrams import NgramCounter, max_subreddit_ngrams, merge_ngram_counts, combine_top_ngrams
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+
+def json2vocab(filenames, vocab_filename, vocab_size, valid_users=None, valid_subreddits=None, overwrite=False,
+               subreddit_vocab_size=None, word_counts_filename=None, ngram_orders=None, ngram_top_k=100000,
+               drop_lines=None, entry_filter=None):
     """Reads all the .json files and keeps the top words mentioned in them by the valid users and subreddits.
 
     Args:
-        filenames: list of paths where the .json files are.
+        filenames: list of paths where the .json files are, or the compact files (see preprocessing.compact).
         vocab_filename: String with the path of the vocabulary.
         vocab_size: Total number of words to be used, ie top-k limit.
         valid_users: Set of users whose words should be kept.
         valid_subreddits: Set of subreddits whose words should be kept.
         overwrite: Whether to overwrite existing file.
+        subreddit_vocab_size: if not None, a vocabulary of this size is also made for every subreddit (see
+            load_subreddit_vocabulary), in the same pass.
+        word_counts_filename: if not None, the counts of all the words (see save_word_counts) are saved there too,
+            e.g. to train a subword vocabulary (vocab2bpe) without another pass over the files.
+        ngram_orders: if not None, e.g. (2, 3), the n-grams of these orders are counted in the same pass, and the
+            top ngram_top_k of every order are saved, globally and for every subreddit (see load_ngrams).
+        ngram_top_k: number of n-grams of every order to keep.
+        drop_lines: None, or a drop list of the lines to skip (see preprocessing.dedup.find_duplicates).
+        entry_filter: EntryFilter of the comments to use, get_entry_filter(None, valid_users, valid_subreddits) if
+            None (see preprocessing.entry_filter).
     Returns:
-        A set of words.
+        A Vocabulary (util.vocabulary), ids start from 1 (the ids of set_to_dict(words, 1)).
     Saves:
-        A set of words and a text file with word, count (for sanity check).
+        The vocabulary (sorted words and their counts) and a text file with word, count (for sanity check).
     """
 
-    counter_filename = vocab_filename.replace('pkl', 'txt')
+    counter_filename = os.path.splitext(vocab_filename)[0] + '.txt'
 
-    if os.path.exists(vocab_filename) and not overwrite:
-        return load_pickle(vocab_filename, False)
+    made = vocabulary_exists(vocab_filename)
+    if word_counts_filename is not None:
+        made = made and count_arrays_exist(word_counts_filename)
+    if ngram_orders is not None:
+        made = made and all(count_arrays_exist(get_ngrams_filename(vocab_filename, n)) for n in ngram_orders)
+    if made and not overwrite:
+        return load_vocabulary(vocab_filename)
 
     print 'Making:\n%s\n%s' % (vocab_filename, counter_filename)
-    counters = []
     limit = vocab_size
 
+    publish(valid_subreddits=valid_subreddits, valid_users=valid_users, by_subreddit=subreddit_vocab_size is not None,
+            ngram_orders=ngram_orders, drop_lines=drop_lines,
+            entry_filter=entry_filter or get_entry_filter(None, valid_users, valid_subreddits))
     pool = mp.Pool(n_proc)
     proc_data_size = int(np.ceil(1. * len(filenames) / n_proc))
-    for i in range(n_proc):
-        proc_filenames = filenames[i * proc_data_size:(i + 1) * proc_data_size]
-        if len(proc_filenames) > 0:
-            pool.apply_async(_json2vocab_mp,
-                             args=(i, proc_filenames, valid_subreddits, valid_users), callback=counters.append)
+    results = [pool.apply_async(_json2vocab_mp, args=(i, filenames[i * proc_data_size:(i + 1) * proc_data_size]))
+               for i in range(n_proc) if i * proc_data_size < len(filenames)]
     pool.close()
     pool.join()
+    unpublish('valid_subreddits', 'valid_users', 'by_subreddit', 'ngram_orders', 'drop_lines', 'entry_filter')
+    counters = [r.get() for r in results]  # raises if a worker failed
 
-    combined_counters = combine_dicts(counters)
+    combined_counters = combine_dicts(c[0] for c in counters)
     print 'Total words before pruning were %d' % len(combined_counters)
-    sorted_vocab = sorted(combined_counters.items(), key=lambda x: x[1], reverse=True)
+    if word_counts_filename is not None:
+        save_word_counts(word_counts_filename, combined_counters)
 
-    vocab = set([x[0] for x in sorted_vocab[:limit - 3]])
     # explicity add unk and sentence start and end tokens.
-    vocab.add('<unk>')
-    vocab.add('<sent_end>')
-    vocab.add('<sent_start>')
-    vocab = set_to_dict(vocab, 1)  # word ids start from 1!!
-    save_pickle(vocab_filename, vocab)
+    vocab = Vocabulary.from_counts(combined_counters, limit, special_tokens)
+    vocab.save(vocab_filename)
 
-    final_counter = np.array(sorted_vocab[:limit])
+    order = np.argsort(-vocab.counts, kind='mergesort')
+    final_counter = np.column_stack((vocab.tokens[order], vocab.counts[order]))
     save_txt(counter_filename, final_counter, delimiter='  ', fmt='%s')
+
+    if subreddit_vocab_size is not None:
+        subreddit_counters = {}
+        for c in counters:
+            for subreddit, counter in c[1].iteritems():
+                subreddit_counters.setdefault(subreddit, []).append(counter)
+        for subreddit, subreddit_counter in subreddit_counters.iteritems():
+            Vocabulary.from_counts(combine_dicts(subreddit_counter), subreddit_vocab_size, special_tokens).save(
+                get_subreddit_vocab_filename(vocab_filename, subreddit))
+        print 'Saved the vocabularies of %d subreddits' % len(subreddit_counters)
+
+    if ngram_orders is not None:
+        top, subreddit_tops = _merge_ngrams([c[2] for c in counters], ngram_top_k)
+        for n in ngram_orders:
+            grams = top.get(n, [])
+            save_count_arrays(get_ngrams_filename(vocab_filename, n), (np.array([g for g, _ in grams]),
+                                                                       np.array([c for _, c in grams])))
+            save_txt(os.path.splitext(get_ngrams_filename(vocab_filename, n))[0] + '.txt', np.array(grams),
+                     delimiter='  ', fmt='%s')
+        for subreddit, subreddit_top in subreddit_tops.iteritems():
+            for n in ngram_orders:
+                grams = subreddit_top.get(n, [])
+                save_count_arrays(get_ngrams_filename(vocab_filename, n, subreddit),
+                                  (np.array([g for g, _ in grams]), np.array([c for _, c in grams])))
+        print 'Saved the top %s-grams of %d subreddits' % ('/'.join(map(str, ngram_orders)), len(subreddit_tops))
     return vocab
 
 
-def _json2vocab_mp(proc_id, filenames, subreddits, users):
+def _merge_ngrams(results, top_k):
+    """Merges the n-gram counts of the _json2vocab_mp workers, one partition per process.
+
+    Returns:
+        (order -> top (n-gram, count) list, subreddit -> order -> top (n-gram, count) list)
+    """
+    publish(ngram_results=results)
+    pool = mp.Pool(n_proc)
+    merged = [pool.apply_async(_merge_ngrams_mp, args=(p, top_k)) for p in range(n_proc)]
+    pool.close()
+    pool.join()
+    merged = [m.get() for m in merged]
+    unpublish('ngram_results')
+
+    subreddit_tops = {}
+    for m in merged:
+        subreddit_tops.update(m[1])
+    return combine_top_ngrams([m[0] for m in merged], top_k), subreddit_tops
+
+
+def _merge_ngrams_mp(partition, top_k):
+    return merge_ngram_counts(get_shared('ngram_results'), partition, n_proc, top_k)
+
+
+def get_ngrams_filename(vocab_filename, n, subreddit=None):
+    base = '%s_%dgrams' % (os.path.splitext(vocab_filename)[0], n)
+    if subreddit is None:
+        return base + '.cnt'
+    return os.path.join(base + '_subreddits', '%s.cnt' % subreddit)
+
+
+def load_ngrams(vocab_filename, n, subreddit=None):
+    """CountArrays n-gram -> count of the top n-grams of order n (of a subreddit), counted by json2vocab."""
+    return load_count_arrays(get_ngrams_filename(vocab_filename, n, subreddit))
+
+
+def save_word_counts(filename, counter, min_count=2, max_length=64):
+    """Saves the counts of the words that appear at least min_count times and are at most max_length bytes long, as
+    count arrays. Rarer and longer words (mostly urls and typos) are most of the distinct words, but are not needed to
+    learn subwords."""
+    counter = dict((w, c) for w, c in counter.iteritems() if c >= min_count and len(w) <= max_length)
+    save_count_arrays(filename, counter, verbose=True)
+
+
+def vocab2bpe(word_counts_filename, bpe_filename, n_merges, overwrite=False, max_words=2000000):
+    """Learns a BPE subword vocabulary from the word counts saved by json2vocab.
+
+    Args:
+        word_counts_filename: the word_counts_filename of json2vocab.
+        bpe_filename: filename of the subword vocabulary (the merges are saved next to it).
+        n_merges: number of BPE merges, the vocabulary has about as many subwords plus the characters.
+        overwrite: Whether to overwrite existing file.
+        max_words: the most frequent words used to learn the merges (bounds the memory needed).
+    Returns:
+        A SubwordVocabulary (util.bpe), that text2ids can use instead of a Vocabulary.
+    """
+    if vocabulary_exists(bpe_filename) and os.path.exists(get_merges_filename(bpe_filename)) and not overwrite:
+        return SubwordVocabulary.load(bpe_filename)
+
+    print 'Making:\n%s' % bpe_filename
+    merges, symbol_counts = train_bpe(load_count_arrays(word_counts_filename), n_merges, max_words=max_words)
+    bpe = SubwordVocabulary.from_training(merges, symbol_counts, special_tokens)
+    bpe.save(bpe_filename)
+    print 'Learned %d merges, %d subwords' % (len(merges), len(bpe))
+    return bpe
+
+
+def get_subreddit_vocab_filename(vocab_filename, subreddit):
+    return os.path.join(os.path.splitext(vocab_filename)[0] + '_subreddits', '%s.cnt' % subreddit)
+
+
+def load_subreddit_vocabulary(vocab_filename, subreddit):
+    """The vocabulary of one subreddit, made by json2vocab with subreddit_vocab_size."""
+    return load_vocabulary(get_subreddit_vocab_filename(vocab_filename, subreddit))
+
+
+def _json2vocab_mp(proc_id, filenames):
+    """Returns the word counts, the word counts of every subreddit if by_subreddit is published, and the n-gram
+    counts (partitioned for _merge_ngrams) if ngram_orders is published."""
     vocab = {}
+    subreddit_vocabs = {}
+    by_subreddit = get_shared('by_subreddit', False)
+    ngram_orders = get_shared('ngram_orders')
+    ngrams = NgramCounter(ngram_orders) if ngram_orders else None
+    subreddit_ngrams = NgramCounter(ngram_orders, max_subreddit_ngrams) if ngram_orders else None
+    drop_lines = get_shared('drop_lines')
+    entry_filter = get_shared('entry_filter')
     tokens = ''
     for filename in filenames:
         print '--->%d Doing %s' % (proc_id, filename)
-
-        with open(filename, 'r') as f:
-            i = 0
-            limit = 1
-            start_time = time.time()
-            for line in f:
-                i += 1
-                if i % limit == 0:
-                    time_passed = time.time() - start_time
-                    print '\t%d %d posts, unique word tokens: %d, time passed: %02f' % (
-                        proc_id, i, len(vocab), time_passed)
-                    limit *= 2
-                entry = json.loads(line)
-                try:
-                    if is_valid_entry():  # this needs to be filled out by user!
-                        tokens = entry_to_tokens(entry)
-
-                        for t in tokens:
-                            vocab[t] = vocab.get(t, 0) + 1
-                except Exception as e:
-                    print '%d: Exception in %s' % (proc_id, entry['body'])
-                    print tokens
-                    print e.message
-                    return
-    return vocab
-
-
-def json2text(filenames, text_filename, valid_users=None, valid_subreddits=None, years=None, overwrite=False):
+        dropped = get_dropped_lines(drop_lines, filename)
+
+        i = 0
+        limit = 1
+        start_time = time.time()
+        for _, entry in iter_entries(filename, entry_filter, dropped):
+            i += 1
+            if i % limit == 0:
+                time_passed = time.time() - start_time
+                print '\t%d %d posts, unique word tokens: %d, time passed: %02f' % (
+                    proc_id, i, len(vocab), time_passed)
+                limit *= 2
+            try:
+                tokens = entry_to_tokens(entry)
+
+                for t in tokens:
+                    vocab[t] = vocab.get(t, 0) + 1
+                if by_subreddit:
+                    subreddit_vocab = subreddit_vocabs.setdefault(entry['subreddit'], {})
+                    for t in tokens:
+                        subreddit_vocab[t] = subreddit_vocab.get(t, 0) + 1
+                if ngrams is not None:
+                    ngrams.add(tokens)
+                    subreddit_ngrams.add(tokens, entry['subreddit'])
+            except Exception as e:  # skip the entry, keep the counts of the others
+                print '%d: Exception in %s' % (proc_id, entry['body'])
+                print tokens
+                print e.message
+                continue
+    entry_filter.print_rejections('\t%d ' % proc_id)
+    if ngrams is None:
+        return vocab, subreddit_vocabs, None
+    return vocab, subreddit_vocabs, (ngrams.get_partitions(n_proc), subreddit_ngrams.get_group_counts())
+
+
+def json2text(filenames, text_filename, valid_users=None, valid_subreddits=None, years=None, overwrite=False,
+              drop_lines=None, entry_filter=None):
     """Reads all the .json files creates a file with the text of users, subreddits.
 
     The resulting file has the format "user_name, subreddit_name, text". The text has no \n's so it can safely
     be saved as a text file with newline separators.
     Args:
-        filenames: list of paths where the .json files are.
+        filenames: list of paths where the .json files are, or the compact files (see preprocessing.compact).
         text_filename: filename where text should be saved.
         valid_users: Set of users whose words should be kept.
         valid_subreddits: Set of subreddits whose words should be kept.
         years: list containing which years this should run on.
         overwrite: Whether to overwrite existing file.
+        drop_lines: None, or a drop list of the lines to skip (see preprocessing.dedup.find_duplicates).
+        entry_filter: EntryFilter of the comments to use, get_entry_filter(None, valid_users, valid_subreddits) if
+            None (see preprocessing.entry_filter).
     Returns:
         A set of words
     Saves:
@@ -122,92 +273,123 @@ def json2text(filenames, text_filename, valid_users=None, valid_subreddits=None,
     print 'Getting all the text for %d users and %d subreddits' % (len(valid_users), len(valid_subreddits))
     sentences = []
 
+    publish(valid_subreddits=valid_subreddits, valid_users=valid_users, drop_lines=drop_lines,
+            entry_filter=entry_filter or get_entry_filter(None, valid_users, valid_subreddits))
     pool = mp.Pool(n_proc)
     proc_data_size = int(np.ceil(1. * len(filenames) / n_proc))
     for i in range(n_proc):
         proc_filenames = filenames[i * proc_data_size:(i + 1) * proc_data_size]
         if len(proc_filenames) > 0:
-            pool.apply_async(_json2text_mp,
-                             args=(i, proc_filenames, valid_subreddits, valid_users), callback=sentences.extend)
+            pool.apply_async(_json2text_mp, args=(i, proc_filenames), callback=sentences.extend)
     pool.close()
     pool.join()
+    unpublish('valid_subreddits', 'valid_users', 'drop_lines', 'entry_filter')
 
     print 'Total sentences (posts): %d' % len(sentences)
     save_text_sentences(text_filename, sentences)
 
 
-def _json2text_mp(proc_id, filenames, subreddits, users):
+def _json2text_mp(proc_id, filenames):
     """Replaces multiple appearances of \n with one. Then replaces all \n with a ."""
     sentences = []
+    drop_lines = get_shared('drop_lines')
+    entry_filter = get_shared('entry_filter')
     for filename in filenames:
         print '--->%d Doing %s' % (proc_id, filename)
-
-        with open(filename, 'r') as f:
-            i = 0
-            limit = 1
-            start_time = time.time()
-            for line in f:
-                i += 1
-                if i % limit == 0:
-                    time_passed = time.time() - start_time
-                    print '\t%d %d posts, valid sentences: %d, time passed: %.2f' % (
-                        proc_id, i, len(sentences), time_passed)
-                    limit *= 2
-
-                entry = json.loads(line)
-                if is_valid_entry():  # write this!
-                    text = simplify_post(entry['body']).encode('utf-8')
-                    user = entry['author']
-                    subreddit = entry['subreddit']
-                    sentences.append('%s\t%s\t%s' % (user, subreddit, text))
+        dropped = get_dropped_lines(drop_lines, filename)
+
+        i = 0
+        limit = 1
+        start_time = time.time()
+        for _, entry in iter_entries(filename, entry_filter, dropped):
+            i += 1
+            if i % limit == 0:
+                time_passed = time.time() - start_time
+                print '\t%d %d posts, valid sentences: %d, time passed: %.2f' % (
+                    proc_id, i, len(sentences), time_passed)
+                limit *= 2
+            text = simplify_post(entry['body']).encode('utf-8')
+            user = entry['author']
+            subreddit = entry['subreddit']
+            sentences.append('%s\t%s\t%s' % (user, subreddit, text))
+    entry_filter.print_rejections('\t%d ' % proc_id)
     return sentences
 
 
-def text2ids(text_filename, text_id_filename, vocab, valid_users=None, valid_subreddits=None, overwrite=False):
+def text2ids(text_filename, text_id_filename, vocab, valid_users=None, valid_subreddits=None, overwrite=False,
+             compress=None, splitter=None, term_matrix_filenames=None):
     """Wrapper for conversion of a text file into a file with ids (user_ids, subreddit_ids, word_ids).
 
     Args:
         text_filename: filename where text exists.
         text_id_filename: filename where ids should be saved.
-        vocab: Dictionary from word -> word_id.
+        vocab: Vocabulary, SubwordVocabulary (then words are written as subword ids), or dictionary word -> word_id.
         valid_users: Set of valid usernames.
         valid_subreddits: Set of valid subreddits.
         overwrite: Whether to overwrite existing file.
+        compress: None, or 'gzip' to gzip the id file while it is written.
+        splitter: None, or a function (username, line) -> split id (see preprocessing.splits.get_user_splitter).
+            Then, one id file per split is written in the same pass, e.g. ids_train.txt, instead of text_id_filename.
+        term_matrix_filenames: None, or the filenames (.npz) of the user x word and subreddit x word count matrices
+            (see util.term_matrix) to make in the same pass. With a splitter, only the train posts are counted.
     """
 
     if not os.path.exists(text_filename):
         print 'The file %s has to be created first!. Returning' % text_filename
         return
 
-    if os.path.exists(text_id_filename) and not overwrite:
-        print 'File: %s already exists' % text_id_filename
+    target_filenames = [text_id_filename]
+    if splitter is not None:
+        target_filenames = [get_split_filename(text_id_filename, split) for split in split_names]
+    made = all(os.path.exists(f) for f in target_filenames)
+    if term_matrix_filenames is not None:
+        made = made and all(os.path.exists(f) for f in term_matrix_filenames)
+    if made and not overwrite:
+        print 'File: %s already exists' % target_filenames[0]
         return
 
-    print 'Making: %s' % text_id_filename
+    print 'Making: %s' % ', '.join(target_filenames + list(term_matrix_filenames or []))
+    if isinstance(vocab, dict):
+        vocab = Vocabulary.from_dict(vocab)
     users = set_to_dict(valid_users, start=1)
     subreddits = set_to_dict(valid_subreddits, start=1)
 
-    _text2ids_conversion(text_filename, text_id_filename, users, subreddits, vocab)
+    builder = None
+    if term_matrix_filenames is not None:
+        builder = TermMatrixBuilder((len(users), len(subreddits)), len(vocab))
+    _text2ids_conversion(text_filename, target_filenames, users, subreddits, vocab, compress, splitter, builder)
+    if builder is not None:
+        for filename, matrix in zip(term_matrix_filenames, builder.get_matrices()):
+            save_sparse(filename, matrix)
 
 
-def _text2ids_conversion(source_filename, target_filename, users, subreddits, vocab):
+def _text2ids_conversion(source_filename, target_filenames, users, subreddits, vocab, compress=None, splitter=None,
+                         builder=None):
     """Converts a text file with format user\t subreddit\t text to the same format with ids. Also splits into sentences.
 
     The new format is 'user_id\t subreddit_id\t sentence1\t sentence2\t.... \n
     sentence: is in format word_id1 word_id2 etc.
     Args:
         source_filename: Path to file with text.
-        target_filename: Path of file that result is going to be saved at.
+        target_filenames: Paths of the files that the result is going to be saved at: one path, or one per split.
         users: Dictionary from username to user id.
         subreddits: Dictionary from subreddit name to subreddit it.
-        vocab: Dictionary from word to word id.
+        vocab: Vocabulary or SubwordVocabulary (anything with get_string_encoder).
+        compress: None, or 'gzip' to gzip the output while it is written.
+        splitter: None, or a function (username, line) -> index of the target file of the post.
+        builder: None, or a TermMatrixBuilder for (users, subreddits), that the posts of the first target file are
+            added to.
     """
+    if isinstance(target_filenames, basestring):
+        target_filenames = [target_filenames]
     total_sentences = 0
     valid_posts = 0
     lim = 1
     start_time = time.time()
+    encode = vocab.get_string_encoder()
+    writers = [BulkWriter(f, threaded=True, compress=compress) for f in target_filenames]
     with io.open(source_filename, 'r', encoding='utf-8') as fr:
-        with open(target_filename, 'w') as fw:
+        with contextlib.nested(*writers):
             for line in fr:
                 if valid_posts % lim == 0:
                     time_passed = time.time() - start_time
@@ -216,25 +398,26 @@ def _text2ids_conversion(source_filename, target_filename, users, subreddits, vo
                 user_name, subreddit_name, text = line.split('\t')
                 user = users[user_name]
                 subreddit = subreddits[subreddit_name]
-                sentences = tokenize_sent_words(text)
-                sentences = [replace_with_ids(s, vocab) for s in sentences]
-                sentences = [s for s in sentences if len(s) > 0]  # remove empty ones.
+                sentences = [s for s in tokenize_sent_words(text) if len(s) > 0]  # remove empty ones.
                 if len(sentences):  # remove empty posts
-                    fw.write('%d\t%d' % (user, subreddit))
                     valid_posts += 1
-                    for s in sentences:
-                        total_sentences += 1
-                        fw.write('\t%s' % ' '.join(map(str, s)))
-                    fw.write('\n')
-            fw.close()
+                    total_sentences += len(sentences)
+                    sentences = [encode(s) for s in sentences]
+                    ids = '\t'.join([' '.join(s) for s in sentences])
+                    target = 0 if splitter is None else splitter(user_name, line)
+                    writers[target].write('%d\t%d\t%s\n' % (user, subreddit, ids))
+                    if builder is not None and target == 0:
+                        builder.add((user, subreddit), ids, sum(len(s) for s in sentences))
         fr.close()
-    make_go_rw(target_filename)
+    for f in target_filenames:
+        make_go_rw(f)
 
     time_passed = time.time() - start_time
     print 'Valid posts: %d --> Total sentences: %d in %.02f sec' % (valid_posts, total_sentences, time_passed)
 
 
-def json2ids(filenames, params, vocab, valid_users=None, valid_subreddits=None, years=None, overwrite=False):
+def json2ids(filenames, params, vocab, valid_users=None, valid_subreddits=None, years=None, overwrite=False,
+             split=False, term_matrices=False, drop_lines=None):
     """End to end conversion of json files, to file with user_id, subreddit_id, text.
 
     Args:
@@ -245,7 +428,14 @@ def json2ids(filenames, params, vocab, valid_users=None, valid_subreddits=None,
         valid_subreddits: Set of subreddits whose words should be kept.
         years: list containing which years this should run on.
         overwrite: Whether to overwrite existing file.
+        split: if True, one id file per train / validation / test split (by params.split_by) is written.
+        term_matrices: if True, the user x word and subreddit x word count matrices are also made (see text2ids).
+        drop_lines: None, or a drop list of the lines to skip (see preprocessing.dedup.find_duplicates).
 
     """
-    json2text(filenames, params, valid_users, valid_subreddits, years, overwrite)
-    text2ids(params, vocab, valid_users, valid_subreddits, years, overwrite)
+    text_filename = get_text_filename(params, years)
+    json2text(filenames, text_filename, valid_users, valid_subreddits, years, overwrite, drop_lines,
+              get_entry_filter(params, valid_users, valid_subreddits))
+    text2ids(text_filename, get_text_id_filename(params, years), vocab, valid_users, valid_subreddits, overwrite,
+             splitter=get_user_splitter(params) if split else None,
+             term_matrix_filenames=get_term_matrix_filenames(params, years) if term_matrices else None)
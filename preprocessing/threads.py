@@ -0,0 +1,153 @@
+# __author__ = 'dimitrios'
+"""Builds a compact comment-tree index per .json file (one file per month), so that thread structure can be
+queried without parsing the json again.
+
+The index of a file is a dictionary of equal length columns (one row per comment):
+    ids: comment id as int64 (the base 36 'id' field, e.g. c02chew).
+    parent_ids: id of the parent (comment or submission) as int64.
+    parent_is_link: True if the parent is the submission (t3_), ie the comment is first level.
+    link_ids: id of the submission (link_id) as int64.
+    authors: index of the author in author_names.
+    created_utc: creation timestamp as int64.
+and author_names, the sorted array of all authors in the file.
+"""
+import os
+import sys
+import time
+
+import multiprocessing as mp
+
+from preprocessing.config_filenames import n_proc, get_thread_index_filename
+from util.io import save_pickle, load_pickle, is_valid_artifact
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+json = lazy_import('simplejson')
+
+
+def reddit_id_to_int(reddit_id):
+    """t1_c02chew or c02chew -> int. Reddit ids are base 36 numbers, optionally with a type prefix."""
+    return int(reddit_id[3:] if reddit_id[2] == '_' else reddit_id, 36)
+
+
+def json2threads(filenames, overwrite=False):
+    """Uses multiple processes to create the comment-tree index of every .json file.
+
+    Args:
+        filenames: list of paths with .json files
+        overwrite: Boolean that dictates whether to overwrite existing files (if they exist).
+    """
+    print '--> Indexing threads of %d files with %d processes' % (len(filenames), n_proc)
+    pool = mp.Pool(n_proc)
+    proc_data_size = int(np.ceil(1. * len(filenames) / n_proc))
+    for i in range(n_proc):
+        proc_filenames = filenames[i * proc_data_size:(i + 1) * proc_data_size]
+        if len(proc_filenames) > 0:
+            pool.apply_async(_json2threads_mp, args=(i, proc_filenames, overwrite))
+    pool.close()
+    pool.join()
+    sys.stdout.flush()
+
+
+def _json2threads_mp(proc_id, filenames, overwrite=False):
+    for filename in filenames:
+        index_filename = get_thread_index_filename(filename)
+        if is_valid_artifact(index_filename) and not overwrite:
+            print '\t%d %s exists! Moving on' % (proc_id, index_filename)
+            continue
+        save_pickle(index_filename, json2thread_index(filename, proc_id))
+
+
+def json2thread_index(filename, proc_id=0):
+    """Reads one .json file and returns its comment-tree index (see module docstring)."""
+    print '\t%d Indexing %s' % (proc_id, os.path.basename(filename))
+    ids, parent_ids, parent_is_link, link_ids, authors, created = [], [], [], [], [], []
+    start_time = time.time()
+    with open(filename, 'r') as f:
+        for line in f:
+            entry = json.loads(line)
+            ids.append(int(entry['id'], 36))
+            parent_ids.append(reddit_id_to_int(entry['parent_id']))
+            parent_is_link.append(entry['parent_id'].startswith('t3_'))
+            link_ids.append(reddit_id_to_int(entry['link_id']))
+            authors.append(entry['author'])
+            created.append(int(entry['created_utc']))
+
+    author_names, author_ids = np.unique(np.array(authors), return_inverse=True)
+    print '\t%d %d comments, %d authors, time passed: %.2f' % (
+        proc_id, len(ids), len(author_names), time.time() - start_time)
+    return {'ids': np.array(ids, dtype=np.int64),
+            'parent_ids': np.array(parent_ids, dtype=np.int64),
+            'parent_is_link': np.array(parent_is_link, dtype=bool),
+            'link_ids': np.array(link_ids, dtype=np.int64),
+            'authors': author_ids.astype(np.int32),
+            'created_utc': np.array(created, dtype=np.int64),
+            'author_names': author_names}
+
+
+def load_thread_index(json_filename):
+    return load_pickle(get_thread_index_filename(json_filename), False)
+
+
+def get_first_level_mask(index):
+    """Boolean mask of the comments that reply directly to the submission."""
+    return index['parent_is_link']
+
+
+def get_parent_rows(index):
+    """Returns for every comment the row of its parent comment in the index.
+
+    -1 means the parent is the submission and -2 that the parent comment is not in this index (e.g. older month)."""
+    ids = index['ids']
+    order = np.argsort(ids)
+    pos = np.searchsorted(ids[order], index['parent_ids'])
+    pos[pos == len(ids)] = 0
+    found = ids[order][pos] == index['parent_ids']
+
+    parent_rows = np.where(found, order[pos], -2)
+    parent_rows[index['parent_is_link']] = -1
+    return parent_rows
+
+
+def get_children(index, parent_rows=None):
+    """Parent -> children adjacency in CSR form.
+
+    Returns:
+        (offsets, children): the children rows of comment row r are children[offsets[r]:offsets[r + 1]].
+    """
+    if parent_rows is None:
+        parent_rows = get_parent_rows(index)
+    replies = np.where(parent_rows >= 0)[0]
+    parents = parent_rows[replies]
+    children = replies[np.argsort(parents, kind='mergesort')]
+    offsets = np.zeros(len(parent_rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(parents, minlength=len(parent_rows)))
+    return offsets, children
+
+
+def get_depths(index, parent_rows=None):
+    """Depth of every comment in its thread: 0 for first level comments, -1 if the chain up to the submission
+    leaves this index (the parent is in another file)."""
+    if parent_rows is None:
+        parent_rows = get_parent_rows(index)
+    depths = np.full(len(parent_rows), -1, dtype=np.int32)
+    depths[parent_rows == -1] = 0
+    unresolved = np.where(parent_rows >= 0)[0]
+    while len(unresolved):
+        parent_depths = depths[parent_rows[unresolved]]
+        resolved = parent_depths >= 0
+        if not resolved.any():
+            break  # the rest hang from comments of other files
+        depths[unresolved[resolved]] = parent_depths[resolved] + 1
+        unresolved = unresolved[~resolved]
+    return depths
+
+
+def get_thread_stats(index):
+    """Returns a dictionary with the histogram of comment depths and the number of comments per submission."""
+    depths = get_depths(index)
+    link_ids, thread_sizes = np.unique(index['link_ids'], return_counts=True)
+    return {'depth_counts': np.bincount(depths[depths >= 0]),
+            'unresolved': int(np.sum(depths < 0)),
+            'link_ids': link_ids,
+            'thread_sizes': thread_sizes}
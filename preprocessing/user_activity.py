@@ -0,0 +1,120 @@
+# __author__ = 'dimitrios'
+"""Builds an index of the months each user was active in, from the per-file user dictionaries that json2dicts
+creates (one file per month, e.g. RC_2015-01), so the raw dumps never have to be scanned again.
+
+The index is a dictionary with:
+    users: sorted array of usernames.
+    months: sorted list of months ('2015-01') covered by the index.
+    bits: (users x ceil(months / 8)) uint8 array, the bit-packed user x month activity matrix.
+"""
+import sys
+
+import multiprocessing as mp
+
+from preprocessing.config_filenames import n_proc, get_all_user_dict_filenames, get_user_activity_filename, \
+    get_file_month
+from util.io import save_pickle, load_pickle, file_exists
+from util.shared import publish, unpublish, get_shared
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+
+def create_user_activity(params, valid_users=None, years=None, overwrite=False):
+    """Creates (or loads) the month activity index of the valid users.
+
+    Args:
+        params: Parameters of the preprocessing run, used to find the user dictionaries.
+        valid_users: set of users to be indexed. If None, the valid user set of params is used.
+        years: list of all the years we want to take into consideration. If none, it selects all available.
+        overwrite: Boolean that dictates whether to overwrite existing file (if it exists).
+    Returns:
+        The activity index (see module docstring).
+    """
+    if valid_users is None:
+        from preprocessing.create_valid_users import create_valid_user_set
+        valid_users = create_valid_user_set(params, years)
+
+    filename = get_user_activity_filename(params, years, len(valid_users))
+    if file_exists(filename) and not overwrite:
+        return load_pickle(filename, False)
+
+    month_filenames = {}
+    for dict_filename in get_all_user_dict_filenames(params, years):
+        month = get_file_month(dict_filename)
+        if month is not None:
+            month_filenames.setdefault(month, []).append(dict_filename)
+    months = sorted(month_filenames)
+    print '--> Making activity index for %d users over %d months' % (len(valid_users), len(months))
+    sys.stdout.flush()
+
+    users = np.array(sorted(valid_users))
+    publish(users_array=users)
+    pool = mp.Pool(n_proc)
+    results = [pool.apply_async(_month_user_ids_mp, args=(i, month_filenames[m])) for i, m in enumerate(months)]
+    pool.close()
+    pool.join()
+    unpublish('users_array')
+
+    # the bits are set one month at a time, so no dense users x months matrix is made (bit order of np.packbits)
+    bits = np.zeros((len(users), (len(months) + 7) // 8), dtype=np.uint8)
+    for m, r in enumerate(results):
+        bits[r.get(), m // 8] |= np.uint8(0x80 >> (m % 8))
+
+    activity = {'users': users, 'months': months, 'bits': bits}
+    save_pickle(filename, activity)
+    return activity
+
+
+def _month_user_ids_mp(proc_id, dict_filenames):
+    """Returns the (sorted) ids of the indexed users that appear in the user dictionaries of one month."""
+    users = get_shared('users_array')
+    ids = []
+    if len(users) == 0:
+        return np.zeros(0, dtype=int)
+    for filename in dict_filenames:
+        print proc_id, filename
+        month_users = np.array(load_pickle(filename, False).keys())
+        if len(month_users) == 0:
+            continue
+        idx = np.searchsorted(users, month_users)
+        idx[idx == len(users)] = 0
+        ids.append(idx[users[idx] == month_users])
+    if len(ids) == 0:
+        return np.zeros(0, dtype=int)
+    return np.unique(np.concatenate(ids))
+
+
+def get_active_matrix(activity, last_months=None, end_month=None):
+    """Unpacks the activity bits of the requested months to a (users x months) boolean matrix.
+
+    Args:
+        activity: activity index as returned by create_user_activity.
+        last_months: only keep this many months, ending at end_month. If None, keep all months up to end_month.
+        end_month: last month to keep (inclusive), e.g. '2015-06'. If None, the last month of the index.
+    Returns:
+        boolean matrix, and the list of months that its columns correspond to.
+    """
+    months = activity['months']
+    end = len(months) if end_month is None else int(np.searchsorted(months, end_month, side='right'))
+    start = 0 if last_months is None else max(0, end - last_months)
+    first_byte = start // 8
+    bits = activity['bits'][:, first_byte:(end + 7) // 8]  # only the bytes of the requested months are unpacked
+    active = np.unpackbits(bits, axis=1)[:, start - 8 * first_byte:end - 8 * first_byte].astype(bool)
+    return active, months[start:end]
+
+
+def get_users_active_in(activity, min_months, last_months=None, end_month=None):
+    """Returns the set of users that were active in at least min_months of the last last_months months."""
+    active, _ = get_active_matrix(activity, last_months, end_month)
+    return set(activity['users'][active.sum(axis=1) >= min_months])
+
+
+def get_user_months(activity, username):
+    """Returns the list of months username was active in (empty if the user is not indexed)."""
+    users = activity['users']
+    u = np.searchsorted(users, username)
+    if u == len(users) or users[u] != username:
+        return []
+    active = np.unpackbits(activity['bits'][u])[:len(activity['months'])]
+    return [activity['months'][m] for m in np.where(active)[0]]
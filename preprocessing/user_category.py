@@ -8,13 +8,21 @@ import sys
 import time
 
 import multiprocessing as mp
-import numpy as np
-import simplejson as json
 
 from preprocessing.subreddit_popularity import get_most_popular
-from preprocessing.config_filenames import n_proc, get_all_uc_dict_filenames
-from util.preprocessing_util import set_to_dict, is_valid_entry, data_to_sparse, sparse_to_data_array
-from util.io import save_pickle, load_pickle, save_array, load_array
+from preprocessing.config_filenames import n_proc, get_all_uc_dict_filenames, get_uc_dict_filename, \
+    get_user_dict_filename, get_file_month, get_comment_authors_filename, register_dict_filenames, \
+    get_to_remove_users_filename, get_uxs_filename, get_split_uxs_filename
+from preprocessing.threads import load_thread_index
+from preprocessing.entry_filter import get_entry_filter
+from preprocessing.compact import iter_entries
+from util.preprocessing_util import set_to_dict, data_to_sparse, sparse_to_data_array
+from util.io import save_pickle, load_pickle, save_array, load_array, is_valid_artifact
+from util.shared import publish, unpublish, get_shared
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+json = lazy_import('simplejson')
 
 
 def json2dicts(filenames, params, overwrite=False):
@@ -23,46 +31,66 @@ def json2dicts(filenames, params, overwrite=False):
     Creates one dictionary from username-> post count
     and one from username+subreddit -> count.
     It only keeps SOME subreddits, those with at least x subscribers. x is defined in params.
+    If params.dated_subreddits, the subscribers of each file's month are used (from the subscriber history), else the
+    latest ones.
     Args:
         filenames: list of paths with .json files
         params: preprocessing parameters. Used to identify which subreddits to keep (based on min number of subscribers.
         overwrite: Boolean that dictates whether to overwrite existing file (if it exists),
     """
+    undated = [f for f in filenames if get_file_month(f) is None]
+    if params.dated_subreddits and undated:
+        raise ValueError('dated_subreddits needs the month of every file (YYYY-MM in its name), not in: %s' %
+                         ', '.join(undated))
     print '--> Converting %d files with %d processes' % (len(filenames), n_proc)
-    subreddits_to_keep = get_most_popular(params.min_subscribers)
+    if params.dated_subreddits:
+        from preprocessing.subscriber_history import load_subscriber_history
+        publish(subscriber_history=load_subscriber_history())  # inherited by the workers, not pickled
+    else:
+        publish(valid_subreddits=get_most_popular(params.min_subscribers))
 
     pool = mp.Pool(n_proc)
     proc_data_size = int(np.ceil(1. * len(filenames) / n_proc))
     for i in range(n_proc):
         proc_filenames = filenames[i * proc_data_size:(i + 1) * proc_data_size]
         if len(proc_filenames) > 0:
-            pool.apply_async(_json2dicts_multiple_files,
-                             args=(i, proc_filenames, params, subreddits_to_keep, overwrite))
+            pool.apply_async(_json2dicts_multiple_files, args=(i, proc_filenames, params, overwrite))
     pool.close()
     pool.join()
+    unpublish('valid_subreddits', 'subscriber_history')
 
     sys.stdout.flush()
 
 
-def _json2dicts_multiple_files(proc_id, filenames, params, subreddits_to_keep, overwrite=False):
+def _json2dicts_multiple_files(proc_id, filenames, params, overwrite=False):
+    subscriber_history = get_shared('subscriber_history')
     for filename in filenames:
-        _json2dicts_mp(proc_id, filename, params, subreddits_to_keep, params, overwrite)
+        if subscriber_history is not None:
+            valid_subreddits = subscriber_history.get_valid_subreddits(get_file_month(filename), params.min_subscribers)
+        else:
+            valid_subreddits = get_shared('valid_subreddits')
+        _json2dicts_mp(proc_id, filename, get_user_dict_filename(params, filename),
+                       get_uc_dict_filename(params, filename), params, overwrite, valid_subreddits)
 
 
-def _json2dicts_mp(proc_id, filename, user_count_filename, uc_dict_filename, params, overwrite=False):
+def _json2dicts_mp(proc_id, filename, user_count_filename, uc_dict_filename, params, overwrite=False,
+                   valid_subreddits=None):
     """Processes a file as downloaded from the reddit data webpage: http://files.pushshift.io/reddit/comments/
 
     For each file it creates two files. One with a dictionary from user -> count and one from user_category -> count.
+    Only posts in valid_subreddits are counted (all posts, if it is None).
     """
     print '\t%d Converting %s for at least %d subscribers' % (
         proc_id, os.path.basename(filename), params.min_subscribers),
 
-    if os.path.exists(uc_dict_filename) and not overwrite:
+    if is_valid_artifact(uc_dict_filename) and is_valid_artifact(user_count_filename) and not overwrite:
         print ': exists! Moving on'
+        register_dict_filenames(params, filename)  # it may have been made before the manifest
         return
     print
     count_dict = {}
     user_post_count = {}
+    entry_filter = get_entry_filter(params, valid_subreddits=valid_subreddits, loads=json.loads)
 
     f = open(filename, 'r')
     i = 0
@@ -76,37 +104,42 @@ def _json2dicts_mp(proc_id, filename, user_count_filename, uc_dict_filename, par
                 proc_id, i, len(count_dict), time_passed)
             limit *= 2
 
-        entry = json.loads(line)
-        if is_valid_entry():  # write this
+        entry = entry_filter.parse(line)
+        if entry is not None:
             k = '%s %s' % (entry['author'], entry['subreddit'])  # key is author + ' ' + subreddit
             count_dict[k] = count_dict.get(k, 0) + 1
             user_post_count[entry['author']] = user_post_count.get(entry['author'], 0) + 1
 
     time_passed = time.time() - start_time
     print '\t%d %d posts, size of uc_dict: %d, time passed: %02f' % (proc_id, i, len(count_dict), time_passed)
+    entry_filter.print_rejections('\t%d ' % proc_id)
     print '\t%d %d users' % (proc_id, len(user_post_count))
     save_pickle(uc_dict_filename, count_dict)
     save_pickle(user_count_filename, user_post_count)
+    register_dict_filenames(params, filename)
 
 
 ####
 
 
-def json2matrix(filenames, result_filename, valid_subreddits, valid_users, first_level_only=False):
+def json2matrix(filenames, result_filename, valid_subreddits, valid_users, first_level_only=False, to_remove=None,
+                overwrite=False):
     """Reads json files from filenames and only keeps entries from valid subreddits and valid users.
 
     Args:
-        filenames: list of paths with .json files to be read
+        filenames: list of paths with .json files to be read, or the compact files (see preprocessing.compact)
         result_filename: string with path of file to be saved.
         valid_subreddits: set of subreddit names to keep
         valid_users: set of users to keep
         first_level_only: boolean to decide whether to only keep first level comments (ie not indented).
+        to_remove: set of usernames whose counts are zeroed, as in dict2matrix.
+        overwrite: Boolean that dictates whether to overwrite existing file (if it exists).
     Returns:
-        a CSR matrix of counts, user x subreddits."""
+        a CSR matrix of counts, user x subreddits (all the valid users and subreddits)."""
 
     print 'User cat matrix from %d users and %d subreddits' % (len(valid_users), len(valid_subreddits))
 
-    if os.path.exists(result_filename):
+    if os.path.exists(result_filename) and not overwrite:
         return data_to_sparse(load_array(result_filename, False))
     else:
         print '--> Making %s from %d .json files with %d processes' % (result_filename, len(filenames), n_proc)
@@ -117,64 +150,175 @@ def json2matrix(filenames, result_filename, valid_subreddits, valid_users, first
         for i in range(n_proc):
             proc_data.append(filenames[i * proc_data_size:(i + 1) * proc_data_size])
 
+        # id maps are built once here and inherited by the workers
+        publish(users=set_to_dict(valid_users), subreddits=set_to_dict(valid_subreddits))
         results = []
         pool = mp.Pool(n_proc)
         for i in range(n_proc):
             if len(proc_data[i]) > 0:
-                pool.apply_async(_json2matrix_mp,
-                                 args=(i, proc_data[i], valid_subreddits, valid_users, first_level_only),
+                pool.apply_async(_json2matrix_mp, args=(i, proc_data[i], None, None, first_level_only),
                                  callback=results.append)
         pool.close()
         pool.join()
+        unpublish('users', 'subreddits')
 
         data_array = np.zeros((0, 3))
         for r in results:
             data_array = np.vstack((data_array, r))
+        data_array = np.vstack((data_array, [len(valid_users) - 1, len(valid_subreddits) - 1, 0]))  # full shape
+        if to_remove is not None:
+            users = set_to_dict(valid_users)
+            data_array[np.in1d(data_array[:, 0], [users[u] for u in to_remove if u in users]), 2] = 0
 
         data_array = sparse_to_data_array(data_to_sparse(data_array))  # consolidate
         save_array(result_filename, data_array)
     return data_to_sparse(data_array)
 
 
-def _json2matrix_mp(proc_id, filenames, valid_subreddits, valid_users):
+def _json2matrix_mp(proc_id, filenames, valid_subreddits=None, valid_users=None, first_level_only=False):
     """MP part that reads json files from filenames and only keeps entries from valid subreddits and valid users.
     Args:
         proc_id: process id
         filenames: list of paths with .json files to be read
-        valid_subreddits: set of subreddit names to keep
-        valid_users: set of users to keep
+        valid_subreddits: set of subreddit names to keep. If None, the published subreddit id map is used.
+        valid_users: set of users to keep. If None, the published user id map is used.
+        first_level_only: boolean to decide whether to only keep first level comments (ie not indented).
     Returns:
         a COO matrix of counts, user x subreddits.
     """
-    users = set_to_dict(valid_users)
-    subreddits = set_to_dict(valid_subreddits)
-    data = np.zeros((0, 3))
+    users = set_to_dict(valid_users) if valid_users is not None else get_shared('users')
+    subreddits = set_to_dict(valid_subreddits) if valid_subreddits is not None else get_shared('subreddits')
+    # only users and subreddits with an id, so the lookups below never fail
+    entry_filter = get_entry_filter(None, users, subreddits, first_level_only, json.loads)
+    rows, cols = [], []
 
     for filename in filenames:
         print proc_id, filename
-        f = open(filename, 'r')
         i = 1
         start_time = time.time()
-        for line in f:
-            entry = json.loads(line)
-            if is_valid_entry():  # write this
-                u = users[entry['author']]
-                c = subreddits[entry['subreddit']]
-                data = np.vstack((data, [u, c, 1]))
-                if len(data) % 10000 == 0 and len(data) > 0:
-                    data = sparse_to_data_array(data_to_sparse(data))  # consolidate
+        for _, entry in iter_entries(filename, entry_filter):
+            rows.append(users[entry['author']])
+            cols.append(subreddits[entry['subreddit']])
 
             i += 1
             if i % 1000000 == 0:
                 time_passed = time.time() - start_time
-                print '\t%d %d posts, data:%d->%d, time: %.3f' % (
-                    proc_id, i, len(data), np.sum(data[:, 2]), time_passed)
-    return data
+                print '\t%d %d posts, data:%d, time: %.3f' % (proc_id, i, len(rows), time_passed)
+    entry_filter.print_rejections('\t%d ' % proc_id)
+    if len(rows) == 0:
+        return np.zeros((0, 3))
+    return sparse_to_data_array(data_to_sparse(np.column_stack((rows, cols, np.ones(len(rows))))))  # consolidate
+
+
+####
+
+
+def json2reply_matrix(filenames, result_filename, valid_users, max_lag=2, self_replies=False, overwrite=False):
+    """Creates the user x user reply matrix: entry (u, v) counts how many times u replied to a comment of v.
+
+    Works on the thread indices of json2threads (which have to exist) in two phases:
+    1) for every month, a sorted array of comment id -> user id, for the comments of valid users.
+    2) for every month, the parents of its replies are looked up in the arrays of the same and the max_lag previous
+       months, so only max_lag + 1 months of comment ids are in memory per process.
+    User ids are those of the UxS matrix (set_to_dict(valid_users)).
+    Args:
+        filenames: list of paths with .json files (one per month) whose thread index exists.
+        result_filename: path where the CSR matrix will be saved.
+        valid_users: set of users to keep.
+        max_lag: number of previous months where parent comments are looked for.
+        self_replies: whether to count users replying to themselves.
+        overwrite: Boolean that dictates whether to overwrite existing file (if it exists).
+    Returns:
+        a CSR matrix of counts, user x user.
+    """
+    if os.path.exists(result_filename) and not overwrite:
+        return load_pickle(result_filename, False)
+
+    filenames = sorted(filenames, key=lambda f: get_file_month(f) or f)
+    print '--> Making %s from %d months with %d processes' % (result_filename, len(filenames), n_proc)
+    sys.stdout.flush()
+
+    publish(users=set_to_dict(valid_users))
+    try:
+        pool = mp.Pool(n_proc)
+        results = [pool.apply_async(_comment_authors_mp, args=(i, filename, len(valid_users), overwrite))
+                   for i, filename in enumerate(filenames)]
+        pool.close()
+        pool.join()
+        for r in results:
+            r.get()  # raises if the comment authors of a month could not be made
+
+        pool = mp.Pool(n_proc)
+        results = [pool.apply_async(_reply_edges_mp, args=(i, filenames[max(0, i - max_lag):i + 1], len(valid_users),
+                                                           self_replies))
+                   for i, filename in enumerate(filenames)]
+        pool.close()
+        pool.join()
+        results = [r.get() for r in results]
+    finally:
+        unpublish('users')
+
+    n = len(valid_users)
+    reply_matrix = data_to_sparse(np.zeros((0, 3)), shape=(n, n))
+    for r in results:
+        reply_matrix = reply_matrix + data_to_sparse(r, shape=(n, n))
+    print 'Total replies between valid users: %d, user pairs: %d' % (reply_matrix.sum(), reply_matrix.nnz)
+    save_pickle(result_filename, reply_matrix)
+    return reply_matrix
+
+
+def _comment_authors_mp(proc_id, filename, user_num, overwrite=False):
+    """Phase 1: saves the sorted comment ids of valid users of one month and the user id of each."""
+    authors_filename = get_comment_authors_filename(filename, user_num)
+    if is_valid_artifact(authors_filename) and not overwrite:
+        return
+    users = get_shared('users')
+    index = load_thread_index(filename)
+    name_ids = np.array([users.get(name, -1) for name in index['author_names']], dtype=np.int64)
+    user_ids = name_ids[index['authors']]
+    valid = user_ids >= 0
+    ids, user_ids = index['ids'][valid], user_ids[valid]
+    order = np.argsort(ids)
+    print '\t%d %s: %d comments of valid users' % (proc_id, os.path.basename(filename), len(ids))
+    save_pickle(authors_filename, {'ids': ids[order], 'users': user_ids[order].astype(np.int32)})
+
+
+def _reply_edges_mp(proc_id, filenames, user_num, self_replies=False):
+    """Phase 2: returns the (n,3) array of (replier, replied to, count) for the replies of the last month in
+    filenames. The parents are looked up in all the months in filenames."""
+    users = get_shared('users')
+    index = load_thread_index(filenames[-1])
+    name_ids = np.array([users.get(name, -1) for name in index['author_names']], dtype=np.int64)
+    repliers = name_ids[index['authors']]
+    replies = np.where((repliers >= 0) & ~index['parent_is_link'])[0]
+    repliers, parent_ids = repliers[replies], index['parent_ids'][replies]
+
+    authors = [load_pickle(get_comment_authors_filename(f, user_num), False) for f in filenames]
+    ids = np.concatenate([a['ids'] for a in authors])
+    id_users = np.concatenate([a['users'] for a in authors])
+    order = np.argsort(ids, kind='mergesort')  # months are already sorted, this is mostly a merge
+    ids, id_users = ids[order], id_users[order]
+
+    pos = np.searchsorted(ids, parent_ids)
+    pos[pos == len(ids)] = 0
+    found = ids[pos] == parent_ids if len(ids) else np.zeros(len(parent_ids), dtype=bool)
+    edges = np.zeros((np.sum(found), 3))
+    edges[:, 0] = repliers[found]
+    edges[:, 1] = id_users[pos[found]]
+    edges[:, 2] = 1
+    if not self_replies:
+        edges = edges[edges[:, 0] != edges[:, 1]]
+    print '\t%d %s: %d replies to valid users out of %d' % (
+        proc_id, os.path.basename(filenames[-1]), len(edges), len(replies))
+    if len(edges) == 0:
+        return edges
+    return sparse_to_data_array(data_to_sparse(edges), maintain_size=False)  # consolidate
 
 
 ####
 
-def dict2matrix(params, coo_data_filename, valid_subreddits=None, valid_users=None, years=None, overwrite=False):
+def dict2matrix(params, coo_data_filename, valid_subreddits=None, valid_users=None, years=None, overwrite=False,
+                to_remove=None):
     """Converts dictionaries of user-category counts to a single UxC matrix.
 
     Args:
@@ -184,6 +328,9 @@ def dict2matrix(params, coo_data_filename, valid_subreddits=None, valid_users=No
         valid_users: set of users to be considered. If none, it will be loaded from where params dictates.
         years: list of all the years we want to take into consideration. If none, it selects all available.
         overwrite: Boolean that dictates whether to overwrite existing file (if it exists).
+        to_remove: set of usernames whose counts are zeroed (their rows stay, so ids do not change), e.g. the held out
+            users of preprocessing.splits. If None, for validation or test params, the to_remove users of params are
+            used if they exist.
         """
 
     print '--> Making %s' % coo_data_filename,
@@ -193,7 +340,12 @@ def dict2matrix(params, coo_data_filename, valid_subreddits=None, valid_users=No
         return load_array(coo_data_filename, False)
     else:
 
-        to_remove = None
+        if to_remove is None:
+            to_remove = load_to_remove_users(params, years)
+        if to_remove is not None:
+            users = set_to_dict(valid_users)
+            to_remove = np.array(sorted(users[u] for u in to_remove if u in users))
+            print '(zeroing %d users)' % len(to_remove),
 
         user_cat_counts_filenames = get_all_uc_dict_filenames(params, years)
         sys.stdout.flush()
@@ -203,14 +355,17 @@ def dict2matrix(params, coo_data_filename, valid_subreddits=None, valid_users=No
         for i in range(n_proc):
             proc_data.append(user_cat_counts_filenames[i * proc_data_size:(i + 1) * proc_data_size])
 
+        publish(valid_subreddits=valid_subreddits, valid_users=valid_users,
+                subreddits=set_to_dict(valid_subreddits), users=set_to_dict(valid_users))
         results = []
         pool = mp.Pool(n_proc)
         for i in range(n_proc):
             if len(proc_data[i]) > 0:
-                pool.apply_async(_dict2matrix_mp, args=(i, proc_data[i], valid_subreddits, valid_users, to_remove),
+                pool.apply_async(_dict2matrix_mp, args=(i, proc_data[i], None, None, to_remove),
                                  callback=results.append)
         pool.close()
         pool.join()
+        unpublish('valid_subreddits', 'valid_users', 'subreddits', 'users')
 
         data = np.zeros((0, 3))
 
@@ -226,7 +381,52 @@ def dict2matrix(params, coo_data_filename, valid_subreddits=None, valid_users=No
         return sparse_to_data_array(data_to_sparse(data))
 
 
-def _dict2matrix_mp(proc_id, counts_filenames, valid_subreddits, valid_users, to_remove=None):
+def load_to_remove_users(params, years=None):
+    """The held out users of validation or test params (see preprocessing.splits), None if there are none."""
+    if (params.validation or params.test) and os.path.exists(get_to_remove_users_filename(params, years)):
+        return load_pickle(get_to_remove_users_filename(params, years), False)
+    return None
+
+
+def dict2split_matrices(params, valid_subreddits, valid_users, splits, years=None, overwrite=False, data=None):
+    """Makes the UxS matrix of every split with one pass over the dictionaries (one dict2matrix).
+
+    All split matrices have the shape and ids of the full matrix, the rows of the users of the other splits are empty.
+    Args:
+        params: parameters of preprocessing that define where to find dictionaries.
+        valid_subreddits: set of subreddits to be considered.
+        valid_users: set of users to be considered.
+        splits: dictionary split name -> set of usernames, as returned by preprocessing.splits.create_user_splits.
+        years: list of all the years we want to take into consideration. If none, it selects all available.
+        overwrite: Boolean that dictates whether to overwrite existing files (if they exist).
+        data: the full UxS COO data of valid_users, if it is already made. Else dict2matrix is run. It is not used
+            for validation or test params: their UxS matrix has the rows of the held out users zeroed (see
+            dict2matrix), so the matrix of all the users is made under its own name.
+    Returns:
+        dictionary split name -> COO data array (as dict2matrix returns).
+    """
+    filenames = dict((split, get_split_uxs_filename(params, years, split)) for split in splits)
+    if all(os.path.exists(f) for f in filenames.values()) and not overwrite:
+        return dict((split, load_array(f, False)) for split, f in filenames.iteritems())
+
+    held_out = params.validation or params.test
+    if data is None or held_out:
+        full_filename = get_split_uxs_filename(params, years, 'full') if held_out else get_uxs_filename(params, years)
+        data = dict2matrix(params, full_filename, valid_subreddits, valid_users, years, overwrite,
+                           to_remove=set())  # the full matrix, with all users
+    users = set_to_dict(valid_users)
+    R, C = len(valid_users), len(valid_subreddits)
+    split_data = {}
+    for split, split_users in splits.iteritems():
+        ids = np.array(sorted(users[u] for u in split_users if u in users))
+        rows = np.in1d(data[:, 0], ids) & (data[:, 2] > 0)
+        split_data[split] = np.vstack((data[rows], [[R - 1, C - 1, 0]]))  # keep the shape of the full matrix
+        print '\t%s: %d users, %d entries' % (split, len(ids), len(split_data[split]) - 1)
+        save_array(filenames[split], split_data[split], False)
+    return split_data
+
+
+def _dict2matrix_mp(proc_id, counts_filenames, valid_subreddits=None, valid_users=None, to_remove=None):
     """ Convert a list of dictionaries into a COO array.
 
     Map splits user-cat in user and cat and returns tuple: (user, cat, count)
@@ -237,31 +437,28 @@ def _dict2matrix_mp(proc_id, counts_filenames, valid_subreddits, valid_users, to
     Args:
         proc_id: id of process
         counts_filenames: filename of dictionaries to be loaded
-        valid_subreddits: set of subreddits to be considered.
-        valid_users: set of users to be considered.
-        to_remove: set of users to be removed if this is a test set.
+        valid_subreddits: set of subreddits to be considered. If None, the published one is used.
+        valid_users: set of users to be considered. If None, the published one is used.
+        to_remove: array of the ids of the users whose counts are zeroed (held out users).
 
     """
-    categories = set_to_dict(valid_subreddits)
-    users = set_to_dict(valid_users)
+    if valid_subreddits is None:
+        valid_subreddits, categories = get_shared('valid_subreddits'), get_shared('subreddits')
+    else:
+        categories = set_to_dict(valid_subreddits)
+    if valid_users is None:
+        valid_users, users = get_shared('valid_users'), get_shared('users')
+    else:
+        users = set_to_dict(valid_users)
     R, C = len(users), len(categories)
     result_data = np.zeros((0, 3))
     for filename in counts_filenames:
         print proc_id, filename
-        counts = load_pickle(filename, False).items()
-        sys.stdout.flush()
-        points = filter(lambda x: x[0] in valid_users and x[1] in valid_subreddits,
-                        map(lambda x: (x[0].split(' ')[0], x[0].split(' ')[1], int(x[1])), counts))
-        data = np.zeros((len(points), 3))
-
-        for i, p in enumerate(points):
-            data[i] = [users[p[0]], categories[p[1]], p[2]]
+        data = _uc_dict2data(filename, valid_subreddits, valid_users, categories, users)
 
         # save the partial array for downweighting later
         if to_remove is not None:
-            for u in to_remove:
-                mask = np.where(data[:, 0] == u)[0]
-                data[mask, 2] = 0
+            data[np.in1d(data[:, 0], to_remove), 2] = 0
         data = np.vstack((data, np.array([R - 1, C - 1, 0])))
         save_filename = filename.replace('uc_dict.pkl', 'UxS_%d.npy' % len(valid_users))
         save_array(save_filename, data, False)
@@ -272,5 +469,128 @@ def _dict2matrix_mp(proc_id, counts_filenames, valid_subreddits, valid_users, to
     return result_data
 
 
+def _uc_dict2data(filename, valid_subreddits, valid_users, categories, users):
+    """Loads a user-category dictionary and returns the (n,3) array of (user_id, subreddit_id, count) of it."""
+    counts = load_pickle(filename, False).items()
+    sys.stdout.flush()
+    points = filter(lambda x: x[0] in valid_users and x[1] in valid_subreddits,
+                    map(lambda x: (x[0].split(' ')[0], x[0].split(' ')[1], int(x[1])), counts))
+    data = np.zeros((len(points), 3))
+
+    for i, p in enumerate(points):
+        data[i] = [users[p[0]], categories[p[1]], p[2]]
+    return data
+
+
+####
+
+
+def get_period(month, period='month'):
+    """Maps a month string ('2015-05') to the time slice it belongs to: '2015-05', '2015-Q2' or '2015'."""
+    if period == 'month':
+        return month
+    if period == 'quarter':
+        return '%s-Q%d' % (month[:4], (int(month[5:7]) - 1) / 3 + 1)
+    if period == 'year':
+        return month[:4]
+    raise ValueError('Unknown period: %s' % period)
+
+
+def dict2tensor(params, tensor_filename, valid_subreddits, valid_users, years=None, period='month', overwrite=False):
+    """Converts dictionaries of user-category counts to a stack of UxS matrices, one per time slice, in one pass.
+
+    All slices share the same user and subreddit ids (those of dict2matrix), so summing them gives the dict2matrix
+    result for the same years.
+    Args:
+        params: parameters of preprocessing that define where to find dictionaries.
+        tensor_filename: path where the stack will be saved.
+        valid_subreddits: set of subreddits to be considered.
+        valid_users: set of users to be considered.
+        years: list of all the years we want to take into consideration. If none, it selects all available.
+        period: size of a time slice: 'month', 'quarter' or 'year'.
+        overwrite: Boolean that dictates whether to overwrite existing file (if it exists).
+    Returns:
+        A dictionary with 'periods' (sorted list of slice names) and 'slices' (list of CSR matrices, one per period).
+    """
+    print '--> Making %s' % tensor_filename,
+
+    if os.path.exists(tensor_filename) and not overwrite:
+        print 'exists'
+        return load_pickle(tensor_filename, False)
+    print
+
+    user_cat_counts_filenames = [f for f in get_all_uc_dict_filenames(params, years) if get_file_month(f) is not None]
+    proc_data_size = int(np.ceil(1. * len(user_cat_counts_filenames) / n_proc))
+
+    publish(valid_subreddits=valid_subreddits, valid_users=valid_users,
+            subreddits=set_to_dict(valid_subreddits), users=set_to_dict(valid_users))
+    results = []
+    pool = mp.Pool(n_proc)
+    for i in range(n_proc):
+        proc_filenames = user_cat_counts_filenames[i * proc_data_size:(i + 1) * proc_data_size]
+        if len(proc_filenames) > 0:
+            pool.apply_async(_dict2tensor_mp, args=(i, proc_filenames, period), callback=results.extend)
+    pool.close()
+    pool.join()
+    unpublish('valid_subreddits', 'valid_users', 'subreddits', 'users')
+
+    period_data = {}
+    for p, data in results:
+        period_data.setdefault(p, []).append(data)
+
+    shape = (len(valid_users), len(valid_subreddits))
+    periods = sorted(period_data)
+    slices = [data_to_sparse(np.vstack(period_data[p]), shape=shape) for p in periods]
+    for p, s in zip(periods, slices):
+        print '\t%s: %d entries, %d posts' % (p, s.nnz, s.sum())
+
+    tensor = {'periods': periods, 'slices': slices}
+    save_pickle(tensor_filename, tensor)
+    return tensor
+
+
+def _dict2tensor_mp(proc_id, counts_filenames, period='month'):
+    """Returns a list of (period, (n,3) data array) tuples, one per user-category dictionary."""
+    valid_subreddits, categories = get_shared('valid_subreddits'), get_shared('subreddits')
+    valid_users, users = get_shared('valid_users'), get_shared('users')
+    result = []
+    for filename in counts_filenames:
+        print proc_id, filename
+        data = _uc_dict2data(filename, valid_subreddits, valid_users, categories, users)
+        result.append((get_period(get_file_month(filename), period), data))
+    sys.stdout.flush()
+    return result
+
+
+def get_window_sum(tensor, start_period, end_period):
+    """Returns the UxS matrix of all slices from start_period to end_period (both inclusive)."""
+    periods = tensor['periods']
+    start = np.searchsorted(periods, start_period, side='left')
+    end = np.searchsorted(periods, end_period, side='right')
+    if end <= start:
+        raise ValueError('No slices between %s and %s' % (start_period, end_period))
+    result = tensor['slices'][start].copy()
+    for s in tensor['slices'][start + 1:end]:
+        result = result + s
+    return result
+
+
+def rolling_window_sums(tensor, window):
+    """Yields (last period, UxS matrix of the last window slices) for every full window.
+
+    Every step adds the newest slice and subtracts the oldest, instead of summing the whole window again."""
+    slices = tensor['slices']
+    if window > len(slices):
+        return
+    current = slices[0].copy()
+    for s in slices[1:window]:
+        current = current + s
+    yield tensor['periods'][window - 1], current
+    for t in range(window, len(slices)):
+        current = current + slices[t] - slices[t - window]
+        current.eliminate_zeros()
+        yield tensor['periods'][t], current
+
+
 if __name__ == '__main__':
     pass
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from util.bpe import train_bpe, BPE, SubwordVocabulary, end_of_word
+
+word_counts = {'hug': 10, 'pug': 5, 'pun': 12, 'bun': 4, 'hugs': 5}
+
+
+class TrainBPETest(unittest.TestCase):
+
+    def test_merge_order(self):
+        merges, _ = train_bpe(word_counts, 4, verbose=False)
+        self.assertEqual(merges, [('p', 'u'), ('h', 'u'), ('pu', 'n' + end_of_word), ('hu', 'g' + end_of_word)])
+
+    def test_symbol_counts(self):
+        merges, symbol_counts = train_bpe(word_counts, 4, verbose=False)
+        self.assertEqual(symbol_counts['pun' + end_of_word], 12)
+        self.assertEqual(symbol_counts['hug' + end_of_word], 10)
+        self.assertEqual(symbol_counts['pu'], 5)  # of pug
+        self.assertEqual(symbol_counts['p'], 0)  # merged away
+        self.assertEqual(sum(len(w) * c for w, c in word_counts.iteritems()),
+                         sum(len(s.replace(end_of_word, '')) * c for s, c in symbol_counts.iteritems()))
+
+    def test_stops_at_min_pair_count(self):
+        merges, _ = train_bpe(word_counts, 100, min_pair_count=6, verbose=False)
+        self.assertEqual(len(merges), 4)
+        merges, _ = train_bpe(word_counts, 100, verbose=False)
+        for word in word_counts:  # every training word ends as one symbol
+            self.assertEqual(BPE(merges).segment(word), [word + end_of_word])
+
+    def test_rare_words_are_not_used(self):
+        merges, _ = train_bpe(dict(word_counts, zzz=1), 100, verbose=False)
+        self.assertNotIn(('z', 'z'), merges)
+
+
+class EncodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.merges, self.symbol_counts = train_bpe(word_counts, 4, verbose=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_segment(self):
+        bpe = BPE(self.merges)
+        self.assertEqual(bpe.segment('hugs'), ['hu', 'g', 's' + end_of_word])
+        self.assertEqual(bpe.segment('pun'), ['pun' + end_of_word])
+        self.assertEqual(bpe.segment('bug'), ['b', 'u', 'g' + end_of_word])  # not in the training words
+        self.assertEqual(bpe.segment(u'h\xfcg'), ['h', u'\xfc', 'g' + end_of_word])
+
+    def test_encode_and_decode(self):
+        vocab = SubwordVocabulary.from_training(self.merges, self.symbol_counts)
+        ids = vocab.encode(['hugs', 'pun', 'bun'])
+        self.assertEqual(len(ids), 3 + 1 + 3)
+        self.assertNotIn(vocab.unk_id, ids)
+        self.assertEqual(vocab.decode(ids), 'hugs pun bun')
+        self.assertEqual(vocab.get_string_encoder()(['hugs', 'pun', 'bun']), [str(i) for i in ids])
+        self.assertIn(vocab.unk_id, vocab.encode(['xyz']))
+
+    def test_save_and_load(self):
+        filename = os.path.join(self.tmp_dir, 'bpe.cnt')
+        vocab = SubwordVocabulary.from_training(self.merges, self.symbol_counts)
+        vocab.save(filename)
+        loaded = SubwordVocabulary.load(filename)
+        self.assertEqual(loaded.bpe.merges, self.merges)
+        self.assertEqual(loaded.encode(['hugs', 'pug']).tolist(), vocab.encode(['hugs', 'pug']).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
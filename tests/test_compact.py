@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from preprocessing.compact import compact_corpus, iter_entries, CompactFile
+from preprocessing.entry_filter import get_entry_filter
+from preprocessing.user_category import json2matrix
+
+users = set(['u1', 'u2', 'u3'])
+subreddits = set(['s1', 's2'])
+
+
+def make_entries(month):
+    entries = []
+    for i in range(40):
+        entries.append({'author': 'u%d' % (i % 5), 'subreddit': 's%d' % (i % 3), 'created_utc': str(month * 1000 + i),
+                        'parent_id': 't3_a' if i % 4 == 0 else 't1_b', 'body': u'post %d \u2603 of %d' % (i, month)})
+    entries[1]['body'] = '[deleted]'
+    entries[2]['author'] = '[deleted]'
+    return entries
+
+
+class CompactTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filenames = []
+        for month in (1, 2):
+            self.filenames.append(os.path.join(self.tmp_dir, 'RC_2015-0%d.json' % month))
+            with open(self.filenames[-1], 'w') as f:
+                for entry in make_entries(month):
+                    f.write(json.dumps(entry) + '\n')
+        self.compact_filenames = compact_corpus(self.filenames, os.path.join(self.tmp_dir, 'compact'), users,
+                                                subreddits, get_entry_filter(None, users, subreddits))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def entries(self, filename, first_level=False):
+        entry_filter = get_entry_filter(None, users, subreddits, first_level)
+        return [(line, e['author'], e['subreddit'], e['body'], int(e['created_utc']), e['parent_id'][:3])
+                for line, e in iter_entries(filename, entry_filter)]
+
+    def test_round_trip(self):
+        for filename, compact_filename in zip(self.filenames, self.compact_filenames):
+            entries = self.entries(filename)
+            self.assertEqual(len(entries), 14)  # 16 of valid users and subreddits, 2 of them deleted
+            self.assertEqual(self.entries(compact_filename), entries)
+            self.assertEqual(self.entries(compact_filename, True), self.entries(filename, True))
+
+    def test_the_files_of_a_corpus_share_the_names(self):
+        files = [CompactFile(f) for f in self.compact_filenames]
+        self.assertIs(files[0].users, files[1].users)
+        self.assertEqual(sorted(files[0].subreddits), sorted(subreddits))
+
+    def test_matrix(self):
+        result_filename = os.path.join(self.tmp_dir, 'uxs.npy')
+        matrix = json2matrix(self.filenames, result_filename, subreddits, users)
+        self.assertEqual(matrix.shape, (3, 2))
+        self.assertEqual(matrix.sum(), 28)
+        compact_matrix = json2matrix(self.compact_filenames, result_filename, subreddits, users, overwrite=True)
+        self.assertTrue((compact_matrix != matrix).nnz == 0)
+        removed = json2matrix(self.compact_filenames, result_filename, subreddits, users, to_remove=set(['u1']),
+                              overwrite=True)
+        self.assertEqual(removed.shape, (3, 2))
+        self.assertEqual(removed[0].sum(), 0)
+        self.assertEqual(removed[1:].sum(), matrix[1:].sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from preprocessing.dedup import MinHasher, find_duplicates, get_dropped_lines
+
+words = ['word%d' % i for i in range(1000)]
+
+
+def random_body(rng, n_words=40):
+    return ' '.join(rng.choice(words) for _ in range(n_words))
+
+
+def write_dump(filename, bodies):
+    with open(filename, 'w') as f:
+        for body in bodies:
+            f.write(json.dumps({'author': 'u1', 'subreddit': 's1', 'body': body}) + '\n')
+
+
+class MinHasherTest(unittest.TestCase):
+
+    def test_signatures(self):
+        hasher = MinHasher()
+        rng = random.Random(0)
+        body = random_body(rng, 200).split()
+        near = body[:195] + random_body(rng, 5).split()
+        shingles = [hasher.get_shingles(w) for w in (body, list(body), near, random_body(rng, 200).split())]
+        signatures = hasher.get_signatures(shingles)
+        self.assertEqual(signatures.shape, (4, 64))
+        self.assertTrue((signatures[0] == signatures[1]).all())
+        self.assertGreater(np.mean(signatures[0] == signatures[2]), 0.8)
+        self.assertLess(np.mean(signatures[0] == signatures[3]), 0.1)
+
+        keys = hasher.get_band_keys(signatures)
+        self.assertEqual(keys.shape, (4, 8))
+        self.assertTrue((keys[0] == keys[1]).all())
+        self.assertFalse((keys[0] == keys[3]).any())
+
+    def test_short_posts_are_one_shingle(self):
+        self.assertEqual(len(MinHasher().get_shingles(['a', 'b'])), 1)
+
+
+class FindDuplicatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.drop_filename = os.path.join(self.tmp_dir, 'duplicates.pkl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_copies_after_the_first_are_dropped(self):
+        rng = random.Random(0)
+        spam = random_body(rng)
+        first = [random_body(rng) for _ in range(20)]
+        first[5] = spam
+        first[9] = 'thanks!'
+        second = [random_body(rng) for _ in range(20)]
+        second[0] = spam.upper()  # normalized to the same words
+        second[3] = spam
+        second[4] = 'thanks!'
+        second[7] = first[2] + ' ' + rng.choice(words)  # near duplicate
+        filenames = [os.path.join(self.tmp_dir, 'RC_2015-0%d.json' % m) for m in (1, 2)]
+        write_dump(filenames[0], first)
+        write_dump(filenames[1], second)
+
+        drop_lines = find_duplicates(filenames[::-1], self.drop_filename, n_partitions=4)
+        self.assertEqual(get_dropped_lines(drop_lines, filenames[0]), set())
+        self.assertEqual(get_dropped_lines(drop_lines, filenames[1]), set([1, 4, 8]))  # lines from 1
+        self.assertEqual(get_dropped_lines(None, filenames[1]), set())
+        self.assertFalse(os.path.exists(self.drop_filename + '.spill'))
+        self.assertEqual(find_duplicates(filenames, self.drop_filename).keys(), drop_lines.keys())  # saved
+
+
+if __name__ == '__main__':
+    unittest.main()
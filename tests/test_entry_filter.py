@@ -0,0 +1,75 @@
+import json
+import unittest
+
+from preprocessing.entry_filter import get_entry_filter, get_line_field, EntryFilter, DateRange
+from preprocessing.parameters import Parameters
+
+
+def make_line(**fields):
+    entry = {'author': 'u1', 'subreddit': 's1', 'body': 'text', 'created_utc': '1420070400', 'parent_id': 't3_a'}
+    entry.update(fields)
+    return json.dumps(entry, separators=(',', ':'))
+
+
+class EntryFilterTest(unittest.TestCase):
+
+    def test_deleted(self):
+        entry_filter = get_entry_filter()
+        self.assertIsNotNone(entry_filter.parse(make_line()))
+        for line in (make_line(body='[deleted]'), make_line(body='[removed]'), make_line(author='[deleted]')):
+            self.assertIsNone(entry_filter.parse(line), line)
+        self.assertEqual(entry_filter.rejections, {'deleted_body': 2, 'deleted_author': 1})
+        self.assertEqual((entry_filter.seen, entry_filter.accepted), (4, 1))
+
+    def test_keep_deleted(self):
+        params = Parameters()
+        params.skip_deleted = False
+        self.assertIsNotNone(get_entry_filter(params).parse(make_line(body='[deleted]')))
+
+    def test_date_range(self):
+        params = Parameters()
+        params.start_utc, params.end_utc = 1000, 2000
+        entry_filter = get_entry_filter(params)
+        accepted = [t for t in (999, 1000, 1999, 2000) if entry_filter.parse(make_line(created_utc=str(t)))]
+        self.assertEqual(accepted, [1000, 1999])
+        self.assertEqual(entry_filter.rejections['date_range'], 2)
+        self.assertTrue(DateRange(end=5).check({'created_utc': 4}))
+
+    def test_valid_users_and_subreddits(self):
+        entry_filter = get_entry_filter(None, set(['u1']), set(['s1']))
+        self.assertIsNotNone(entry_filter.parse(make_line()))
+        self.assertIsNone(entry_filter.parse(make_line(author='u2')))
+        self.assertIsNone(entry_filter.parse(make_line(subreddit='s2')))
+        self.assertIsNone(entry_filter.parse(make_line(author=u'u\xe9')))  # not checked on the line, but decoded
+
+    def test_first_level(self):
+        entry_filter = get_entry_filter(first_level=True)
+        self.assertIsNotNone(entry_filter.parse(make_line()))
+        self.assertIsNone(entry_filter.parse(make_line(parent_id='t1_b')))
+
+    def test_line_checks_agree_with_the_entry_checks(self):
+        lines = [make_line(), make_line(body='[deleted]'), make_line(author='u2'), make_line(subreddit='s2'),
+                 make_line(parent_id='t1_b'), json.dumps({'author': 'u1', 'subreddit': 's1', 'body': '[deleted]',
+                                                          'created_utc': '1', 'parent_id': 't1_b'})]
+        params = Parameters()
+        params.first_level = True
+        entry_filter = get_entry_filter(params, set(['u1']), set(['s1']))
+        for line in lines:
+            expected = all(p.check(json.loads(line)) for p in entry_filter.predicates)
+            self.assertEqual(entry_filter.parse(line) is not None, expected, line)
+            self.assertEqual(entry_filter.check_entry(json.loads(line)) is not None, expected, line)
+
+    def test_line_field(self):
+        line = make_line(author='u1', body='a \\"quote\\"')
+        self.assertEqual(get_line_field(line, 'author'), 'u1')
+        self.assertIsNone(get_line_field(line, 'body'))  # escaped, only checked on the entry
+        self.assertIsNone(get_line_field(line, 'missing'))
+
+    def test_cheaper_predicates_first(self):
+        entry_filter = EntryFilter([DateRange(0, 1)] + get_entry_filter(None, set(['u1'])).predicates)
+        self.assertEqual([p.name for p in entry_filter.predicates],
+                         ['deleted_body', 'deleted_author', 'valid_author', 'date_range'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cPickle as pickle
+
+from util.io import save_pickle, load_pickle, is_valid_artifact, CorruptArtifactError
+
+
+class PickleTruncationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'counts.pkl')
+        self.obj = dict(('user%d' % i, i) for i in range(10000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def truncate(self, size):
+        with open(self.filename, 'r+b') as f:
+            f.truncate(size)
+
+    def test_round_trip(self):
+        save_pickle(self.filename, self.obj)
+        self.assertTrue(is_valid_artifact(self.filename, verify=True))
+        self.assertEqual(load_pickle(self.filename, verify=True), self.obj)
+
+    def test_truncated(self):
+        save_pickle(self.filename, self.obj)
+        size = os.path.getsize(self.filename)
+        for truncated_size in (size - 1, size // 2, 20, 4, 0):
+            self.truncate(truncated_size)
+            self.assertFalse(is_valid_artifact(self.filename), truncated_size)
+            self.assertRaises(CorruptArtifactError, load_pickle, self.filename)
+
+    def test_corrupt(self):
+        save_pickle(self.filename, self.obj)
+        with open(self.filename, 'r+b') as f:
+            f.seek(os.path.getsize(self.filename) // 2)
+            f.write('\xff\xff')
+        self.assertTrue(is_valid_artifact(self.filename))  # the length is right, only the checksum finds it
+        self.assertFalse(is_valid_artifact(self.filename, verify=True))
+
+    def test_pickle_without_header(self):
+        with open(self.filename, 'wb') as f:
+            pickle.dump(self.obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.assertTrue(is_valid_artifact(self.filename))
+        self.assertEqual(load_pickle(self.filename), self.obj)
+        self.truncate(os.path.getsize(self.filename) // 2)
+        self.assertFalse(is_valid_artifact(self.filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
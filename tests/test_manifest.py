@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import preprocessing.config_filenames as config
+from preprocessing.config_filenames import get_all_uc_dict_filenames, get_all_user_dict_filenames, \
+    get_uc_dict_filename, get_user_dict_filename, register_dict_filenames
+from preprocessing.parameters import Parameters
+from util.manifest import get_index_filename, load_manifest, register, query
+
+
+def make_params(min_subscribers, first_level=False):
+    params = Parameters()
+    params.min_subscribers = min_subscribers
+    params.first_level = first_level
+    return params
+
+
+class DictManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.user_cat_dir = config.user_cat_dir
+        config.user_cat_dir = self.tmp_dir
+
+    def tearDown(self):
+        config.user_cat_dir = self.user_cat_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def make_dicts(self, params, json_filename, register=False):
+        for filename in (get_uc_dict_filename(params, json_filename), get_user_dict_filename(params, json_filename)):
+            open(filename, 'w').close()
+        if register:
+            register_dict_filenames(params, json_filename)
+        return get_uc_dict_filename(params, json_filename)
+
+    def test_dicts_made_before_the_manifest_are_found(self):
+        params, other, fl = make_params(50000), make_params(10000), make_params(50000, first_level=True)
+        old = self.make_dicts(params, 'RC_2015-01.json')
+        old_other = self.make_dicts(other, 'RC_2015-01.json')
+        old_fl = self.make_dicts(fl, 'RC_2015-01.json')
+        new = self.make_dicts(params, 'RC_2015-02.json', register=True)  # the directory has a manifest now
+
+        self.assertEqual(get_all_uc_dict_filenames(params), [old, new])
+        self.assertEqual(get_all_uc_dict_filenames(other), [old_other])
+        self.assertEqual(get_all_uc_dict_filenames(fl), [old_fl])
+        self.assertEqual(len(get_all_user_dict_filenames(params, years=[2015])), 2)
+
+        new_other = self.make_dicts(other, 'RC_2015-02.json', register=True)
+        self.assertEqual(get_all_uc_dict_filenames(other), [old_other, new_other])
+
+    def test_dicts_of_other_entry_checks_are_another_group(self):
+        params, keep_deleted = make_params(50000), make_params(50000)
+        keep_deleted.skip_deleted, keep_deleted.start_utc = False, 1420070400
+        old = self.make_dicts(params, 'RC_2015-01.json')
+        old_keep_deleted = self.make_dicts(keep_deleted, 'RC_2015-01.json')
+        self.assertNotEqual(old, old_keep_deleted)
+        self.assertEqual(get_all_uc_dict_filenames(params), [old])
+        self.assertEqual(get_all_uc_dict_filenames(keep_deleted), [old_keep_deleted])
+
+    def test_duplicates_are_not_appended(self):
+        for _ in range(3000):
+            register(self.tmp_dir, [('uc_dict', '1', '2015-01', 'f.pkl')])
+        self.assertEqual(query(self.tmp_dir, 'uc_dict', '1'), [os.path.join(self.tmp_dir, 'f.pkl')])
+        with open(get_index_filename(self.tmp_dir)) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_cached_until_the_index_changes(self):
+        register(self.tmp_dir, [('uc_dict', '1', '2015-01', 'a.pkl')])
+        manifest = load_manifest(self.tmp_dir)
+        self.assertIs(load_manifest(self.tmp_dir), manifest)
+        register(self.tmp_dir, [('uc_dict', '1', '2015-02', 'b.pkl')])
+        self.assertEqual(len(query(self.tmp_dir, 'uc_dict', '1')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
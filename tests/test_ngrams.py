@@ -0,0 +1,53 @@
+import unittest
+
+from util.ngrams import NgramCounter, merge_ngram_counts, combine_top_ngrams, top_ngrams
+
+
+class NgramCounterTest(unittest.TestCase):
+
+    def test_counts_of_the_ngrams_seen_twice(self):
+        counter = NgramCounter((2, 3))
+        counter.add('a b c a b'.split())
+        counter.add('a b c'.split())
+        self.assertEqual(counter.get_counts(), {'a b': 3, 'b c': 2, 'a b c': 2})
+
+    def test_groups_share_one_counter(self):
+        counter = NgramCounter((2,), max_size=1000)
+        for subreddit in ('s%d' % i for i in range(100)):
+            counter.add('x y x y'.split(), subreddit)
+        counter.add('x y'.split(), 's0')
+        group_counts = counter.get_group_counts()
+        self.assertEqual(len(group_counts), 100)
+        self.assertEqual(group_counts['s0'], {'x y': 3})
+        self.assertEqual(group_counts['s1'], {'x y': 2})
+
+    def test_pruning_bounds_the_size(self):
+        counter = NgramCounter((2,), max_size=100)
+        for i in range(1000):
+            counter.add(['w%d' % i, 'v%d' % i])
+            counter.add(['frequent', 'pair'])
+        self.assertLessEqual(len(counter.counts), 100)
+        count = counter.get_counts()['frequent pair']
+        self.assertTrue(1000 - counter.error <= count <= 1000, (count, counter.error))
+
+
+class MergeNgramCountsTest(unittest.TestCase):
+
+    def test_partitions_merge_to_the_total(self):
+        workers = []
+        for sentences in (['a b a b', 'c d'], ['a b c d', 'c d']):
+            counter, subreddit_counter = NgramCounter((2,)), NgramCounter((2,))
+            for sentence in sentences:
+                counter.add(sentence.split())
+                subreddit_counter.add(sentence.split(), 's1')
+            workers.append((counter.get_partitions(3), subreddit_counter.get_group_counts()))
+        merged = [merge_ngram_counts(workers, p, 3, 10) for p in range(3)]
+        top = combine_top_ngrams([m[0] for m in merged], 10)
+        # 'a b' and 'c d' occur 3 times, but once in a worker that is not merged
+        self.assertEqual(top, {2: [('c d', 2), ('a b', 2)]})
+        subreddit_tops = dict(kv for m in merged for kv in m[1].iteritems())
+        self.assertEqual(subreddit_tops['s1'], top_ngrams({'a b': 2, 'c d': 2}, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
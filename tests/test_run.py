@@ -0,0 +1,44 @@
+import unittest
+
+from preprocessing.run import make_grid, plan_runs, get_required_stages
+
+
+def plan_stages(grid, requested_stages):
+    return [stage for stage, _ in plan_runs(grid, requested_stages)]
+
+
+class PlanTest(unittest.TestCase):
+
+    def test_dependencies_in_order(self):
+        grid = make_grid([50000], [100], [25000], [10])
+        self.assertEqual(get_required_stages(['vocab'], grid[0]), ['dicts', 'user_counts', 'users', 'vocab'])
+        self.assertEqual(plan_stages(grid, ['splits']), ['dicts', 'user_counts', 'users', 'matrix', 'splits'])
+
+    def test_shared_steps(self):
+        grid = make_grid([50000], [100, 200], [10000, 25000], [10])
+        plan = plan_runs(grid, ['vocab'])
+        self.assertEqual([s for s, _ in plan], ['dicts', 'user_counts', 'users', 'users'] + ['vocab'] * 4)
+
+    def test_dedup_only_with_deduplicate(self):
+        self.assertNotIn('dedup', plan_stages(make_grid([50000], [100], [25000], [10]), ['vocab']))
+        grid = make_grid([50000], [100], [25000], [10], deduplicate=True)
+        stages = plan_stages(grid, ['vocab'])
+        self.assertLess(stages.index('dedup'), stages.index('vocab'))
+        self.assertNotIn('dedup', plan_stages(grid, ['matrix']))
+
+    def test_compact_before_the_stages_that_read_it(self):
+        grid = make_grid([50000], [100], [25000], [10], compact=True)
+        for requested in (['vocab'], ['matrix']):
+            stages = plan_stages(grid, requested)
+            self.assertLess(stages.index('compact'), stages.index(requested[0]))
+        dated = make_grid([50000], [100], [25000], [10], dated_subreddits=True, compact=True)
+        self.assertNotIn('compact', plan_stages(dated, ['matrix']))  # the dated matrix is made from the dictionaries
+        self.assertNotIn('compact', plan_stages(make_grid([50000], [100], [25000], [10]), ['vocab']))
+
+    def test_entry_checks_are_not_shared(self):
+        grid = make_grid([50000], [100], [25000], [10]) + make_grid([50000], [100], [25000], [10], start_utc=1)
+        self.assertEqual(plan_stages(grid, ['users']), ['dicts'] * 2 + ['user_counts'] * 2 + ['users'] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
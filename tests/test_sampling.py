@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+import scipy.sparse as sparse
+
+from preprocessing.parameters import Parameters
+from util.sampling import get_rng, to_count_arrays, bernoulli_sample, uniform_sample, get_stratum_sizes, \
+    stratified_sample, get_activity_strata, get_top_subreddit_strata, reservoir_sample
+
+
+class SamplingTest(unittest.TestCase):
+
+    def test_rng_of_params_and_salt(self):
+        params = Parameters()
+        self.assertEqual(get_rng(params, 'control', 1).randint(1 << 30, size=5).tolist(),
+                         get_rng(params, 'control', 1).randint(1 << 30, size=5).tolist())
+        self.assertNotEqual(get_rng(params, 'control', 1).randint(1 << 30, size=5).tolist(),
+                            get_rng(params, 'control', 2).randint(1 << 30, size=5).tolist())
+
+    def test_count_arrays(self):
+        keys, counts = to_count_arrays({'a': 1, 'b': 2})
+        self.assertEqual(dict(zip(keys, counts)), {'a': 1, 'b': 2})
+
+    def test_bernoulli_and_uniform(self):
+        rng = np.random.RandomState(0)
+        mask = np.arange(1000) % 2 == 0
+        sample = bernoulli_sample(1000, 0.5, rng, mask)
+        self.assertTrue(mask[sample].all())
+        self.assertAlmostEqual(len(sample), 250, delta=50)
+        sample = uniform_sample(np.arange(10, 110), 20, rng)
+        self.assertEqual(len(np.unique(sample)), 20)
+        self.assertTrue(((sample >= 10) & (sample < 110)).all())
+        self.assertEqual(uniform_sample([3, 1, 2], 5, rng).tolist(), [1, 2, 3])
+
+    def test_stratum_sizes(self):
+        self.assertEqual(get_stratum_sizes([50, 30, 20], 10).tolist(), [5, 3, 2])
+        self.assertEqual(get_stratum_sizes([1, 1, 1], 2).sum(), 2)
+        self.assertEqual(get_stratum_sizes([2, 50, 50], 30, equal=True).tolist(), [2, 14, 14])
+        self.assertEqual(get_stratum_sizes([2, 3], 100, equal=True).tolist(), [2, 3])
+
+    def test_stratified_sample(self):
+        strata = np.repeat([0, 1, 2], [500, 300, 200])
+        sample = stratified_sample(strata, 100, np.random.RandomState(0))
+        self.assertEqual(len(np.unique(sample)), 100)
+        self.assertEqual(np.bincount(strata[sample]).tolist(), [50, 30, 20])
+        equal = stratified_sample(strata, 90, np.random.RandomState(0), equal=True, mask=strata > 0)
+        self.assertEqual(np.bincount(strata[equal], minlength=3).tolist(), [0, 45, 45])
+        self.assertEqual(stratified_sample(strata, 100, np.random.RandomState(0)).tolist(), sample.tolist())
+
+    def test_strata(self):
+        self.assertEqual(get_activity_strata([10, 50, 99, 100, 6000]).tolist(), [0, 1, 1, 2, 5])
+        uxs = sparse.csr_matrix(np.array([[1, 5, 0], [0, 0, 0], [2, 0, 1]]))
+        self.assertEqual(get_top_subreddit_strata(uxs).tolist(), [1, -1, 0])
+
+    def test_reservoir_sample(self):
+        rng = np.random.RandomState(0)
+        self.assertEqual(sorted(reservoir_sample(xrange(3), 5, rng)), [0, 1, 2])
+        self.assertEqual(reservoir_sample(xrange(3), 0, rng), [])
+        hits = np.zeros(20)
+        for _ in range(2000):
+            sample = reservoir_sample(xrange(20), 5, rng)
+            self.assertEqual(len(set(sample)), 5)
+            hits[sample] += 1
+        self.assertTrue(np.allclose(hits / 2000., 0.25, atol=0.05), hits)  # every item with probability 5 / 20
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import shutil
+import tempfile
+import unittest
+
+import preprocessing.config_filenames as config
+from preprocessing.parameters import Parameters
+from preprocessing.splits import create_user_splits, get_split_ids, get_user_splitter, split_names
+from preprocessing.user_category import load_to_remove_users
+
+users = set('user%d' % i for i in range(2000))
+
+
+class SplitsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.valid_dir = config.valid_dir
+        config.valid_dir = self.tmp_dir
+
+    def tearDown(self):
+        config.valid_dir = self.valid_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def test_disjoint_and_complete(self):
+        splits = create_user_splits(Parameters(), users, [2015])
+        self.assertEqual(set.union(*splits.values()), users)
+        self.assertEqual(sum(len(s) for s in splits.values()), len(users))
+        for split, fraction in (('validation', 0.1), ('test', 0.1), ('train', 0.8)):
+            self.assertAlmostEqual(len(splits[split]) / float(len(users)), fraction, delta=0.03)
+
+    def test_deterministic_for_a_seed(self):
+        params = Parameters()
+        splits = create_user_splits(params, users, [2015])
+        self.assertEqual(create_user_splits(params, users, [2015], overwrite=True), splits)
+        ids = get_split_ids(sorted(users), params)
+        for i, split in enumerate(split_names):
+            self.assertEqual(set(u for u, s in zip(sorted(users), ids) if s == i), splits[split])
+
+        other = Parameters()
+        other.seed = 1
+        other_splits = create_user_splits(other, users, [2015])
+        self.assertNotEqual(other_splits['test'], splits['test'])
+        self.assertEqual(create_user_splits(params, users, [2015]), splits)  # not overwritten by the other seed
+
+    def test_to_remove_users_of_the_splits(self):
+        params = Parameters()
+        splits = create_user_splits(params, users, [2015])
+        self.assertIsNone(load_to_remove_users(params, [2015]))  # train params keep every user
+        params.validation = True
+        self.assertEqual(load_to_remove_users(params, [2015]), splits['validation'] | splits['test'])
+        self.assertIsNone(load_to_remove_users(params, [2016]))
+        other = Parameters()
+        other.validation, other.test_fraction = True, 0.2
+        self.assertIsNone(load_to_remove_users(other, [2015]))
+
+    def test_post_splitter(self):
+        params = Parameters()
+        params.split_by = 'post'
+        splitter = get_user_splitter(params)
+        self.assertEqual(splitter('user1', 'a line'), splitter('user2', 'a line'))
+        params.split_by = 'subreddit'
+        self.assertRaises(ValueError, get_user_splitter, params)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from preprocessing.subreddit_popularity import parse_subscriber_page, parse_subscriber_pages, \
+    crawl_subreddit_subscribers, make_requests_fetcher, start_ranking_server, TokenBucket
+from util.io import load_pickle
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ranking')
+
+page_0 = {'AskReddit': 9567012, 'funny': 9018375, 'pics': 8734002, 'todayilearned': 8501119, 'worldnews': 8392504}
+page_100 = {'Fitness': 1204377, 'gadgets': 1198010, '3Dprinting': 999, 'news': 998}
+
+
+def read_fixture(name):
+    with open(os.path.join(fixture_dir, name), 'rb') as f:
+        return f.read()
+
+
+class ParseSubscriberPageTest(unittest.TestCase):
+
+    def test_page(self):
+        self.assertEqual(parse_subscriber_page(read_fixture('offset_0.html')), page_0)
+        self.assertEqual(parse_subscriber_page(read_fixture('offset_100.html')), page_100)
+
+    def test_link_after_comment_or_span(self):
+        subscribers = parse_subscriber_page(read_fixture('offset_0.html'))
+        self.assertEqual(subscribers['funny'], 9018375)
+        self.assertEqual(subscribers['pics'], 8734002)
+
+    def test_link_nested_in_the_cell(self):
+        self.assertEqual(parse_subscriber_page(read_fixture('offset_100.html'))['news'], 998)
+
+    def test_navigation_links_are_not_subreddits(self):
+        self.assertNotIn('all', parse_subscriber_page(read_fixture('offset_0.html')))
+
+    def test_page_without_rows(self):
+        self.assertEqual(parse_subscriber_page(read_fixture('empty.html')), {})
+
+    def test_many_pages(self):
+        names = ['offset_0.html', 'offset_100.html', 'empty.html']
+        self.assertEqual(parse_subscriber_pages([os.path.join(fixture_dir, n) for n in names], processes=2),
+                         [page_0, page_100, {}])
+
+
+class CrawlerTest(unittest.TestCase):
+    """Crawls the fixture pages from the local stand-in server."""
+
+    def setUp(self):
+        self.server, self.base_url = start_ranking_server(fixture_dir)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'pages')
+        self.dict_filename = os.path.join(self.tmp_dir, 'subscribers.pkl')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def crawl(self, fetcher=None, subreddit_limit=200):
+        return crawl_subreddit_subscribers(subreddit_limit, {}, self.dict_filename, fetcher or make_requests_fetcher(),
+                                           self.base_url, n_threads=2, pages_per_sec=100, cache_dir=self.cache_dir)
+
+    def test_crawl(self):
+        expected = dict(page_0, **page_100)
+        self.assertEqual(self.crawl(), expected)
+        self.assertEqual(load_pickle(self.dict_filename), expected)
+        self.assertEqual(sorted(self.server.paths), ['/offset/0', '/offset/100'])
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['offset_0.html', 'offset_100.html'])
+
+    def test_cached_pages_are_not_downloaded_again(self):
+        self.crawl()
+        del self.server.paths[:]
+        self.assertEqual(self.crawl(), dict(page_0, **page_100))
+        self.assertEqual(self.server.paths, [])
+
+    def test_resume(self):
+        fetch = make_requests_fetcher()
+
+        def fail_second_page(url_str):
+            if url_str.endswith('/offset/100'):
+                raise IOError('connection reset')
+            return fetch(url_str)
+
+        self.assertRaises(IOError, self.crawl, fail_second_page)
+        self.assertEqual(os.listdir(self.cache_dir), ['offset_0.html'])
+        self.assertFalse(os.path.exists(self.dict_filename))
+
+        del self.server.paths[:]
+        self.assertEqual(self.crawl(), dict(page_0, **page_100))
+        self.assertEqual(self.server.paths, ['/offset/100'])  # the first page came from the cache
+
+    def test_missing_page(self):
+        self.assertRaises(Exception, self.crawl, None, 300)  # there is no offset 200 page
+        self.assertNotIn('offset_200.html', os.listdir(self.cache_dir))
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_rate(self):
+        bucket = TokenBucket(20, capacity=2)
+        start = time.time()
+        bucket.acquire()
+        bucket.acquire()
+        self.assertLess(time.time() - start, 0.04)  # the capacity is available at once
+        for _ in range(4):
+            bucket.acquire()
+        self.assertGreaterEqual(time.time() - start, 4 / 20. - 0.01)
+
+    def test_crawl_rate(self):
+        server, base_url = start_ranking_server(fixture_dir)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            start = time.time()
+            crawl_subreddit_subscribers(200, {}, os.path.join(tmp_dir, 'subscribers.pkl'), make_requests_fetcher(),
+                                        base_url, n_threads=1, pages_per_sec=5, cache_dir=tmp_dir)
+            self.assertGreaterEqual(time.time() - start, 1 / 5. - 0.01)  # one token at once, the second after 0.2 s
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
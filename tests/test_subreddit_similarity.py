@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.sparse as sparse
+
+from preprocessing.subreddit_similarity import uxs2cooccurrence, cosine_similarity, pmi, top_k_neighbors
+
+counts = np.array([[2, 0, 1, 0, 0],
+                   [1, 1, 0, 0, 3],
+                   [0, 4, 1, 0, 1],
+                   [0, 0, 0, 0, 1]])
+
+
+class CooccurrenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'cooccurrence.pkl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_blocks_of_subreddits(self):
+        binary = (counts > 0).astype(int)
+        for block_size in (1, 2, 5, 10):
+            result = uxs2cooccurrence(sparse.csr_matrix(counts), self.filename, block_size=block_size,
+                                      overwrite=True)
+            self.assertEqual(result.shape, (5, 5))
+            self.assertTrue((result.toarray() == binary.T.dot(binary)).all(), block_size)
+        result = uxs2cooccurrence(sparse.csr_matrix(counts), self.filename, binary=False, block_size=2,
+                                  overwrite=True)
+        self.assertTrue((result.toarray() == counts.T.dot(counts)).all())
+
+    def test_no_subreddits(self):
+        result = uxs2cooccurrence(sparse.csr_matrix((4, 0)), self.filename)
+        self.assertEqual(result.shape, (0, 0))
+
+    def test_the_input_is_not_changed(self):
+        uxs = sparse.csr_matrix(counts)
+        uxs2cooccurrence(uxs, self.filename)
+        self.assertTrue((uxs.toarray() == counts).all())
+
+
+class SimilarityTest(unittest.TestCase):
+
+    def setUp(self):
+        binary = (counts > 0).astype(float)
+        self.cooccurrence = sparse.csr_matrix(binary.T.dot(binary))
+
+    def test_cosine(self):
+        similarity = cosine_similarity(self.cooccurrence).toarray()
+        self.assertTrue(np.allclose(np.diag(similarity)[[0, 1, 2, 4]], 1))
+        self.assertAlmostEqual(similarity[1, 4], 2 / np.sqrt(2 * 3))
+
+    def test_pmi(self):
+        values = pmi(self.cooccurrence, 4, positive=False).toarray()
+        self.assertAlmostEqual(values[0, 2], np.log(1 * 4. / (2 * 2)))
+        self.assertAlmostEqual(values[1, 4], np.log(2 * 4. / (2 * 3)))
+        self.assertEqual(pmi(self.cooccurrence, 4)[0, 2], 0)  # log(1) is dropped by PPMI
+
+    def test_top_k_neighbors(self):
+        neighbors, scores = top_k_neighbors(cosine_similarity(self.cooccurrence), k=2)
+        self.assertEqual(neighbors[1, 0], 4)
+        self.assertEqual(set(neighbors[0]), set([1, 2]))
+        self.assertEqual(neighbors[3].tolist(), [-1, -1])
+        self.assertTrue((scores[:, 0] >= scores[:, 1]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
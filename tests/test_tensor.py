@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import preprocessing.config_filenames as config
+from preprocessing.config_filenames import get_uc_dict_filename
+from preprocessing.parameters import Parameters
+from preprocessing.user_category import get_period, dict2tensor, get_window_sum, rolling_window_sums
+from util.io import save_pickle
+
+# 'user subreddit' -> count of every month, u3 and s3 are not valid
+months = {'2015-01': {'u1 s1': 2, 'u2 s2': 1, 'u3 s1': 5, 'u1 s3': 4},
+          '2015-02': {'u1 s1': 1},
+          '2015-04': {'u2 s1': 3}}
+
+
+def to_lists(matrix):
+    return matrix.toarray().astype(int).tolist()
+
+
+class TensorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.user_cat_dir = config.user_cat_dir
+        config.user_cat_dir = self.tmp_dir
+        self.params = Parameters()
+        for month, counts in months.items():
+            save_pickle(get_uc_dict_filename(self.params, 'RC_%s.json' % month), counts)
+        self.tensor_filename = os.path.join(self.tmp_dir, 'tensor.pkl')
+
+    def tearDown(self):
+        config.user_cat_dir = self.user_cat_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def make_tensor(self, period='month', overwrite=False):
+        return dict2tensor(self.params, self.tensor_filename, set(['s1', 's2']), set(['u1', 'u2']), period=period,
+                           overwrite=overwrite)
+
+    def test_period(self):
+        self.assertEqual([get_period('2015-05', p) for p in ('month', 'quarter', 'year')],
+                         ['2015-05', '2015-Q2', '2015'])
+        self.assertEqual(get_period('2015-12', 'quarter'), '2015-Q4')
+        self.assertRaises(ValueError, get_period, '2015-05', 'week')
+
+    def test_slices(self):
+        tensor = self.make_tensor()
+        self.assertEqual(tensor['periods'], ['2015-01', '2015-02', '2015-04'])
+        self.assertEqual([to_lists(s) for s in tensor['slices']],
+                         [[[2, 0], [0, 1]], [[1, 0], [0, 0]], [[0, 0], [3, 0]]])
+        self.assertEqual(self.make_tensor()['periods'], tensor['periods'])  # loaded
+
+        tensor = self.make_tensor('quarter', overwrite=True)
+        self.assertEqual(tensor['periods'], ['2015-Q1', '2015-Q2'])
+        self.assertEqual([to_lists(s) for s in tensor['slices']], [[[3, 0], [0, 1]], [[0, 0], [3, 0]]])
+
+    def test_window_sums(self):
+        tensor = self.make_tensor()
+        self.assertEqual(to_lists(get_window_sum(tensor, '2015-02', '2015-04')), [[1, 0], [3, 0]])
+        self.assertEqual(to_lists(get_window_sum(tensor, '2015-01', '2015-12')), [[3, 0], [3, 1]])
+        self.assertRaises(ValueError, get_window_sum, tensor, '2015-03', '2015-03')
+
+        sums = [(p, to_lists(m)) for p, m in rolling_window_sums(tensor, 2)]
+        self.assertEqual(sums, [('2015-02', [[3, 0], [0, 1]]), ('2015-04', [[1, 0], [3, 0]])])
+        for p, m in rolling_window_sums(tensor, 2):
+            start = tensor['periods'][tensor['periods'].index(p) - 1]
+            self.assertEqual(to_lists(m), to_lists(get_window_sum(tensor, start, p)))
+        self.assertEqual(list(rolling_window_sums(tensor, 4)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import preprocessing.text as text
+from preprocessing.config_filenames import get_split_filename
+from preprocessing.text import text2ids
+from util.io import load_sparse
+from util.term_matrix import TermMatrixBuilder
+from util.vocabulary import Vocabulary
+
+posts = [((1, 2), '1 2 2'), ((2, 1), '3'), ((1, 2), '2 4\t1'), ((3, 1), '4 4 4 1')]
+
+
+def split_sentences(text):
+    return [s.split() for s in text.split('.')]
+
+
+class TermMatrixBuilderTest(unittest.TestCase):
+
+    def get_dense(self, buffer_size):
+        builder = TermMatrixBuilder((3, 2), 4, buffer_size)
+        for rows, ids in posts:
+            builder.add(rows, ids, len(ids.split()))
+        return [m.toarray().tolist() for m in builder.get_matrices()]
+
+    def test_counts(self):
+        users, subreddits = self.get_dense(1000)
+        self.assertEqual(users, [[2, 3, 0, 1], [0, 0, 1, 0], [1, 0, 0, 3]])
+        self.assertEqual(subreddits, [[1, 0, 1, 3], [2, 3, 0, 1]])
+
+    def test_buffer_size_does_not_change_the_counts(self):
+        self.assertEqual(self.get_dense(1), self.get_dense(1000))
+        self.assertEqual(self.get_dense(3), self.get_dense(1000))
+
+    def test_empty(self):
+        matrices = TermMatrixBuilder((3, 2), 4).get_matrices()
+        self.assertEqual([m.shape for m in matrices], [(3, 4), (2, 4)])
+        self.assertEqual([m.nnz for m in matrices], [0, 0])
+        self.assertEqual(matrices[0].dtype, np.int32)
+
+
+class Text2IdsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tokenize_sent_words = text.tokenize_sent_words
+        text.tokenize_sent_words = split_sentences
+        self.text_filename = os.path.join(self.tmp_dir, 'text.txt')
+        with io.open(self.text_filename, 'w', encoding='utf-8') as f:
+            f.write(u'u1\ts1\ta b. b\nu2\ts2\tc x\nu1\ts2\t \nu2\ts1\ta\n')
+        self.vocab = Vocabulary(np.array(['<unk>', 'a', 'b', 'c']))
+        self.matrix_filenames = [os.path.join(self.tmp_dir, 'uxw.npz'), os.path.join(self.tmp_dir, 'sxw.npz')]
+
+    def tearDown(self):
+        text.tokenize_sent_words = self.tokenize_sent_words
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ids_and_term_matrices(self):
+        id_filename = os.path.join(self.tmp_dir, 'ids.txt')
+        text2ids(self.text_filename, id_filename, self.vocab, set(['u1', 'u2']), set(['s1', 's2']),
+                 term_matrix_filenames=self.matrix_filenames)
+        with open(id_filename) as f:
+            self.assertEqual(f.read(), '1\t1\t2 3\t3\n2\t2\t4 1\n2\t1\t2\n')  # the empty post is dropped
+        users, subreddits = [load_sparse(f, verbose=False).toarray().tolist() for f in self.matrix_filenames]
+        self.assertEqual(users, [[0, 1, 2, 0], [1, 1, 0, 1]])
+        self.assertEqual(subreddits, [[0, 2, 2, 0], [1, 0, 0, 1]])
+
+    def test_only_train_posts_are_counted(self):
+        id_filename = os.path.join(self.tmp_dir, 'ids.txt')
+        text2ids(self.text_filename, id_filename, self.vocab, set(['u1', 'u2']), set(['s1', 's2']),
+                 splitter=lambda user, line: 0 if user == 'u1' else 2, term_matrix_filenames=self.matrix_filenames)
+        with open(get_split_filename(id_filename, 'test')) as f:
+            self.assertEqual(f.read(), '2\t2\t4 1\n2\t1\t2\n')
+        self.assertEqual(os.path.getsize(get_split_filename(id_filename, 'validation')), 0)
+        users = load_sparse(self.matrix_filenames[0], verbose=False).toarray().tolist()
+        self.assertEqual(users, [[0, 1, 2, 0], [0, 0, 0, 0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import preprocessing.text as text
+from preprocessing.text import json2vocab, load_ngrams
+
+
+def write_dump(filename, entries):
+    with open(filename, 'w') as f:
+        for entry in entries:
+            entry = dict({'subreddit': 's1', 'created_utc': '1420070400', 'parent_id': 't3_a'}, **entry)
+            f.write(json.dumps(entry) + '\n')
+
+
+def split_tokens(entry):
+    if 'broken' in entry['body']:
+        raise ValueError('cannot tokenize')
+    return entry['body'].split()
+
+
+class Json2VocabTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.entry_to_tokens = text.entry_to_tokens
+        text.entry_to_tokens = split_tokens  # the workers are forked, they see it too
+
+    def tearDown(self):
+        text.entry_to_tokens = self.entry_to_tokens
+        shutil.rmtree(self.tmp_dir)
+
+    def test_an_entry_that_fails_is_skipped(self):
+        filenames = [os.path.join(self.tmp_dir, 'RC_2015-0%d.json' % m) for m in (1, 2)]
+        write_dump(filenames[0], [{'author': 'u1', 'body': 'a b a'}, {'author': 'u1', 'body': 'broken a'},
+                                  {'author': 'u2', 'body': 'c a'}])
+        write_dump(filenames[1], [{'author': 'u2', 'body': 'b'}])
+        vocab = json2vocab(filenames, os.path.join(self.tmp_dir, 'vocab.cnt'), 10, set(['u1', 'u2']), set(['s1']))
+        counts = dict(zip(vocab.tokens, vocab.counts))
+        self.assertEqual((counts['a'], counts['b'], counts['c']), (3, 2, 1))
+        self.assertNotIn('broken', counts)
+
+    def test_ngrams_of_every_subreddit(self):
+        filename = os.path.join(self.tmp_dir, 'RC_2015-01.json')
+        write_dump(filename, [{'author': 'u1', 'body': 'a b c', 'subreddit': s} for s in ('s1', 's1', 's2')])
+        vocab_filename = os.path.join(self.tmp_dir, 'vocab.cnt')
+        json2vocab([filename], vocab_filename, 10, set(['u1']), set(['s1', 's2']), ngram_orders=(2,))
+        self.assertEqual(dict(load_ngrams(vocab_filename, 2).iteritems()), {'a b': 3, 'b c': 3})
+        self.assertEqual(dict(load_ngrams(vocab_filename, 2, 's1').iteritems()), {'a b': 2, 'b c': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import preprocessing.config_filenames as config
+from preprocessing.threads import json2threads, json2thread_index, load_thread_index, reddit_id_to_int, \
+    get_first_level_mask, get_parent_rows, get_children, get_depths, get_thread_stats
+from preprocessing.user_category import json2reply_matrix
+
+# (id, parent, author) of the comments of every month, submissions are t3_
+months = {'2015-01': [('a1', 't3_x', 'u1'), ('a2', 't1_a1', 'u2'), ('a3', 't1_a2', 'u1'), ('a4', 't1_a1', 'u3')],
+          '2015-02': [('b1', 't1_a1', 'u2'), ('b2', 't1_b1', 'u2'), ('b3', 't1_a4', 'u1')]}
+
+
+def write_months(dir_name):
+    filenames = []
+    for month, comments in sorted(months.items()):
+        filenames.append(os.path.join(dir_name, 'RC_%s.json' % month))
+        with open(filenames[-1], 'w') as f:
+            for comment_id, parent_id, author in comments:
+                f.write(json.dumps({'id': comment_id, 'parent_id': parent_id, 'link_id': 't3_x', 'author': author,
+                                    'created_utc': '1420070400', 'subreddit': 's1'}) + '\n')
+    return filenames
+
+
+class ThreadIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = config.data_dir
+        config.data_dir = self.tmp_dir
+        self.filenames = write_months(self.tmp_dir)
+
+    def tearDown(self):
+        config.data_dir = self.data_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def test_index(self):
+        index = json2thread_index(self.filenames[0])
+        self.assertEqual(reddit_id_to_int('t1_a1'), int('a1', 36))
+        self.assertEqual(index['ids'].tolist(), [int(c, 36) for c in ('a1', 'a2', 'a3', 'a4')])
+        self.assertEqual(index['parent_ids'][1], int('a1', 36))
+        self.assertEqual(index['author_names'].tolist(), ['u1', 'u2', 'u3'])
+        self.assertEqual(index['authors'].tolist(), [0, 1, 0, 2])
+        self.assertEqual(get_first_level_mask(index).tolist(), [True, False, False, False])
+
+    def test_tree_of_a_month(self):
+        index = json2thread_index(self.filenames[0])
+        self.assertEqual(get_parent_rows(index).tolist(), [-1, 0, 1, 0])
+        offsets, children = get_children(index)
+        self.assertEqual(offsets.tolist(), [0, 2, 3, 3, 3])
+        self.assertEqual(children.tolist(), [1, 3, 2])
+        self.assertEqual(get_depths(index).tolist(), [0, 1, 2, 1])
+        stats = get_thread_stats(index)
+        self.assertEqual((stats['depth_counts'].tolist(), stats['unresolved']), ([1, 2, 1], 0))
+        self.assertEqual(stats['thread_sizes'].tolist(), [4])
+
+    def test_parents_in_an_older_month(self):
+        index = json2thread_index(self.filenames[1])
+        self.assertEqual(get_parent_rows(index).tolist(), [-2, 0, -2])
+        self.assertEqual(get_depths(index).tolist(), [-1, -1, -1])
+        self.assertEqual(get_thread_stats(index)['unresolved'], 3)
+
+    def test_saved_index(self):
+        json2threads(self.filenames)
+        for filename in self.filenames:
+            self.assertEqual(load_thread_index(filename)['ids'].tolist(), json2thread_index(filename)['ids'].tolist())
+
+
+class ReplyMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = config.data_dir
+        config.data_dir = self.tmp_dir
+        self.filenames = write_months(self.tmp_dir)
+        self.result_filename = os.path.join(self.tmp_dir, 'replies.pkl')
+
+    def tearDown(self):
+        config.data_dir = self.data_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def test_replies_across_months(self):
+        json2threads(self.filenames)
+        users = set(['u1', 'u2'])
+        replies = json2reply_matrix(self.filenames, self.result_filename, users)
+        self.assertEqual(replies.toarray().tolist(), [[0, 1], [2, 0]])  # u2 replied to a1 of u1 a month later
+        replies = json2reply_matrix(self.filenames, self.result_filename, users, self_replies=True, overwrite=True)
+        self.assertEqual(replies.toarray().tolist(), [[0, 1], [2, 1]])
+        replies = json2reply_matrix(self.filenames, self.result_filename, users, max_lag=0, overwrite=True)
+        self.assertEqual(replies.toarray().tolist(), [[0, 1], [1, 0]])
+
+    def test_a_month_without_thread_index_raises(self):
+        json2threads(self.filenames[:1])
+        self.assertRaises(EnvironmentError, json2reply_matrix, self.filenames, self.result_filename, set(['u1', 'u2']))
+        self.assertFalse(os.path.exists(self.result_filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import shutil
+import tempfile
+import unittest
+
+import preprocessing.config_filenames as config
+from preprocessing.config_filenames import get_user_dict_filename, register_dict_filenames
+from preprocessing.parameters import Parameters
+from preprocessing.user_activity import create_user_activity, get_active_matrix, get_users_active_in, \
+    get_user_months
+from util.io import save_pickle
+
+months = ['2014-%02d' % m for m in range(1, 13)]
+active_months = {'u1': months, 'u2': months[::3], 'u3': months[8:], 'u4': []}
+
+
+class UserActivityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dirs = config.data_dir, config.user_cat_dir
+        config.data_dir = config.user_cat_dir = self.tmp_dir
+        self.params = Parameters()
+        for month in months:
+            json_filename = 'RC_%s.json' % month
+            save_pickle(get_user_dict_filename(self.params, json_filename),
+                        dict((u, 1) for u, m in active_months.iteritems() if month in m))
+            register_dict_filenames(self.params, json_filename)
+
+    def tearDown(self):
+        config.data_dir, config.user_cat_dir = self.dirs
+        shutil.rmtree(self.tmp_dir)
+
+    def test_months_of_every_user(self):
+        activity = create_user_activity(self.params, set(active_months), [2014])
+        self.assertEqual(activity['months'], months)
+        for user, user_months in active_months.iteritems():
+            self.assertEqual(get_user_months(activity, user), user_months)
+        self.assertEqual(get_user_months(activity, 'unknown'), [])
+
+    def test_active_matrix_of_some_months(self):
+        activity = create_user_activity(self.params, set(active_months), [2014])
+        for last_months, end_month in ((None, None), (3, None), (4, '2014-10'), (9, '2014-09'), (2, '2014-08')):
+            active, active_months_of = get_active_matrix(activity, last_months, end_month)
+            self.assertEqual(active.shape, (4, len(active_months_of)))
+            for row, user in enumerate(activity['users']):
+                self.assertEqual([m for m, a in zip(active_months_of, active[row]) if a],
+                                 [m for m in active_months_of if m in active_months[user]], (last_months, end_month))
+        self.assertEqual(get_users_active_in(activity, 3, last_months=4), set(['u1', 'u3']))
+
+    def test_no_users(self):
+        activity = create_user_activity(self.params, set(), [2014])
+        self.assertEqual(activity['bits'].shape, (0, 2))
+
+    def test_other_params_do_not_share_the_index(self):
+        create_user_activity(self.params, set(['u1', 'u2']), [2014])
+        other = Parameters()
+        other.first_level = True  # no dictionaries
+        activity = create_user_activity(other, set(['u3', 'u4']), [2014])
+        self.assertEqual(list(activity['users']), ['u3', 'u4'])
+        self.assertEqual(activity['months'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import preprocessing.config_filenames as config
+from preprocessing.config_filenames import get_user_dict_filename
+from preprocessing.create_valid_users import merge_user_counts, get_partition, create_user_counts, \
+    create_valid_user_set, get_top_users
+from preprocessing.parameters import Parameters
+from util.artifacts import load_count_arrays
+from util.io import save_pickle
+
+# user -> count of every month
+months = {'2015-01': {'u1': 10, 'u2': 15, 'news_bot': 30, u'\xe9': 1},
+          '2015-02': {'u1': 20, 'u3': 5},
+          '2015-03': {'u2': 5, 'u3': 1, 'news_bot': 1}}
+totals = {'u1': 30, 'u2': 20, 'u3': 6, 'news_bot': 31, '\xc3\xa9': 1}
+
+
+class MergeUserCountsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filenames = []
+        for month, counts in sorted(months.items()):
+            self.filenames.append(os.path.join(self.tmp_dir, 'RC_%s_users_dict.pkl' % month))
+            save_pickle(self.filenames[-1], counts)
+        self.result_filename = os.path.join(self.tmp_dir, 'user_counts.cnt')
+        self.spill_dir = self.result_filename + '.spill'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_partition(self):
+        self.assertEqual(get_partition('u1', 64), get_partition('u1', 64))
+        self.assertTrue(all(0 <= get_partition('u%d' % i, 7) < 7 for i in range(100)))
+
+    def test_counts_are_summed(self):
+        for n_partitions in (1, 3, 64):
+            merge_user_counts(self.filenames, self.result_filename, self.spill_dir, n_partitions)
+            user_counts = load_count_arrays(self.result_filename)
+            self.assertEqual(dict(user_counts.iteritems()), totals, n_partitions)
+            self.assertEqual(user_counts.keys.tolist(), sorted(totals))
+            self.assertFalse(os.path.exists(self.spill_dir))
+
+    def test_left_over_spill_files_are_removed(self):
+        os.makedirs(self.spill_dir)
+        with open(os.path.join(self.spill_dir, 'partition_0_0.txt'), 'w') as f:
+            f.write('u1\t100\n')
+        merge_user_counts(self.filenames, self.result_filename, self.spill_dir, 1)
+        self.assertEqual(load_count_arrays(self.result_filename).get('u1'), 30)
+
+    def test_no_dictionaries(self):
+        merge_user_counts([], self.result_filename, self.spill_dir, 4)
+        self.assertEqual(len(load_count_arrays(self.result_filename)), 0)
+
+
+class ValidUsersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.user_cat_dir, self.valid_dir = config.user_cat_dir, config.valid_dir
+        config.user_cat_dir = config.valid_dir = self.tmp_dir
+        self.params = Parameters()
+        self.params.min_posts = 10
+        for month, counts in months.items():
+            save_pickle(get_user_dict_filename(self.params, 'RC_%s.json' % month), counts)
+
+    def tearDown(self):
+        config.user_cat_dir, config.valid_dir = self.user_cat_dir, self.valid_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def test_top_users(self):
+        user_counts = create_user_counts(self.params, n_partitions=4)
+        self.assertEqual(dict(user_counts.iteritems()), totals)
+        self.assertEqual(get_top_users(10, user_counts), set(['u1', 'u2', 'news_bot']))  # at least 20 posts
+        self.assertEqual(get_top_users(25, user_counts), get_top_users(25, totals))
+        self.assertEqual(create_valid_user_set(self.params), set(['u1', 'u2']))
+        self.assertEqual(create_valid_user_set(self.params), set(['u1', 'u2']))  # loaded
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,324 @@
+"""Artifact I/O with pluggable backends, for the objects too big to pickle and load whole.
+
+Backends (chosen with the backend argument, or from the filename extension):
+    pickle:     plain pickle (util.io.save_pickle / load_pickle), for small objects. Extension .pkl
+    compressed: pickle streamed through lz4 or zstd if installed, else zlib. Extension .pkl.z
+    arrays:     count maps (key -> int) as a sorted key array and a count array, loaded memory mapped and queried
+                with binary search. Extension .cnt (two files: .cnt.keys.npy and .cnt.counts.npy)
+    sqlite:     key -> value table in a sqlite file (stdlib), for point lookups without loading. Extension .db
+"""
+import os
+import sqlite3
+import sys
+import time
+import zlib
+
+import cPickle as pickle
+
+from util.io import save_pickle, load_pickle, make_dir, make_go_rw, atomic_open
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+_codec_tags = {'lz4': 'lz4\0', 'zstd': 'zstd', 'zlib': 'zlib'}
+
+
+def _get_codec():
+    """Returns the fastest available compression codec name."""
+    try:
+        import lz4.frame
+        return 'lz4'
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return 'zstd'
+    except ImportError:
+        pass
+    return 'zlib'
+
+
+class _StreamWriter(object):
+    """Write only file object that compresses with a zlib-like compressor object (compress / flush)."""
+
+    def __init__(self, f, compressor):
+        self.f = f
+        self.compressor = compressor
+
+    def write(self, data):
+        self.f.write(self.compressor.compress(data))
+
+    def close(self):
+        self.f.write(self.compressor.flush())
+
+
+class _StreamReader(object):
+    """Read only file object (read and readline, as pickle needs) over a zlib-like decompressor object."""
+
+    def __init__(self, f, decompressor, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decompressor = decompressor
+        self.buffer = ''
+
+    def _fill(self, n):
+        while len(self.buffer) < n:
+            chunk = self.f.read(self.chunk_size)
+            if not chunk:
+                self.buffer += self.decompressor.flush()
+                break
+            self.buffer += self.decompressor.decompress(chunk)
+
+    def read(self, n=-1):
+        if n < 0:
+            self.buffer += self.decompressor.decompress(self.f.read()) + self.decompressor.flush()
+            data, self.buffer = self.buffer, ''
+            return data
+        self._fill(n)
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    def readline(self):
+        while '\n' not in self.buffer:
+            size = len(self.buffer)
+            self._fill(size + self.chunk_size)
+            if len(self.buffer) == size:
+                break
+        end = self.buffer.find('\n') + 1 or len(self.buffer)
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+
+def _compressed_writer(f, codec):
+    if codec == 'lz4':
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(f, 'wb')
+    if codec == 'zstd':
+        import zstandard
+        return _StreamWriter(f, zstandard.ZstdCompressor().compressobj())
+    return _StreamWriter(f, zlib.compressobj(1))
+
+
+def _compressed_reader(f, codec):
+    if codec == 'lz4':
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(f, 'rb')
+    if codec == 'zstd':
+        import zstandard
+        return _StreamReader(f, zstandard.ZstdDecompressor().decompressobj())
+    return _StreamReader(f, zlib.decompressobj())
+
+
+def save_compressed_pickle(filename, obj, verbose=False, other_permission=True):
+    """Pickles obj straight into a compressed stream (no uncompressed copy in memory)."""
+    make_dir(filename)
+    codec = _get_codec()
+    if verbose:
+        print '--> Saving ', filename, ' with %s pickle was ' % codec,
+        sys.stdout.flush()
+    t = time.time()
+    with atomic_open(filename) as f:
+        f.write(_codec_tags[codec])
+        writer = _compressed_writer(f, codec)
+        pickle.dump(obj, writer, protocol=pickle.HIGHEST_PROTOCOL)
+        writer.close()
+    if verbose:
+        print '%.3f s' % (time.time() - t)
+    make_go_rw(filename, other_permission)
+
+
+def load_compressed_pickle(filename, verbose=False):
+    if verbose:
+        print '--> Loading ', filename, ' with compressed pickle was ',
+        sys.stdout.flush()
+    t = time.time()
+    with open(filename, 'rb') as f:
+        tag = f.read(4)
+        codec = [c for (c, c_tag) in _codec_tags.items() if c_tag == tag][0]
+        r = pickle.load(_compressed_reader(f, codec))
+    if verbose:
+        print '%.3f s' % (time.time() - t)
+    return r
+
+
+# -------------------------------------------
+# sorted key / count arrays
+# -------------------------------------------
+
+def save_count_arrays(filename, counts, verbose=False, other_permission=True):
+    """Saves a key -> count dictionary (or a (keys, counts) tuple) as sorted key and count arrays."""
+    make_dir(filename)
+    t = time.time()
+    if isinstance(counts, dict):
+        keys = np.array(counts.keys())
+        values = np.array(counts.values(), dtype=np.int64)
+    else:
+        keys, values = np.asarray(counts[0]), np.asarray(counts[1], dtype=np.int64)
+    order = np.argsort(keys, kind='mergesort')
+    for suffix, arr in (('.keys.npy', keys[order]), ('.counts.npy', values[order])):
+        with atomic_open(filename + suffix) as f:
+            np.save(f, arr)
+        make_go_rw(filename + suffix, other_permission)
+    if verbose:
+        print '--> Saved %d counts to %s in %.3f s' % (len(keys), filename, time.time() - t)
+
+
+def load_count_arrays(filename, verbose=False, mmap=True):
+    """Loads count arrays saved with save_count_arrays. They are memory mapped, so loading is instant."""
+    if verbose:
+        print '--> Loading ', filename, ' as count arrays'
+    mmap_mode = 'r' if mmap else None
+    return CountArrays(np.load(filename + '.keys.npy', mmap_mode=mmap_mode),
+                       np.load(filename + '.counts.npy', mmap_mode=mmap_mode))
+
+
+def count_arrays_exist(filename):
+    return os.path.isfile(filename + '.keys.npy') and os.path.isfile(filename + '.counts.npy')
+
+
+class CountArrays(object):
+    """Read only key -> count map over a sorted key array and a count array."""
+
+    def __init__(self, keys, counts):
+        self.keys = keys
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _find(self, key):
+        i = np.searchsorted(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return -1
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def get(self, key, default=None):
+        i = self._find(key)
+        if i < 0:
+            return default
+        return int(self.counts[i])
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return int(self.counts[i])
+
+    def iteritems(self):
+        for i in xrange(len(self.keys)):
+            yield self.keys[i], int(self.counts[i])
+
+    def at_least(self, min_count):
+        """Returns the array of keys with count >= min_count."""
+        return self.keys[np.asarray(self.counts) >= min_count]
+
+
+# -------------------------------------------
+# sqlite key / value store
+# -------------------------------------------
+
+def save_sqlite_dict(filename, d, batch_size=100000, verbose=False, other_permission=True):
+    """Saves a dictionary (or an iterable of (key, value) pairs) to a sqlite file, values are pickled."""
+    make_dir(filename)
+    tmp_filename = '%s.tmp.%d' % (filename, os.getpid())
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+    t = time.time()
+    store = SqliteDict(tmp_filename)
+    items = d.iteritems() if isinstance(d, dict) else iter(d)
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            store.put_many(batch)
+            batch = []
+    store.put_many(batch)
+    store.close()
+    os.rename(tmp_filename, filename)  # readers never see a half written store
+    if verbose:
+        print '--> Saved %s with sqlite in %.3f s' % (filename, time.time() - t)
+    make_go_rw(filename, other_permission)
+
+
+def load_sqlite_dict(filename, verbose=False):
+    if verbose:
+        print '--> Opening ', filename, ' with sqlite'
+    return SqliteDict(filename)
+
+
+class SqliteDict(object):
+    """Key -> value store in a sqlite file with point lookups. Keys are strings, values are pickled."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.text_factory = str
+        self.connection.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB)')
+
+    def put_many(self, items):
+        self.connection.executemany('INSERT OR REPLACE INTO kv VALUES (?, ?)',
+                                    ((k, sqlite3.Binary(pickle.dumps(v, pickle.HIGHEST_PROTOCOL))) for k, v in items))
+        self.connection.commit()
+
+    def get(self, key, default=None):
+        row = self.connection.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        return pickle.loads(str(row[0]))
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.connection.execute('SELECT 1 FROM kv WHERE key = ?', (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM kv').fetchone()[0]
+
+    def iteritems(self):
+        for k, v in self.connection.execute('SELECT key, value FROM kv'):
+            yield k, pickle.loads(str(v))
+
+    def close(self):
+        self.connection.close()
+
+
+# -------------------------------------------
+# backend selection
+# -------------------------------------------
+
+backends = {'pickle': (save_pickle, load_pickle),
+            'compressed': (save_compressed_pickle, load_compressed_pickle),
+            'arrays': (save_count_arrays, load_count_arrays),
+            'sqlite': (save_sqlite_dict, load_sqlite_dict)}
+
+_extension_backends = [('.pkl.z', 'compressed'), ('.pkl', 'pickle'), ('.cnt', 'arrays'), ('.db', 'sqlite')]
+
+
+def get_backend(filename):
+    for extension, backend in _extension_backends:
+        if filename.endswith(extension):
+            return backend
+    return 'pickle'
+
+
+def save_artifact(filename, obj, backend=None, verbose=False):
+    """Saves obj with the given backend (or the one matching the filename extension)."""
+    backends[backend or get_backend(filename)][0](filename, obj, verbose=verbose)
+
+
+def load_artifact(filename, backend=None, verbose=False):
+    """Loads an artifact saved with save_artifact."""
+    return backends[backend or get_backend(filename)][1](filename, verbose=verbose)
+
+
+def artifact_exists(filename, backend=None):
+    if (backend or get_backend(filename)) == 'arrays':
+        return count_arrays_exist(filename)
+    return os.path.isfile(filename)
@@ -0,0 +1,255 @@
+"""Byte pair encoding (BPE) subword vocabularies, trained from word counts.
+
+Training works on the word types and their counts (as saved by json2vocab), never on the corpus: every word is a
+list of symbols (its characters, the last one marked with end_of_word), and the most frequent pair of adjacent
+symbols is merged n_merges times. The pair counts are updated incrementally: only the words that contain the merged
+pair are visited (found with an index pair -> words), and a heap with lazy deletion gives the next best pair.
+Memory is bounded by max_words: only the most frequent word types are used to train.
+
+Encoding a word applies the merges in the order they were learned. Words are cached, so encoding a corpus costs
+about one dict lookup per token.
+"""
+import heapq
+from collections import defaultdict
+
+from util.sampling import to_count_arrays
+from util.vocabulary import Vocabulary, special_tokens, load_vocabulary
+from util.io import save_pickle, load_pickle
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+end_of_word = '</w>'
+
+
+def _to_unicode(word):
+    return word if isinstance(word, unicode) else word.decode('utf-8', 'replace')
+
+
+def split_word(word):
+    """List of the characters of word (unicode), the last one with end_of_word appended."""
+    chars = list(_to_unicode(word))
+    if chars:
+        chars[-1] += end_of_word
+    return chars
+
+
+def _merge_symbols(word, pair, new_symbol):
+    """word (a list of symbols) with every occurrence of pair replaced by new_symbol, left to right."""
+    merged = []
+    i = 0
+    n = len(word)
+    while i < n:
+        if i < n - 1 and word[i] == pair[0] and word[i + 1] == pair[1]:
+            merged.append(new_symbol)
+            i += 2
+        else:
+            merged.append(word[i])
+            i += 1
+    return merged
+
+
+def train_bpe(word_counts, n_merges, min_count=2, max_words=2000000, min_pair_count=2, verbose=True):
+    """Learns BPE merges from word counts.
+
+    Args:
+        word_counts: CountArrays or dictionary word (utf-8) -> count.
+        n_merges: number of merges to learn (at most).
+        min_count: words with fewer occurrences are not used.
+        max_words: maximum number of word types used (the most frequent ones). Bounds the memory of training.
+        min_pair_count: stop when the most frequent pair has fewer occurrences.
+        verbose: print progress.
+    Returns:
+        (merges, symbol_counts): the list of merged (left, right) symbol pairs in the order they were learned, and a
+        dictionary symbol -> count in the final segmentation of the training words (with every symbol ever made,
+        characters included, possibly with count 0). Symbols are unicode.
+    """
+    keys, counts = to_count_arrays(word_counts)
+    keep = np.where(counts >= min_count)[0]
+    if len(keep) > max_words:
+        keep = keep[np.argsort(-counts[keep], kind='mergesort')[:max_words]]
+    keep.sort()
+
+    # symbols are interned to ints, so words are lists of ints and pairs tuples of ints
+    symbols = []
+    symbol_ids = {}
+
+    def intern(symbol):
+        i = symbol_ids.get(symbol)
+        if i is None:
+            i = symbol_ids[symbol] = len(symbols)
+            symbols.append(symbol)
+        return i
+
+    words, freqs = [], []
+    for word, count in zip(keys[keep].tolist(), counts[keep].tolist()):
+        if word and word not in special_tokens:
+            words.append([intern(c) for c in split_word(word)])
+            freqs.append(count)
+    if verbose:
+        print '--> Training BPE on %d words (of %d), %d characters' % (len(words), len(keys), len(symbols))
+
+    pair_counts = defaultdict(int)
+    where = defaultdict(set)  # pair -> indices of the words that contain it (may be stale, checked on use)
+    for i, word in enumerate(words):
+        for pair in zip(word, word[1:]):
+            pair_counts[pair] += freqs[i]
+            where[pair].add(i)
+    heap = [(-c, pair) for pair, c in pair_counts.iteritems()]
+    heapq.heapify(heap)
+
+    merges = []
+    while len(merges) < n_merges and heap:
+        neg_count, pair = heapq.heappop(heap)
+        if pair_counts.get(pair) != -neg_count:  # stale heap entry, the pair count changed since it was pushed
+            continue
+        if -neg_count < min_pair_count:
+            break
+        new_symbol = intern(symbols[pair[0]] + symbols[pair[1]])
+        merges.append((symbols[pair[0]], symbols[pair[1]]))
+
+        changed = set()
+        for i in where.pop(pair, ()):
+            word = words[i]
+            merged = _merge_symbols(word, pair, new_symbol)
+            if len(merged) == len(word):
+                continue
+            f = freqs[i]
+            for p in zip(word, word[1:]):
+                pair_counts[p] -= f
+                changed.add(p)
+            for p in zip(merged, merged[1:]):
+                pair_counts[p] += f
+                where[p].add(i)
+                changed.add(p)
+            words[i] = merged
+        pair_counts.pop(pair, None)
+        changed.discard(pair)
+        for p in changed:
+            c = pair_counts[p]
+            if c > 0:
+                heapq.heappush(heap, (-c, p))
+            else:
+                del pair_counts[p]
+                where.pop(p, None)
+        if len(heap) > 4 * len(pair_counts) + 1000:  # drop the stale entries
+            heap = [(-c, p) for p, c in pair_counts.iteritems()]
+            heapq.heapify(heap)
+        if verbose and len(merges) % 1000 == 0:
+            print '--> %d merges, last %s with %d occurrences' % (len(merges), ''.join(merges[-1]).encode('utf-8'),
+                                                                  -neg_count)
+
+    symbol_counts = dict((s, 0) for s in symbols)
+    for word, f in zip(words, freqs):
+        for s in word:
+            symbol_counts[symbols[s]] += f
+    return merges, symbol_counts
+
+
+class BPE(object):
+    """Segments words into subwords with learned merges."""
+
+    def __init__(self, merges, cache_size=1000000):
+        self.merges = merges
+        self.ranks = dict((pair, i) for i, pair in enumerate(merges))
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def segment(self, word):
+        """List of the subwords (unicode) of a word (unicode or utf-8)."""
+        symbols = self.cache.get(word)
+        if symbols is not None:
+            return symbols
+        symbols = split_word(word)
+        ranks = self.ranks
+        while len(symbols) > 1:
+            pair = min(zip(symbols, symbols[1:]), key=lambda p: ranks.get(p, len(ranks)))
+            if pair not in ranks:
+                break
+            symbols = _merge_symbols(symbols, pair, pair[0] + pair[1])
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[word] = symbols
+        return symbols
+
+
+class SubwordVocabulary(object):
+    """A BPE and the Vocabulary of its subwords (utf-8, as json2vocab saves words). Can be used instead of a
+    Vocabulary in text2ids: every word is written as the ids of its subwords."""
+
+    def __init__(self, bpe, vocab):
+        self.bpe = bpe
+        self.vocab = vocab
+        self.unk_id = vocab.unk_id
+        self._word_cache = {}
+
+    @classmethod
+    def from_training(cls, merges, symbol_counts, extra_tokens=special_tokens):
+        counts = dict((s.encode('utf-8'), c) for s, c in symbol_counts.iteritems())
+        for t in extra_tokens:
+            counts.setdefault(t, 0)
+        tokens = sorted(counts)
+        return cls(BPE(merges), Vocabulary(np.array(tokens), np.array([counts[t] for t in tokens], dtype=np.int64)))
+
+    def save(self, filename):
+        """Saves the subword vocabulary at filename (count arrays) and the merges next to it."""
+        self.vocab.save(filename)
+        save_pickle(get_merges_filename(filename), self.bpe.merges)
+
+    @classmethod
+    def load(cls, filename):
+        return cls(BPE(load_pickle(get_merges_filename(filename), False)), load_vocabulary(filename))
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def segment(self, word):
+        """List of the subwords (utf-8) of word."""
+        return [s.encode('utf-8') for s in self.bpe.segment(word)]
+
+    def _word_ids(self, word):
+        ids = self._word_cache.get(word)
+        if ids is None:
+            get, unk = self.vocab.get, self.unk_id
+            ids = [get(s, unk) for s in self.segment(word)]
+            if len(self._word_cache) >= self.bpe.cache_size:
+                self._word_cache.clear()
+            self._word_cache[word] = ids
+        return ids
+
+    def encode(self, tokens):
+        """Array (int32) of the subword ids of a list of words."""
+        ids = []
+        for t in tokens:
+            ids.extend(self._word_ids(t))
+        return np.array(ids, dtype=np.int32)
+
+    def get_string_encoder(self):
+        """Function from a list of words to the list of their subword ids as strings (see Vocabulary)."""
+        cache = {}
+        cache_size = self.bpe.cache_size
+
+        def encode_strings(tokens):
+            result = []
+            for t in tokens:
+                ids = cache.get(t)
+                if ids is None:
+                    if t in special_tokens:
+                        ids = [str(self.vocab.get(t, self.unk_id))]
+                    else:
+                        ids = [str(i) for i in self._word_ids(t)]
+                    if len(cache) >= cache_size:
+                        cache.clear()
+                    cache[t] = ids
+                result.extend(ids)
+            return result
+        return encode_strings
+
+    def decode(self, ids):
+        """The text of an array of subword ids, words separated by spaces."""
+        text = ''.join(self.vocab.decode(ids).tolist())
+        return text.replace(end_of_word, ' ').strip()
+
+
+def get_merges_filename(filename):
+    return filename + '.merges.pkl'
@@ -0,0 +1,66 @@
+"""Measures the import time of every module of the repository, each in a fresh interpreter.
+
+Run from the project directory:
+    python -m util.import_benchmark [--budget 0.2] [module ...]
+Exits with 1 if a module imports one of the heavy dependencies at import time, or takes longer than the budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+heavy_modules = ['numpy', 'scipy', 'nltk', 'requests', 'lxml', 'simplejson']
+default_modules = ['preprocessing.config_filenames', 'preprocessing.parameters', 'preprocessing.create_valid_users',
+                   'preprocessing.user_category', 'preprocessing.user_activity', 'preprocessing.threads',
+                   'preprocessing.text', 'preprocessing.subreddit_popularity', 'preprocessing.subreddit_similarity',
+                   'preprocessing.subscriber_history', 'preprocessing.run', 'util.io', 'util.artifacts',
+                   'util.manifest', 'util.preprocessing_util', 'util.text_util', 'util.shared', 'util.sampling',
+                   'util.vocabulary', 'util.bpe', 'util.ngrams', 'util.term_matrix',
+                   'preprocessing.splits', 'preprocessing.dedup', 'preprocessing.entry_filter', 'preprocessing.compact']
+
+_probe = """
+import sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+heavy = [m for m in %r if m in sys.modules]
+print '%%f %%s' %% (elapsed, ','.join(heavy))
+"""
+
+
+def time_import(module, repeat=3):
+    """Returns the best import time (in seconds) of module over repeat fresh interpreters, and the heavy modules it
+    imported."""
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([project_dir, os.environ.get('PYTHONPATH', '')]))
+    best, heavy = None, []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', _probe % (module, heavy_modules)], env=env)
+        fields = output.strip().split('\n')[-1].split(' ')
+        heavy = fields[1].split(',') if len(fields) > 1 else []
+        best = float(fields[0]) if best is None else min(best, float(fields[0]))
+    return best, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time of the modules of the repository.')
+    parser.add_argument('modules', nargs='*', default=default_modules)
+    parser.add_argument('--budget', type=float, default=0.2, help='maximum import time of a module, in seconds')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        elapsed, heavy = time_import(module, args.repeat)
+        status = 'ok'
+        if heavy:
+            status = 'imports %s' % ', '.join(heavy)
+        elif elapsed > args.budget:
+            status = 'over budget'
+        failed = failed or status != 'ok'
+        print '%-40s %.3fs  %s' % (module, elapsed, status)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,29 @@
+import errno
+import gzip
 import os
+import struct
 import sys
+import threading
 import time
+import zlib
+from contextlib import contextmanager
+from Queue import Queue
 
 import cPickle as pickle
-import numpy as np
+
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+sparse = lazy_import('scipy.sparse')
+
+# pickles start with a header: magic, length of the pickle and its crc32, so truncated files are detected on load.
+_header_magic = 'RDPCHK02'
+_header_format = '<QI'
+_header_size = len(_header_magic) + struct.calcsize(_header_format)
+
+
+class CorruptArtifactError(IOError):
+    pass
 
 
 def make_go_rw(filename, change_perm=True):
@@ -17,8 +37,106 @@ def file_exists(filename):
 
 def make_dir(filename):
     dir_path = os.path.dirname(filename)
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
+    if dir_path and not os.path.exists(dir_path):
+        try:
+            os.makedirs(dir_path)
+        except OSError as e:  # another process created it in the meantime
+            if e.errno != errno.EEXIST:
+                raise
+
+
+@contextmanager
+def atomic_open(filename, mode='wb'):
+    """Opens a temporary file next to filename and renames it to filename only after everything was written and
+    fsync'ed. A killed writer leaves no (truncated) filename behind and concurrent writers never mix their data,
+    the last rename wins."""
+    make_dir(filename)
+    tmp_filename = '%s.tmp.%d.%d' % (filename, os.getpid(), threading.current_thread().ident)
+    f = open(tmp_filename, mode)
+    try:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.rename(tmp_filename, filename)
+    except BaseException:
+        f.close()
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+class _ChecksumWriter(object):
+    """Passes writes to f, keeping the length and crc32 of everything written."""
+
+    def __init__(self, f):
+        self.f = f
+        self.length = 0
+        self.crc = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.length += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+
+    def header(self):
+        return _header_magic + struct.pack(_header_format, self.length, self.crc & 0xffffffff)
+
+
+def check_pickle(filename, verify=False):
+    """Checks a pickle saved with save_pickle. Raises CorruptArtifactError if it is truncated or (with verify) its
+    checksum is wrong.
+
+    The header at the start of the file survives truncation, so a file with the header magic and a shorter length is
+    always caught. Older pickles without a header are checked as well as they can be: by the STOP opcode ('.') that
+    ends every pickle.
+    Returns:
+        The offset of the pickle in the file.
+    """
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        head = f.read(_header_size)
+        if head.startswith(_header_magic):
+            if len(head) < _header_size:
+                raise CorruptArtifactError('%s: truncated header' % filename)
+            length, crc = struct.unpack(_header_format, head[len(_header_magic):])
+            if length != size - _header_size:
+                raise CorruptArtifactError('%s: expected %d bytes, found %d' % (filename, length, size - _header_size))
+            if verify:
+                _check_crc(filename, f, length, crc)
+            return _header_size
+
+        if size == 0:
+            raise CorruptArtifactError('%s: empty file' % filename)
+        f.seek(size - 1)
+        if f.read(1) != '.':
+            raise CorruptArtifactError('%s: the pickle does not end with STOP, it is truncated' % filename)
+    return 0
+
+
+def _check_crc(filename, f, length, crc):
+    """Checks the crc32 of the next length bytes of f."""
+    actual_crc, remaining = 0, length
+    while remaining > 0:
+        chunk = f.read(min(remaining, 1 << 24))
+        if not chunk:
+            break
+        actual_crc = zlib.crc32(chunk, actual_crc)
+        remaining -= len(chunk)
+    if actual_crc & 0xffffffff != crc:
+        raise CorruptArtifactError('%s: checksum mismatch' % filename)
+
+
+def is_valid_artifact(filename, verify=False):
+    """True if filename (a pickle of save_pickle) exists and is not truncated (or corrupt, with verify)."""
+    if not os.path.isfile(filename):
+        return False
+    try:
+        check_pickle(filename, verify)
+    except CorruptArtifactError as e:
+        print 'Invalid artifact: %s' % e
+        return False
+    return True
 
 
 def build_path(dir, filename):
@@ -29,27 +147,124 @@ def extract_filename(path):
     return os.path.split(path)[1]
 
 
+class BulkWriter(object):
+    """Buffered writer for big text outputs, written atomically (see atomic_open).
+
+    Writes are collected in memory and written as one joined string every buffer_size characters, instead of one
+    small write per line. With threaded=True, the joined strings are written (and compressed) by a separate thread,
+    so producing the next lines overlaps with the disk I/O. With compress='gzip' the output is gzipped on the fly.
+    Use it as a context manager, or call close() at the end.
+    """
+
+    def __init__(self, filename, mode='w', buffer_size=1 << 24, threaded=False, compress=None):
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+        self._atomic = atomic_open(filename, mode if compress is None else 'wb')
+        self.f = self._atomic.__enter__()
+        self.out = self.f
+        if compress == 'gzip':
+            self.out = gzip.GzipFile(fileobj=self.f, mode='wb', compresslevel=1)
+        elif compress is not None:
+            raise ValueError('Unknown compression: %s' % compress)
+
+        self.queue, self.thread, self.error = None, None, None
+        if threaded:
+            self.queue = Queue(maxsize=4)  # bounds the memory of data waiting to be written
+            self.thread = threading.Thread(target=self._write_loop)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _write_loop(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            if self.error is None:
+                try:
+                    self.out.write(data)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def writelines(self, lines):
+        for s in lines:
+            self.write(s)
+
+    def flush(self):
+        if len(self.parts) == 0:
+            return
+        data = ''.join(self.parts)
+        self.parts, self.size = [], 0
+        if self.queue is not None:
+            self.queue.put(data)
+        else:
+            self.out.write(data)
+
+    def _finish(self):
+        self.flush()
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+        if self.out is not self.f:
+            self.out.close()
+
+    def close(self):
+        try:
+            self._finish()
+        except BaseException:
+            self._atomic.__exit__(*sys.exc_info())
+            raise
+        self._atomic.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+            self._atomic.__exit__(exc_type, exc_value, traceback)  # removes the temporary file
+        return False
+
+
 def save_pickle(filename, obj, verbose=False, other_permission=True):
     make_dir(filename)
     if verbose:
         print '--> Saving ', filename, ' with pickle was ',
         sys.stdout.flush()
     t = time.time()
-    with open(filename, 'wb') as gfp:
-        pickle.dump(obj, gfp, protocol=pickle.HIGHEST_PROTOCOL)
-        gfp.close()
+    with atomic_open(filename) as gfp:
+        gfp.write('\0' * _header_size)  # filled in when the length and checksum are known
+        writer = _ChecksumWriter(gfp)
+        pickle.dump(obj, writer, protocol=pickle.HIGHEST_PROTOCOL)
+        gfp.seek(0)
+        gfp.write(writer.header())
 
     if verbose:
         print '%.3f s' % (time.time() - t)
     make_go_rw(filename, other_permission)
 
 
-def load_pickle(filename, verbose=False):
+def load_pickle(filename, verbose=False, verify=False):
     if verbose:
         print '--> Loading ', filename, ' with pickle was ',
         sys.stdout.flush()
     t = time.time()
+    offset = check_pickle(filename, verify)
     with open(filename, 'rb') as gfp:
+        gfp.seek(offset)
         r = pickle.load(gfp)
 
     if verbose:
@@ -63,22 +278,22 @@ def save_txt(filename, obj, delimiter=',', fmt='% .4e', verbose=True, other_perm
         print '--> Saving ', filename, ' with np.savetxt was ',
     sys.stdout.flush()
     t = time.time()
-    np.savetxt(filename, obj, delimiter=delimiter, fmt=fmt)
+    with atomic_open(filename) as f:
+        np.savetxt(f, obj, delimiter=delimiter, fmt=fmt)
     if verbose:
         print '%.3f s' % (time.time() - t)
     make_go_rw(filename, other_permission)
 
 
-def save_text_sentences(filename, sentences, delimiter='\n', verbose=True, other_permission=True):
+def save_text_sentences(filename, sentences, delimiter='\n', verbose=True, other_permission=True, compress=None):
     make_dir(filename)
     t = time.time()
     if verbose:
         print '--> Saving ', filename, ' as a text file was ',
     sys.stdout.flush()
-    with open(filename, 'w') as f:
+    with BulkWriter(filename, threaded=True, compress=compress) as f:
         for s in sentences:
             f.write('%s%s' % (s, delimiter))
-        f.close()
     if verbose:
         print '%.3f s' % (time.time() - t)
     make_go_rw(filename, other_permission)
@@ -93,12 +308,40 @@ def save_array(filename, obj, verbose=True, other_permission=True):
     t = time.time()
     if not isinstance(obj, np.ndarray):
         obj = np.array(obj)
-    np.save(filename, obj)
+    if not filename.endswith('.npy'):
+        filename += '.npy'  # np.save adds it when given a filename
+    with atomic_open(filename) as f:
+        np.save(f, obj)
     if verbose:
         print '%.3f s' % (time.time() - t)
     make_go_rw(filename, other_permission)
 
 
+def save_sparse(filename, matrix, verbose=True, other_permission=True):
+    """Saves a scipy sparse matrix as .npz (filename should end with .npz)."""
+    make_dir(filename)
+    if verbose:
+        print '--> Saving ', filename, ' with sparse.save_npz was ',
+    sys.stdout.flush()
+    t = time.time()
+    with atomic_open(filename) as f:
+        sparse.save_npz(f, matrix)
+    if verbose:
+        print '%.3f s' % (time.time() - t)
+    make_go_rw(filename, other_permission)
+
+
+def load_sparse(filename, verbose=True):
+    if verbose:
+        print '--> Loading ', filename, ' with sparse.load_npz was ',
+    sys.stdout.flush()
+    t = time.time()
+    r = sparse.load_npz(filename)
+    if verbose:
+        print '%.3f s' % (time.time() - t)
+    return r
+
+
 def load_array(filename, verbose=True):
     if verbose:
         print '--> Loading ', filename, ' with np.load was ',
@@ -0,0 +1,37 @@
+"""Lazy imports of the heavy dependencies (numpy, scipy, nltk, requests, simplejson, lxml).
+
+    np = lazy_import('numpy')
+
+binds np to a placeholder that imports numpy the first time one of its attributes is used, so importing a module of
+this repository stays fast. Attributes are cached on the placeholder, so using them later costs a dictionary lookup.
+Default argument values are evaluated at import time, so they must not use lazy modules.
+Check with: python -m util.import_benchmark
+"""
+import importlib
+import sys
+
+
+class LazyModule(object):
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        return '<lazy module %s%s>' % (self._name, '' if self._module is None else ' (loaded)')
+
+
+def lazy_import(name):
+    """Returns the module if it is already imported, else a placeholder that imports it on first use."""
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -0,0 +1,135 @@
+"""Manifest of the artifacts of a directory, so they can be found without listing and parsing the directory.
+
+Every record is (stage, group, month, filename): e.g.
+('uc_dict', '50000_latest_fl', '2015-01', 'RC_2015-01_50000_latest_fl_uc_dict.pkl').
+All the records of a directory are in one index file, <dir>/_manifest/index.txt. Writers append to it holding an
+exclusive lock (flock of <dir>/_manifest/lock), so concurrent writers never mix their lines, and records that are
+already in the index are not appended again. Loading reads the index once into a dictionary
+(stage, group) -> month -> list of paths, which is cached until the index changes, so a query costs one stat of the
+index.
+
+A group can be marked as scanned (mark_scanned): its records are complete, e.g. after the files of the group made
+before the manifest were registered.
+"""
+import fcntl
+import os
+from contextlib import contextmanager
+
+from util.io import make_dir
+
+_manifest_subdir = '_manifest'
+_index_name = 'index.txt'
+_lock_name = 'lock'
+_scanned_stage = '_scanned'
+_cache = {}
+
+
+def get_manifest_dir(dir_name):
+    return os.path.join(dir_name, _manifest_subdir)
+
+
+def get_index_filename(dir_name):
+    return os.path.join(get_manifest_dir(dir_name), _index_name)
+
+
+@contextmanager
+def _locked(dir_name):
+    lock_filename = os.path.join(get_manifest_dir(dir_name), _lock_name)
+    make_dir(lock_filename)
+    with open(lock_filename, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _format_records(records):
+    return ''.join('%s\t%s\t%s\t%s\n' % (stage, group, month or '', os.path.basename(filename))
+                   for (stage, group, month, filename) in records)
+
+
+def _read_records(filename):
+    """The (stage, group, month, filename) records of the index, in order."""
+    if not os.path.isfile(filename):
+        return []
+    records = []
+    with open(filename, 'r') as f:
+        for line in f:
+            fields = tuple(line.rstrip('\n').split('\t'))
+            if len(fields) == 4:  # else a line that is still being written
+                records.append(fields)
+    return records
+
+
+def _is_registered(manifest, record, dir_name):
+    stage, group, month, filename = record
+    months = manifest.get((stage, group))
+    if months is None:
+        return False
+    return stage == _scanned_stage or os.path.join(dir_name, os.path.basename(filename)) in months.get(month or '', [])
+
+
+def register(dir_name, records):
+    """Appends (stage, group, month, filename) records to the index, except those it already has. month may be
+    None."""
+    with _locked(dir_name):
+        manifest = load_manifest(dir_name)
+        data = _format_records(r for r in records if not _is_registered(manifest, r, dir_name))
+        if data:
+            with open(get_index_filename(dir_name), 'a') as f:
+                f.write(data)
+
+
+def mark_scanned(dir_name, group, records=()):
+    """Registers records (e.g. of the files of group found in the directory) and marks group as scanned."""
+    register(dir_name, list(records) + [(_scanned_stage, group, None, '')])
+
+
+def is_scanned(dir_name, group):
+    return (_scanned_stage, group) in load_manifest(dir_name)
+
+
+def _get_signature(dir_name):
+    try:
+        st = os.stat(get_index_filename(dir_name))
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime
+
+
+def load_manifest(dir_name):
+    """Returns the dictionary (stage, group) -> month -> sorted list of paths of the directory."""
+    signature = _get_signature(dir_name)
+    cached = _cache.get(dir_name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    if signature is None:
+        return {}
+
+    manifest = {}
+    for stage, group, month, filename in _read_records(get_index_filename(dir_name)):
+        months = manifest.setdefault((stage, group), {})
+        if stage == _scanned_stage:
+            continue
+        paths = months.setdefault(month, [])
+        path = os.path.join(dir_name, filename)
+        if path not in paths:
+            paths.append(path)
+    for months in manifest.values():
+        for paths in months.values():
+            paths.sort()
+    _cache[dir_name] = (signature, manifest)
+    return manifest
+
+
+def query(dir_name, stage, group, years=None):
+    """Returns the sorted paths of stage and group, of all months or only the months of the given years."""
+    months = load_manifest(dir_name).get((stage, group), {})
+    if years is not None:
+        years = set(str(y) for y in years)
+    filenames = []
+    for month, paths in months.iteritems():
+        if years is None or month[:4] in years:
+            filenames.extend(paths)
+    return sorted(filenames)
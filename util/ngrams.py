@@ -0,0 +1,126 @@
+"""Bounded n-gram counting, for counting the n-grams of a corpus in the same pass as its words (json2vocab).
+
+Every worker counts the n-grams of its posts in an NgramCounter: the keys are the hashes of the n-grams (an int
+instead of a string for the n-grams seen once, which are most of them), and the text of an n-gram is only kept from
+its second occurrence. When the counter grows over max_size, the rarest n-grams are dropped (lossy counting), so a
+count can be short by at most counter.error. The n-grams of all the subreddits of a worker are in one more counter,
+keyed by (subreddit, n-gram), so a worker uses at most max_size + max_subreddit_ngrams entries however many
+subreddits it sees.
+
+The counts are lower bounds: the n-grams that a worker saw only once are not merged (their text is not known), so a
+merged count is short by at most n_proc + the sum of the errors of the workers, and an n-gram whose occurrences are
+spread over the workers can be missing from a top list. The top n-grams of a corpus are far above that.
+
+The counts of the workers are merged in parallel: the global counts are split in partitions by n-gram, the counts
+of the subreddits by subreddit, and every merge worker keeps the top n-grams of its partition.
+"""
+import heapq
+import zlib
+
+from util.preprocessing_util import combine_dicts
+
+max_subreddit_ngrams = 5000000  # size of the counter of the n-grams of all the subreddits of a worker
+
+
+class NgramCounter(object):
+    """Counts the n-grams of the given orders of token lists, in at most max_size entries."""
+
+    def __init__(self, orders=(2, 3), max_size=5000000):
+        self.orders = orders
+        self.max_size = max_size
+        self.counts = {}
+        self.names = {}
+        self.error = 0  # the most occurrences that an n-gram may have lost when it was pruned
+
+    def add(self, tokens, group=None):
+        """Counts the n-grams of tokens, as (group, n-gram) if group is not None (see get_group_counts)."""
+        counts, names = self.counts, self.names
+        for n in self.orders:
+            for i in xrange(len(tokens) - n + 1):
+                gram = ' '.join(tokens[i:i + n])
+                if group is not None:
+                    gram = (group, gram)
+                key = hash(gram)
+                c = counts.get(key, 0) + 1
+                counts[key] = c
+                if c == 2:
+                    names[key] = gram
+        if len(counts) > self.max_size:
+            self.prune()
+
+    def prune(self):
+        """Drops the rarest n-grams, until at most half of max_size are left."""
+        threshold = self.error
+        while len(self.counts) > self.max_size // 2:
+            threshold += 1
+            self.counts = dict((k, c) for k, c in self.counts.iteritems() if c > threshold)
+        self.names = dict((k, self.names[k]) for k in self.counts)
+        self.error = threshold
+
+    def get_counts(self):
+        """Dictionary n-gram -> count of the n-grams seen at least twice."""
+        names = self.names
+        return dict((names[k], c) for k, c in self.counts.iteritems() if c > 1)
+
+    def get_group_counts(self):
+        """Dictionary group -> n-gram -> count of the n-grams added with a group and seen at least twice."""
+        group_counts = {}
+        for (group, gram), c in self.get_counts().iteritems():
+            group_counts.setdefault(group, {})[gram] = c
+        return group_counts
+
+    def get_partitions(self, n_partitions):
+        """get_counts split in n_partitions dictionaries by get_partition of the n-gram."""
+        partitions = [{} for _ in range(n_partitions)]
+        for gram, c in self.get_counts().iteritems():
+            partitions[get_partition(gram, n_partitions)][gram] = c
+        return partitions
+
+
+def get_partition(key, n_partitions):
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return (zlib.crc32(key) & 0xffffffff) % n_partitions
+
+
+def get_order(gram):
+    return gram.count(' ') + 1
+
+
+def top_ngrams(counts, top_k):
+    """Dictionary order -> list of the top_k (n-gram, count) of that order, most frequent first."""
+    by_order = {}
+    for gram, c in counts.iteritems():
+        by_order.setdefault(get_order(gram), []).append((gram, c))
+    return dict((n, heapq.nlargest(top_k, grams, key=lambda x: (x[1], x[0]))) for n, grams in by_order.iteritems())
+
+
+def merge_ngram_counts(results, partition, n_partitions, top_k):
+    """Merges one partition of the n-gram counts of the workers.
+
+    Args:
+        results: list of the (global partitions, subreddit -> counts) of every worker, made with get_partitions and
+            get_counts.
+        partition: the partition to merge.
+        n_partitions: number of partitions.
+        top_k: n-grams of every order to keep.
+    Returns:
+        (top_ngrams of the global counts of the partition, subreddit -> top_ngrams for the subreddits of the
+        partition)
+    """
+    top = top_ngrams(combine_dicts(r[0][partition] for r in results), top_k)
+    subreddit_counts = {}
+    for r in results:
+        for subreddit, counts in r[1].iteritems():
+            if get_partition(subreddit, n_partitions) == partition:
+                subreddit_counts.setdefault(subreddit, []).append(counts)
+    return top, dict((s, top_ngrams(combine_dicts(c), top_k)) for s, c in subreddit_counts.iteritems())
+
+
+def combine_top_ngrams(tops, top_k):
+    """The top_k n-grams of every order from the top_ngrams of disjoint partitions."""
+    combined = {}
+    for top in tops:
+        for n, grams in top.iteritems():
+            combined.setdefault(n, []).extend(grams)
+    return dict((n, heapq.nlargest(top_k, grams, key=lambda x: (x[1], x[0]))) for n, grams in combined.iteritems())
@@ -1,4 +1,7 @@
-from scipy.sparse import coo_matrix
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+sparse = lazy_import('scipy.sparse')
 
 
 def set_to_dict(s, start=0):
@@ -22,17 +25,20 @@ def combine_dicts(dict_list, init_value=0):
 
 def data_to_sparse(data, shape=None, csc=False):
     """Takes in (n,3) array of data and returns csr matrix for that"""
+    data_matrix = sparse.coo_matrix((data[:, 2], (data[:, 0].astype(int), data[:, 1].astype(int))), shape=shape)
     if csc:
-        data_matrix = coo_matrix((data[:, 2], (data[:, 0].astype(int), data[:, 1].astype(int))), shape=shape).tocsc()
+        data_matrix = data_matrix.tocsc()
     else:
-        data_matrix = coo_matrix((data[:, 2], (data[:, 0].astype(int), data[:, 1].astype(int))), shape=shape).tocsr()
+        data_matrix = data_matrix.tocsr()
 
     data_matrix.eliminate_zeros()
     return data_matrix
 
 
-def sparse_to_data_array(matrix, dtype=np.float32, maintain_size=True):
-    """Converts a sparse matrix into a data array (essentially a COO matrix)."""
+def sparse_to_data_array(matrix, dtype=None, maintain_size=True):
+    """Converts a sparse matrix into a data array (essentially a COO matrix). dtype defaults to float32."""
+    if dtype is None:
+        dtype = np.float32
     matrix.eliminate_zeros()
     data = np.zeros((matrix.nnz, 3), dtype=dtype)
     data[:, 0] = matrix.nonzero()[0]
@@ -44,8 +50,6 @@ def sparse_to_data_array(matrix, dtype=np.float32, maintain_size=True):
     return data
 
 
-def is_valid_entry():
-    """You should write this, however you would like to define it!
-    """
-
-    return True
+def is_first_level(entry):
+    """First level comments reply to the submission (t3_ parent) and not to another comment (t1_ parent)."""
+    return entry['parent_id'].startswith('t3_')
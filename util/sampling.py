@@ -0,0 +1,133 @@
+"""Random sampling of users (or any keys) with numpy: uniform, stratified and reservoir samples.
+
+All functions take a numpy RandomState, so a sample is reproducible. get_rng makes one from the seed of a
+Parameters and some salt (e.g. the name and number of the sample), so the i-th control group of a run is always the
+same, and different control groups are independent.
+"""
+import itertools
+import zlib
+
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+_end = object()
+
+
+def get_rng(params, *salt):
+    """RandomState seeded with params.seed and salt, e.g. get_rng(params, 'control', 3)."""
+    return np.random.RandomState(zlib.crc32(repr((params.seed,) + salt)) & 0xffffffff)
+
+
+def to_count_arrays(user_counts):
+    """(keys, counts) arrays of a CountArrays or a key -> count dictionary."""
+    if hasattr(user_counts, 'counts'):
+        return np.asarray(user_counts.keys), np.asarray(user_counts.counts)
+    keys = np.array(user_counts.keys())
+    return keys, np.array(user_counts.values(), dtype=np.int64)
+
+
+def bernoulli_sample(n, probability, rng, mask=None):
+    """Indices in range(n), each kept with the given probability (only where mask is True, if given)."""
+    keep = rng.random_sample(n) < probability
+    if mask is not None:
+        keep &= mask
+    return np.where(keep)[0]
+
+
+def uniform_sample(candidates, size, rng):
+    """size indices drawn without replacement from the candidate indices (all of them, if there are fewer)."""
+    candidates = np.asarray(candidates)
+    if size >= len(candidates):
+        return np.sort(candidates)
+    return np.sort(rng.choice(candidates, size, replace=False))
+
+
+def get_stratum_sizes(stratum_counts, size, equal=False):
+    """Splits size over strata of the given sizes: proportionally (largest remainder) or equally, never more than a
+    stratum has."""
+    stratum_counts = np.asarray(stratum_counts, dtype=np.int64)
+    size = min(size, int(stratum_counts.sum()))
+    if equal:
+        sizes = np.zeros(len(stratum_counts), dtype=np.int64)
+        left, open_strata = size, np.where(stratum_counts > 0)[0]
+        while left > 0 and len(open_strata) > 0:  # strata that are too small give their share to the others
+            share = max(left // len(open_strata), 1)
+            add = np.minimum(stratum_counts[open_strata] - sizes[open_strata], share)[:left]
+            sizes[open_strata[:len(add)]] += add
+            left -= int(add.sum())
+            open_strata = open_strata[sizes[open_strata] < stratum_counts[open_strata]]
+        return sizes
+    quotas = stratum_counts * float(size) / max(stratum_counts.sum(), 1)
+    sizes = np.floor(quotas).astype(np.int64)
+    remainder = size - int(sizes.sum())
+    if remainder > 0:
+        sizes[np.argsort(sizes - quotas, kind='mergesort')[:remainder]] += 1
+    return sizes
+
+
+def stratified_sample(strata, size, rng, equal=False, mask=None):
+    """Exact size sample without replacement, stratified by the label of every element.
+
+    All strata are sampled at once: every element gets a random number, the elements are sorted by (stratum, number)
+    and the first elements of every stratum are kept.
+    Args:
+        strata: array with the stratum label of every element (e.g. get_activity_strata).
+        size: total sample size, split over the strata by get_stratum_sizes.
+        rng: numpy RandomState.
+        equal: if True, the same number of elements from every stratum, else proportional to the stratum size.
+        mask: boolean array of the elements that can be sampled. If None, all of them.
+    Returns:
+        sorted array of the indices of the sampled elements.
+    """
+    candidates = np.arange(len(strata)) if mask is None else np.where(mask)[0]
+    _, stratum_ids, stratum_counts = np.unique(np.asarray(strata)[candidates], return_inverse=True,
+                                               return_counts=True)
+    sizes = get_stratum_sizes(stratum_counts, size, equal)
+
+    order = np.lexsort((rng.random_sample(len(candidates)), stratum_ids))
+    starts = np.concatenate(([0], np.cumsum(stratum_counts)[:-1]))
+    rank = np.arange(len(order)) - starts[stratum_ids[order]]
+    return np.sort(candidates[order[rank < sizes[stratum_ids[order]]]])
+
+
+def get_activity_strata(counts, bounds=(50, 100, 500, 1000, 5000)):
+    """Activity bucket of every user from its post count: 0 for less than bounds[0] posts, 1 for less than bounds[1]
+    etc."""
+    return np.searchsorted(np.asarray(bounds), counts, side='right')
+
+
+def get_top_subreddit_strata(uxs):
+    """Column of the subreddit every user (row of the UxS matrix) posted the most in, -1 for users with no posts."""
+    uxs = uxs.tocsr()
+    strata = np.full(uxs.shape[0], -1, dtype=np.int64)
+    active = np.where(np.diff(uxs.indptr) > 0)[0]
+    strata[active] = np.asarray(uxs[active].argmax(axis=1)).ravel()
+    return strata
+
+
+def reservoir_sample(items, size, rng):
+    """Exact size uniform sample from an iterable of unknown length, in one pass and O(size) memory.
+
+    Uses geometric jumps between replacements (Li's algorithm L), so only a few random numbers are drawn per
+    replacement instead of one per item.
+    """
+    if size <= 0:
+        return []
+    items = iter(items)
+    reservoir = []
+    for item in items:
+        reservoir.append(item)
+        if len(reservoir) == size:
+            break
+    if len(reservoir) < size:
+        return reservoir
+
+    w = np.exp(np.log(rng.random_sample()) / size)
+    while True:
+        skip = int(np.floor(np.log(rng.random_sample()) / np.log(1 - w)))
+        item = next(itertools.islice(items, skip, None), _end)
+        if item is _end:
+            return reservoir
+        reservoir[rng.randint(size)] = item
+        w *= np.exp(np.log(rng.random_sample()) / size)
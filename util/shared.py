@@ -0,0 +1,25 @@
+"""Read-only lookup structures (valid users, valid subreddits, vocab etc) shared with pool workers.
+
+Pool workers are forked from the main process, so anything published here BEFORE the pool is created is
+inherited by every worker (copy-on-write) instead of being pickled into each apply_async call.
+Workers should only read these objects, never modify them.
+"""
+
+_shared = {}
+
+
+def publish(**kwargs):
+    """Publishes objects under the given names. Has to be called before mp.Pool() is created."""
+    _shared.update(kwargs)
+
+
+def get_shared(name, default=None):
+    """Returns the object published under name (or default if nothing was published)."""
+    return _shared.get(name, default)
+
+
+def unpublish(*names):
+    """Removes objects so that they can be garbage collected in the main process."""
+    for name in names:
+        _shared.pop(name, None)
+
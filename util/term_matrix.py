@@ -0,0 +1,73 @@
+"""Document x term count matrices (e.g. user x word, subreddit x word), built while a text is converted to ids.
+
+The ids of every post are buffered as the id string that is written anyway, with the rows (user, subreddit) of the
+post in arrays. When buffer_size ids are buffered, the buffer is consolidated: the id strings are parsed at once with
+numpy, and a CSR matrix of the buffer (duplicates summed) is added to the matrices. So memory is the buffer plus the
+non zero counts, and there is no per token python work besides the join.
+"""
+from array import array
+
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+sparse = lazy_import('scipy.sparse')
+
+
+class TermMatrixBuilder(object):
+    """Builds one count matrix per kind of row (e.g. users and subreddits), all with n_cols columns.
+
+    Rows and terms are ids starting from 1 (the ids of text2ids), row id r is row r - 1 of the matrix and term id t
+    is column t - 1. So the user rows are the rows of the UxS matrix, and the columns the words of the vocabulary.
+    """
+
+    def __init__(self, n_rows, n_cols, buffer_size=10000000):
+        """
+        Args:
+            n_rows: tuple, number of rows of every matrix.
+            n_cols: number of terms.
+            buffer_size: number of ids to buffer before they are added to the matrices.
+        """
+        self.shapes = [(n, n_cols) for n in n_rows]
+        self.buffer_size = buffer_size
+        self.matrices = [None] * len(n_rows)
+        self._clear()
+
+    def _clear(self):
+        self.texts = []
+        self.rows = [array('i') for _ in self.shapes]
+        self.lengths = array('i')
+        self.buffered = 0
+
+    def add(self, rows, ids, length):
+        """Counts the terms of a post.
+
+        Args:
+            rows: tuple with the row id of the post in every matrix, e.g. (user id, subreddit id).
+            ids: string of the term ids of the post, separated by whitespace.
+            length: number of ids in ids.
+        """
+        self.texts.append(ids)
+        for r, row in zip(self.rows, rows):
+            r.append(row)
+        self.lengths.append(length)
+        self.buffered += length
+        if self.buffered >= self.buffer_size:
+            self.consolidate()
+
+    def consolidate(self):
+        if self.buffered == 0:
+            return
+        cols = np.fromstring(' '.join(self.texts), dtype=np.int64, sep=' ') - 1
+        lengths = np.frombuffer(self.lengths, dtype=np.int32)
+        values = np.ones(len(cols), dtype=np.int32)
+        for k, shape in enumerate(self.shapes):
+            rows = np.repeat(np.frombuffer(self.rows[k], dtype=np.int32).astype(np.int64) - 1, lengths)
+            m = sparse.csr_matrix((values, (rows, cols)), shape=shape)  # duplicates are summed
+            self.matrices[k] = m if self.matrices[k] is None else self.matrices[k] + m
+        self._clear()
+
+    def get_matrices(self):
+        """The CSR count matrices (int32)."""
+        self.consolidate()
+        return [sparse.csr_matrix(shape, dtype=np.int32) if m is None else m
+                for m, shape in zip(self.matrices, self.shapes)]
@@ -1,6 +1,8 @@
 import re
 
-from nltk.tokenize import sent_tokenize, word_tokenize
+from util.lazy import lazy_import
+
+nltk_tokenize = lazy_import('nltk.tokenize')
 
 not_existent_str = '___;;___;;__;;__1234567890234567823456789wertyui2345678dfghj45678sdcfvbnjkop;porywetxo3jpotcr;;;;^^'
 
@@ -51,7 +53,7 @@ def entry_to_tokens(entry):
 def tokenize_words(text):
     """Takes in a text string and returns a list of tokens (words). This keeps punctuation etc as separate tokens."""
     try:
-        words = word_tokenize(text)
+        words = nltk_tokenize.word_tokenize(text)
     except Exception as e:
         print 'Error in word_tokenize (from nltk)'
         print text
@@ -61,7 +63,7 @@ def tokenize_words(text):
 
 def tokenize_sentences(text):
     """A method that splits a text into multiple sentences. """
-    return sent_tokenize(text)
+    return nltk_tokenize.sent_tokenize(text)
 
 
 def tokenize_sent_words(text):
@@ -78,4 +80,5 @@ def replace_with_ids(tokens, vocab):
     Returns:
         List of word ids.
     """
-    return [vocab.get(t, vocab.get('<unk>')) for t in tokens]
+    unk = vocab.get('<unk>')
+    return [vocab.get(t, unk) for t in tokens]
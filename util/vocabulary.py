@@ -0,0 +1,136 @@
+"""Vocabulary of a text corpus: a sorted token array and the count of every token.
+
+The id of a token is its index in the sorted array + 1 (0 is never a word id), which are the same ids that
+set_to_dict(vocab_set, 1) gives. On disk it is a count arrays artifact (util.artifacts.save_count_arrays), so loading
+memory maps two arrays.
+"""
+import os
+
+from util.artifacts import save_count_arrays, load_count_arrays, count_arrays_exist
+from util.io import load_pickle
+from util.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+unk_token = '<unk>'
+special_tokens = ['<unk>', '<sent_end>', '<sent_start>']
+
+
+class Vocabulary(object):
+    """Token <-> id map over a sorted token array. Behaves like the word -> id dictionary it replaces (get, [], in,
+    len), and adds encode / decode of whole sentences with numpy arrays."""
+
+    def __init__(self, tokens, counts=None):
+        self.tokens = np.asarray(tokens)
+        self.counts = np.zeros(len(self.tokens), dtype=np.int64) if counts is None else np.asarray(counts)
+        self._index = None
+        self._string_index = None
+        self.unk_id = self.get(unk_token)
+
+    @classmethod
+    def from_counts(cls, token_counts, size, extra_tokens=special_tokens):
+        """Keeps the size - len(extra_tokens) most frequent tokens of a token -> count dictionary, plus extra_tokens."""
+        top = sorted(token_counts.iteritems(), key=lambda x: x[1], reverse=True)[:size - len(extra_tokens)]
+        counts = dict(top)
+        for t in extra_tokens:
+            counts.setdefault(t, 0)
+        tokens = sorted(counts)
+        return cls(np.array(tokens), np.array([counts[t] for t in tokens], dtype=np.int64))
+
+    @classmethod
+    def from_dict(cls, vocab):
+        """From a word -> id dictionary with ids 1..n in sorted word order (as made by set_to_dict(words, 1))."""
+        return cls(np.array(sorted(vocab, key=vocab.get)))
+
+    def save(self, filename):
+        save_count_arrays(filename, (self.tokens, self.counts))
+
+    @classmethod
+    def load(cls, filename):
+        arrays = load_count_arrays(filename)
+        return cls(arrays.keys, arrays.counts)
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = dict((t, i + 1) for i, t in enumerate(self.tokens.tolist()))
+        return self._index
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def __getitem__(self, token):
+        i = self.get(token)
+        if i is None:
+            raise KeyError(token)
+        return i
+
+    def get(self, token, default=None):
+        index = self._get_index()
+        i = index.get(token)
+        if i is None and isinstance(token, unicode):
+            i = index.get(token.encode('utf-8'))  # the tokens are utf-8 encoded
+        return default if i is None else i
+
+    def iteritems(self):
+        return self._get_index().iteritems()
+
+    def encode(self, tokens):
+        """Array (int32) of the ids of a list of tokens, <unk> for the unknown ones."""
+        get, unk = self._get_index().get, self.unk_id
+        ids = np.fromiter((get(t, unk) for t in tokens), dtype=np.int32, count=len(tokens))
+        if unk is not None:
+            for j in np.where(ids == unk)[0]:  # unicode tokens that are only in the vocabulary utf-8 encoded
+                if isinstance(tokens[j], unicode):
+                    ids[j] = get(tokens[j].encode('utf-8'), unk)
+        return ids
+
+    def encode_batch(self, sentences):
+        """Encodes a list of token lists at once (a binary search of all tokens in the sorted token array).
+
+        Returns:
+            (ids, offsets): the ids of sentence k are ids[offsets[k]:offsets[k + 1]].
+        """
+        lengths = [len(s) for s in sentences]
+        offsets = np.zeros(len(sentences) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        flat = [t.encode('utf-8') if isinstance(t, unicode) else t for s in sentences for t in s]
+        if len(flat) == 0:
+            return np.zeros(0, dtype=np.int32), offsets
+        flat = np.array(flat)
+        pos = np.searchsorted(self.tokens, flat)
+        pos[pos == len(self.tokens)] = 0
+        ids = np.where(self.tokens[pos] == flat, pos + 1, self.unk_id if self.unk_id is not None else 0)
+        return ids.astype(np.int32), offsets
+
+    def get_string_encoder(self):
+        """Function from a list of tokens to the list of their ids as strings (<unk> for the unknown ones), for
+        writing ids to text files. A dict lookup per token is faster than encode for short (sentence) lists."""
+        if self._string_index is None:
+            self._string_index = dict((t, str(i)) for t, i in self._get_index().iteritems())
+        get = self._string_index.get
+        unk = str(self.unk_id)
+
+        def miss(token):  # unicode tokens are in the vocabulary utf-8 encoded, ascii ones are found as they are
+            return get(token.encode('utf-8'), unk) if isinstance(token, unicode) else unk
+
+        def encode_strings(tokens):
+            return [get(t) or miss(t) for t in tokens]
+        return encode_strings
+
+    def decode(self, ids):
+        """Array of the tokens of an array of ids."""
+        return self.tokens[np.asarray(ids) - 1]
+
+
+def load_vocabulary(filename):
+    """Loads a Vocabulary, or an old pickled word -> id dictionary (as a Vocabulary)."""
+    if count_arrays_exist(filename):
+        return Vocabulary.load(filename)
+    return Vocabulary.from_dict(load_pickle(filename, False))
+
+
+def vocabulary_exists(filename):
+    return count_arrays_exist(filename) or (filename.endswith('.pkl') and os.path.isfile(filename))